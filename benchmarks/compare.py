@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+
+
+def main(args):
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.current, encoding="utf-8") as file:
+        current = json.load(file)
+
+    if baseline["vault"] != current["vault"]:
+        print("Warning: the results are from different vaults\n")
+
+    print(f"{'Phase':<36} {baseline['commit'] or 'baseline':>12} {current['commit'] or 'current':>12}   Change")
+    regressions = 0
+    for mode in ["dry", "write"]:
+        for phase, result in current[mode]["phases"].items():
+            before = baseline[mode]["phases"].get(phase)
+            if not before:
+                continue
+
+            change = result["seconds"] / before["seconds"] - 1 if before["seconds"] else 0.0
+            flag = ""
+            if change > args.threshold:
+                flag = "  <-- slower"
+                regressions += 1
+            print(f"{mode + ' ' + phase:<36} {before['seconds']:>11.3f}s {result['seconds']:>11.3f}s "
+                  f"{change:>+8.1%}{flag}")
+
+    if regressions:
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare two benchmark results, and fail on regressions")
+    parser.add_argument("baseline", help="JSON results of the earlier run")
+    parser.add_argument("current", help="JSON results of the later run")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="relative slowdown to count as a regression (default 0.1 = 10%%)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
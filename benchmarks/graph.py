@@ -0,0 +1,79 @@
+import argparse
+import os
+import os.path
+import random
+import sys
+import time
+
+import vault
+
+
+def main(args):
+    backends = [False, True] if katalorg.analytics.numpy is not None else [False]
+    if len(backends) == 1:
+        print("NumPy is not installed, measuring only pure Python", file=sys.stderr)
+
+    print(f"{'notes':>8} {'links':>9} {'backend':>7} {'graph':>8} {'components':>10} {'pagerank':>8} {'hits':>8}")
+    for notes in args.notes:
+        parameters = vault.VaultParameters(notes=notes, links=args.links, seed=args.seed)
+        collection = generate_collection(parameters)
+        start = time.perf_counter()
+        collection.find_backlinks()
+        graph_time = time.perf_counter() - start
+
+        for use_numpy in backends:
+            if not use_numpy and notes > args.python_limit:
+                continue
+            analytics = katalorg.GraphAnalytics(collection.graph, use_numpy)
+            times = [measure(analytics.find_components, args.repeat),
+                     measure(analytics.pagerank, args.repeat),
+                     measure(analytics.hits, args.repeat)]
+            print(f"{notes:>8} {analytics.get_link_count():>9} {'numpy' if use_numpy else 'python':>7} "
+                  f"{graph_time:>8.3f} " + " ".join(f"{t:>{w}.3f}" for (t, w) in zip(times, [10, 8, 8])),
+                  flush=True)
+
+
+def generate_collection(parameters: "vault.VaultParameters") -> "katalorg.NoteCollection":
+    """Notes with links like in a generated vault, but only in memory, to measure large graphs quickly"""
+
+    rng = random.Random(parameters.seed)
+    uris = [f"{20200000000000 + i}" for i in range(parameters.notes)]
+    collection = katalorg.NoteCollection()
+    collection.notes = {}
+    for uri in uris:
+        links = {vault.random_target(rng, parameters, uris) for _ in range(vault.poisson(rng, parameters.links))}
+        record = katalorg.NoteRecord(uri, f"Note {uri}", links, katalorg.fingerprint([]))
+        collection.notes[uri] = katalorg.Note(katalorg.NoteFile(f"{uri}.md"), record=record)
+    return collection
+
+
+def measure(function, repeat: int) -> float:
+    """Best time of several runs"""
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure how the link graph analytics scale with the number "
+                                                 "of notes, with NumPy and in pure Python")
+    parser.add_argument("-n", "--notes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="numbers of notes to measure")
+    parser.add_argument("--links", type=float, default=5.0, help="mean number of links per note")
+    parser.add_argument("--python-limit", type=int, default=100000, metavar="N",
+                        help="measure pure Python only up to this number of notes")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of runs to take the best of")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+    import katalorg
+    import katalorg.analytics
+
+    main(parse_args())
@@ -0,0 +1,67 @@
+import argparse
+import os
+import os.path
+import sys
+import timeit
+
+
+def main(args):
+    parser = katalorg.NoteMarkdownParser()
+    signature_parser = katalorg.NoteMarkdownParser(signatures=True)
+    rewriter = katalorg.IdRewriter({"20200101120000": "20210101120000", "Old Note": "20220101000000"})
+    functions = {
+        "scan": parser.scan,
+        "scan_bytes": lambda text: parser.scan_bytes(text.encode("utf-8")),
+        "scan with signature": signature_parser.scan,
+        "get_note_links": parser.get_note_links,
+        "remove_backlinks": parser.remove_backlinks,
+        "rewrite": rewriter.rewrite,
+    }
+
+    print(f"{'note':<24} {'function':<20} {'small':>9} {'large':>9} {'ratio':>6}")
+    slow = []
+    for name in sorted(os.listdir(args.directory)):
+        with open(os.path.join(args.directory, name), "r", encoding="utf-8", newline="") as file:
+            text = file.read()
+
+        # Repeat the note up to the sizes, where time quadratic in the length grows by their ratio squared
+        small = text * -(-args.size // len(text))
+        large = small * args.factor
+        for (function_name, function) in functions.items():
+            (small_time, large_time) = (measure(function, small, args.repeat), measure(function, large, args.repeat))
+            ratio = large_time / small_time
+            print(f"{name:<24} {function_name:<20} {small_time * 1e3:7.2f}ms {large_time * 1e3:7.2f}ms {ratio:6.1f}",
+                  flush=True)
+            if ratio > args.max_ratio:
+                slow.append(f"{function_name} on {name}")
+
+    if slow:
+        print(f"\nMore than {args.max_ratio} times slower on {args.factor} times longer notes: " + ", ".join(slow))
+        sys.exit(1)
+
+
+def measure(function, argument, repeat: int) -> float:
+    """Best time of several runs"""
+    return min(timeit.repeat(lambda: function(argument), number=1, repeat=repeat))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that parsing the pathological notes of the tests takes "
+                                                 "time linear in their length, and fail if not")
+    parser.add_argument("directory", nargs="?",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "tests", "testdata", "pathological"),
+                        help="directory of notes (default: the pathological notes of the tests)")
+    parser.add_argument("-s", "--size", type=int, default=20000, help="size of the small notes in characters")
+    parser.add_argument("-f", "--factor", type=int, default=4, help="how many times longer the large notes are")
+    parser.add_argument("--max-ratio", type=float, default=10.0,
+                        help="fail if the large notes take more than this many times longer")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of runs to take the best of")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+    import katalorg
+
+    main(parse_args())
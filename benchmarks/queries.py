@@ -0,0 +1,108 @@
+import argparse
+import os
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import vault
+
+
+def main(args):
+    parameters = vault.parameters_from_args(args)
+    directory = args.vault or tempfile.mkdtemp(prefix="katalorg-bench-")
+    try:
+        if not os.path.exists(directory) or not os.listdir(directory):
+            print(f"Generating {parameters.notes} notes in {directory}", file=sys.stderr)
+            vault.generate_vault(directory, parameters)
+
+        collection = katalorg.NoteCollection()
+        collection.import_files(directory, ".md", katalorg.NoteFactory(compact=True))
+        collection.find_backlinks()
+        collection.get_more_note_data()
+
+        address = args.address or os.path.join(directory, ".katalorg.sock")
+        server = katalorg.NoteQueryServer(katalorg.NoteQueryService(collection), address)
+        server.start()
+        try:
+            run_clients(server.get_address(), list(collection.notes.values()), args)
+        finally:
+            server.close()
+    finally:
+        if not args.vault:
+            shutil.rmtree(directory)
+
+
+def run_clients(address: str, notes: list, args) -> None:
+    # Key = query name, value = latencies in seconds, from all clients
+    latencies: dict[str, list[float]] = {}
+    lock = threading.Lock()
+
+    def client(seed: int):
+        rng = random.Random(seed)
+        measured: dict[str, list[float]] = {}
+        with katalorg.NoteQueryClient(address) as connection:
+            for _ in range(args.queries):
+                note = rng.choice(notes)
+                (name, arguments) = rng.choice([
+                    ("backlinks", {"uri": note.get_uri()}),
+                    ("links", {"uri": note.get_uri()}),
+                    ("note", {"uri": note.get_uri()}),
+                    ("title", {"title": note.get_title()}),
+                    ("search", {"prefix": note.get_title()[:6]}),
+                ])
+                start = time.perf_counter()
+                connection.request(name, **arguments)
+                measured.setdefault(name, []).append(time.perf_counter() - start)
+
+            # The large lists, once per client
+            for name in ["orphans", "broken_links"]:
+                start = time.perf_counter()
+                connection.request(name)
+                measured.setdefault(name, []).append(time.perf_counter() - start)
+
+        with lock:
+            for (name, values) in measured.items():
+                latencies.setdefault(name, []).extend(values)
+
+    threads = [threading.Thread(target=client, args=(args.seed + i,)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"Notes: {len(notes)}, clients: {args.clients}, queries: {total} in {seconds:.2f} s "
+          f"({total / seconds:.0f}/s)\n")
+    print(f"{'Query':<14}{'Count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for (name, values) in sorted(latencies.items()):
+        values.sort()
+        print(f"{name:<14}{len(values):>8}" + "".join(f"{percentile(values, p) * 1000:>10.3f}"
+                                                     for p in (0.5, 0.95, 0.99, 1.0)))
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure query latency of the query server under load")
+    parser.add_argument("--vault", help="directory with an existing vault, or where to generate and keep one")
+    parser.add_argument("--address", help="Unix socket path or [HOST:]PORT to serve on "
+                                          "(default: a socket in the vault)")
+    parser.add_argument("-c", "--clients", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("-q", "--queries", type=int, default=2000, help="number of queries per client")
+    vault.add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+    import katalorg
+
+    main(parse_args())
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import vault
+
+
+def main(args):
+    parameters = vault.parameters_from_args(args)
+    directory = args.vault or tempfile.mkdtemp(prefix="katalorg-bench-")
+    try:
+        if not os.path.exists(directory) or not os.listdir(directory):
+            print(f"Generating {parameters.notes} notes in {directory}", file=sys.stderr)
+            vault.generate_vault(directory, parameters)
+
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "vault": parameters.to_dict(),
+            "options": {"jobs": args.jobs, "read_jobs": args.read_jobs, "write_jobs": args.write_jobs,
+                        "compact": args.compact, "memory": args.memory},
+            # The write run changes the vault, so the dry run comes first
+            "dry": run_phases(directory, args, dry_run=True),
+            "write": run_phases(directory, args, dry_run=False),
+            "max_rss_bytes": max_rss(),
+        }
+    finally:
+        if not args.vault:
+            shutil.rmtree(directory)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+def run_phases(directory: str, args, dry_run: bool) -> dict:
+    noteFactory = katalorg.NoteFactory(katalorg.NoteMarkdownParser(), compact=args.compact)
+    collection = katalorg.NoteCollection()
+    writer = katalorg.NoteWriter(args.write_jobs, dry_run=dry_run)
+
+    phases = {}
+    phases["import_files"] = measure(
+        lambda: collection.import_files(directory, ".md", noteFactory, jobs=args.jobs, read_jobs=args.read_jobs),
+        args.memory)
+    phases["find_backlinks"] = measure(collection.find_backlinks, args.memory)
+    phases["get_more_note_data"] = measure(collection.get_more_note_data, args.memory)
+    phases["update_backlinks_sections"] = measure(lambda: collection.update_backlinks_sections(writer=writer),
+                                                  args.memory)
+    writer.close()
+
+    return {
+        "phases": phases,
+        "notes": len(collection.notes),
+        "notes_updated": writer.notes_updated,
+        "files_written": writer.files_written,
+        "bytes_written": writer.bytes_written,
+    }
+
+
+def measure(function, memory: bool) -> dict:
+    """Wall time of the function, and optionally the peak of memory allocated by Python during it"""
+
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    result = {"seconds": round(time.perf_counter() - start, 6)}
+    if memory:
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def max_rss() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time each phase of updating backlinks in a synthetic vault")
+    parser.add_argument("--vault", help="directory with an existing vault, or where to generate and keep one")
+    parser.add_argument("-o", "--output", help="file to write the JSON results to")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes to parse notes in")
+    parser.add_argument("--read-jobs", type=int, default=1, help="number of threads to read notes in")
+    parser.add_argument("--write-jobs", type=int, default=1, help="number of threads to write notes in")
+    parser.add_argument("--compact", action="store_true", default=False, help="keep only metadata of notes in memory")
+    parser.add_argument("--memory", action="store_true", default=False,
+                        help="measure peak memory of each phase (makes the phases slower)")
+    vault.add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+    import katalorg
+
+    main(parse_args())
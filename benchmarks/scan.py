@@ -0,0 +1,94 @@
+import argparse
+import os
+import os.path
+import random
+import re
+import sys
+import timeit
+
+
+def main(args):
+    random.seed(args.seed)
+    notes = [generate_note(args.size) for _ in range(args.notes)]
+    parser = katalorg.NoteMarkdownParser()
+    legacy = LegacyParser(parser)
+
+    for note in notes:
+        scan = parser.scan(note)
+        if (scan.title, scan.id, scan.links, scan.backlinks) != legacy.parse(note):
+            print("Scanner and legacy parser disagree")
+            sys.exit(1)
+
+    print(f"Notes: {args.notes} of about {args.size} characters\n")
+    legacy_time = measure(lambda: [legacy.parse(n) for n in notes], args.repeat)
+    scan_time = measure(lambda: [parser.scan(n) for n in notes], args.repeat)
+    print(f"Separate regexes: {legacy_time / len(notes) * 1e6:8.2f} µs/note")
+    print(f"Single scan:      {scan_time / len(notes) * 1e6:8.2f} µs/note")
+    print(f"Speedup:          {legacy_time / scan_time:8.2f}x")
+
+
+class LegacyParser:
+    """The parsing done per note before NoteMarkdownParser.scan, for comparison"""
+
+    def __init__(self, parser: "katalorg.NoteMarkdownParser"):
+        self.__parser = parser
+        self.__backlinks_section_pattern = re.compile(
+            r"\n[-*]{3,}\n+\*\*(?:Backlinks|Links to this note)\*\*(.+)\Z".replace(r"\n", katalorg.RegEx.NEWLINE),
+            re.DOTALL | re.IGNORECASE
+        )
+
+    def parse(self, text: str) -> tuple:
+        content = self.__backlinks_section_pattern.sub("", text)
+        match = self.__backlinks_section_pattern.search(text)
+        backlinks = re.findall(r"^[-*] (.*)$", match.group(1), re.MULTILINE) if match else []
+
+        return (
+            self.__parser.get_note_title(content),
+            self.__parser.get_note_id(content),
+            self.__parser.get_note_links(content),
+            backlinks
+        )
+
+
+def generate_note(size: int) -> str:
+    words = ["zettel", "note", "idea", "link", "the", "of", "and", "thought", "kasten", "paper"]
+    parts = [f"# {random.choice(words).title()} {random.choice(words)}\n\n{random_id()}\n\n"]
+    length = 0
+    while length < size:
+        if random.random() < 0.03:
+            part = f"[[{random_id()}]]"
+        elif random.random() < 0.1:
+            part = "\n"
+        else:
+            part = random.choice(words)
+        parts.append(part)
+        length += len(part) + 1
+
+    parts.append("\n\n-----------------\n**Links to this note**\n")
+    parts.extend(f"\n- [[{random_id()}]] {random.choice(words)}" for _ in range(random.randint(0, 10)))
+    return " ".join(parts)
+
+
+def random_id() -> str:
+    return str(random.randint(20000000000000, 20219999999999))
+
+
+def measure(function, repeat: int) -> float:
+    """Best time of several runs"""
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the note scanner with separate regexes")
+    parser.add_argument("-n", "--notes", type=int, default=2000, help="number of notes")
+    parser.add_argument("-s", "--size", type=int, default=2000, help="approximate note size in characters")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs to take the best of")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+    import katalorg
+
+    main(parse_args())
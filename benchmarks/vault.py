@@ -0,0 +1,173 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import os.path
+import random
+import sys
+
+
+class VaultParameters:
+    """Shape of a synthetic vault. The same parameters and seed always give the same vault."""
+
+    def __init__(self, notes: int = 1000, links: float = 5.0, id_ratio: float = 0.8, size: int = 1500,
+                 size_sigma: float = 1.0, backlinks_ratio: float = 0.5, broken_ratio: float = 0.02,
+                 directories: int = 10, seed: int = 1):
+        # Number of notes
+        self.notes = notes
+        # Mean number of outgoing links per note
+        self.links = links
+        # Fraction of notes that have an ID, and so of links that are to an ID rather than a file name
+        self.id_ratio = id_ratio
+        # Median note size in characters, and the spread of the log-normal size distribution
+        self.size = size
+        self.size_sigma = size_sigma
+        # Fraction of notes that already have a (possibly outdated) backlinks section
+        self.backlinks_ratio = backlinks_ratio
+        # Fraction of links to notes that don't exist
+        self.broken_ratio = broken_ratio
+        # Number of subdirectories to spread the notes over
+        self.directories = directories
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+WORDS = [
+    "zettel", "note", "idea", "link", "thought", "kasten", "paper", "memory", "index", "card", "reading",
+    "writing", "source", "argument", "question", "answer", "system", "network", "outline", "draft", "the",
+    "of", "and", "to", "a", "in", "is", "that", "for", "it", "as", "with", "on", "this", "by", "from",
+]
+
+
+def generate_vault(path: str, parameters: VaultParameters) -> None:
+    """Write a synthetic vault of Markdown notes to the (preferably empty) directory"""
+
+    rng = random.Random(parameters.seed)
+    start = datetime.datetime(2020, 1, 1)
+
+    # The URI of each note: an ID, or the file name for notes without ID
+    uris = []
+    has_id = []
+    for i in range(parameters.notes):
+        has_id.append(rng.random() < parameters.id_ratio)
+        if has_id[i]:
+            uris.append((start + datetime.timedelta(minutes=i)).strftime("%Y%m%d%H%M%S"))
+        else:
+            uris.append(f"Note {i} {rng.choice(WORDS)}")
+
+    for d in range(parameters.directories):
+        os.makedirs(os.path.join(path, f"dir{d:03}"), exist_ok=True)
+
+    for i in range(parameters.notes):
+        title = f"Note {i} {rng.choice(WORDS)} {rng.choice(WORDS)}"
+        if has_id[i]:
+            # Zettlr style, with ID in the file name
+            filename = f"{uris[i]} {title}.md"
+        else:
+            filename = f"{uris[i]}.md"
+
+        directory = os.path.join(path, f"dir{i % parameters.directories:03}") if parameters.directories else path
+        with open(os.path.join(directory, filename), "w", encoding="utf-8") as file:
+            file.write(generate_note(rng, parameters, title, uris))
+
+
+def generate_note(rng: random.Random, parameters: VaultParameters, title: str, uris: list[str]) -> str:
+    size = int(parameters.size * math.exp(rng.gauss(0, parameters.size_sigma)))
+    link_count = poisson(rng, parameters.links)
+    # Positions (in words) of the links
+    link_positions = set(rng.randrange(max(1, size // 6)) for _ in range(link_count))
+
+    parts = [f"# {title}\n\n"]
+    length = 0
+    position = 0
+    while length < size or link_positions:
+        if position in link_positions:
+            link_positions.discard(position)
+            part = f"[[{random_target(rng, parameters, uris)}]]"
+        elif rng.random() < 0.08:
+            part = "\n\n" if rng.random() < 0.3 else "\n"
+        else:
+            part = rng.choice(WORDS)
+        parts.append(part)
+        length += len(part) + 1
+        position += 1
+        if position > size:
+            # Some link positions were beyond the end
+            link_positions.clear()
+
+    text = " ".join(parts).rstrip() + "\n"
+
+    if rng.random() < parameters.backlinks_ratio:
+        text += "\n-----------------\n**Links to this note**\n"
+        for _ in range(poisson(rng, parameters.links)):
+            text += f"\n- [[{rng.choice(uris)}]] Some title"
+        text += "\n"
+
+    return text
+
+
+def random_target(rng: random.Random, parameters: VaultParameters, uris: list[str]) -> str:
+    if rng.random() < parameters.broken_ratio:
+        return f"Missing {rng.randrange(1000000)}"
+
+    # Some notes are linked to much more than others
+    index = int(len(uris) * (rng.paretovariate(1.2) - 1) / 10) % len(uris)
+    return uris[index]
+
+
+def poisson(rng: random.Random, mean: float) -> int:
+    """Knuth's algorithm, fine for small means"""
+
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = VaultParameters()
+    parser.add_argument("-n", "--notes", type=int, default=defaults.notes, help="number of notes")
+    parser.add_argument("--links", type=float, default=defaults.links, help="mean number of links per note")
+    parser.add_argument("--id-ratio", type=float, default=defaults.id_ratio,
+                        help="fraction of notes (and links) with ID, rather than file name")
+    parser.add_argument("--size", type=int, default=defaults.size, help="median note size in characters")
+    parser.add_argument("--size-sigma", type=float, default=defaults.size_sigma,
+                        help="spread of the log-normal note size distribution")
+    parser.add_argument("--backlinks-ratio", type=float, default=defaults.backlinks_ratio,
+                        help="fraction of notes with an existing backlinks section")
+    parser.add_argument("--broken-ratio", type=float, default=defaults.broken_ratio,
+                        help="fraction of links to missing notes")
+    parser.add_argument("--directories", type=int, default=defaults.directories, help="number of subdirectories")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="random seed")
+
+
+def parameters_from_args(args) -> VaultParameters:
+    return VaultParameters(args.notes, args.links, args.id_ratio, args.size, args.size_sigma,
+                           args.backlinks_ratio, args.broken_ratio, args.directories, args.seed)
+
+
+def main(args):
+    if os.path.exists(args.path) and os.listdir(args.path):
+        print(f"Directory is not empty: '{args.path}'")
+        sys.exit(1)
+
+    parameters = parameters_from_args(args)
+    generate_vault(args.path, parameters)
+    print(json.dumps(parameters.to_dict()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Zettelkasten vault")
+    parser.add_argument("path", help="directory to create the notes in")
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
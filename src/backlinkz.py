@@ -1,8 +1,13 @@
 import argparse
+import cProfile
+import contextlib
+import json
 import os
 import os.path
+import subprocess
 import sys
 from datetime import datetime
+from typing import Optional
 
 
 def main(args):
@@ -11,38 +16,327 @@ def main(args):
         print(f"No such directory: '{path}'")
         sys.exit(1)
 
-    parser = katalorg.NoteMarkdownParser()
-    def noteFactory(filename: str): return katalorg.Note(katalorg.NoteFile(filename), parser)
+    if (args.watch or args.serve) and args.dry_run:
+        print("Can't watch for changes in a dry run")
+        sys.exit(1)
 
-    print("# Backlinkz Report\n")
-    print(f"Path:        {path}")
-    print("Time:        " + datetime.now().strftime("%Y-%m-%d %H:%M"))
+    graph_format = args.graph_format or (katalorg.export_format_for(args.graph) if args.graph else None)
+    if args.graph and not graph_format:
+        print(f"Unknown graph format of '{args.graph}', use --graph-format")
+        sys.exit(1)
+
+    # Signatures are only computed when needed, since that takes several times longer than the rest of parsing
+    parser = katalorg.NoteMarkdownParser(signatures=args.related)
+    noteFactory = katalorg.NoteFactory(parser, compact=args.compact, mmap_size=args.mmap_size)
+
+    # Complete the backlinks sections of an interrupted run, before reading the notes
+    journal = katalorg.SpliceJournal.open_for(path) if not args.dry_run else None
+
+    index = None
+    if args.dry_run:
+        # A dry run writes no files, so only an existing index is used, and it is not changed
+        if not args.no_cache and not args.rebuild_index:
+            index = katalorg.NoteIndex.open_existing(path, signatures=args.related)
+    elif not args.no_cache:
+        index = katalorg.NoteIndex.open_for(path, args.rebuild_index, signatures=args.related)
+
+    report = {
+        "path": path,
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
 
-    collection = katalorg.NoteCollection()
-    collection.import_files(args.path, args.extension, noteFactory)
-    print(f"Notes found: {len(collection.notes)}")
+    ignore = katalorg.IgnorePatterns.for_directory(path, args.exclude)
+
+    # Start watching before importing, to not miss any changes in between
+    watcher = katalorg.NoteWatcher(path, args.extension, ignore=ignore) if args.watch or args.serve else None
+
+    changed_paths = get_changed_paths(args, path, ignore)
+    # Only the changed notes are read, and the others are as they were when the index was saved
+    targeted = changed_paths is not None and index is not None and index.get_note_count() > 0
+    if changed_paths is not None and not targeted:
+        print("No index of the notes yet, so all notes are read", file=sys.stderr)
+
+    stats = katalorg.CollectionStats(args.slowest) if args.stats else None
+    collection = katalorg.NoteCollection(stats)
+    if targeted:
+        collection.import_index(index, noteFactory)
+        index.mark_changed(changed_paths)
+        affected = collection.reload(changed_paths, noteFactory, print_error)
+        report["changed_notes"] = len(changed_paths)
+    else:
+        collection.import_files(path, args.extension, noteFactory, index, args.jobs, ignore, args.follow_symlinks,
+                                args.read_jobs)
+    report["notes_found"] = len(collection.notes)
     collection.find_backlinks()
     collection.get_more_note_data()
 
-    updated_backlinks = collection.update_backlinks_sections(args.overwrite)
-    print(f"\nUpdated backlinks in {updated_backlinks} files")
+    if args.suggest or args.fix:
+        suggestions = katalorg.suggest_links(collection, parser)
+        if args.suggest:
+            report["suggestions"] = {link: [{"uri": uri, "score": round(score, 2)} for (uri, score) in found]
+                                     for (link, found) in suggestions.items()}
+        if args.fix:
+            report["fixed_links"] = fix_links(collection, suggestions, args.fix_threshold, noteFactory, parser,
+                                              args.dry_run)
+
+    writer = katalorg.NoteWriter(args.write_jobs, args.fsync, args.dry_run, journal)
+    # Fixed links may affect any note
+    uris = affected if targeted and not report.get("fixed_links") else None
+    report["updated_backlinks"] = collection.update_backlinks_sections(args.overwrite, writer, uris)
+    writer.close()
+    if watcher:
+        # Written by ourselves, so not changes to read again
+        watcher.refresh(writer.written_paths)
+    report["files_written"] = writer.files_written
+    report["bytes_written"] = writer.bytes_written
+
+    if args.missing:
+        report["notes_without_id"] = [note.get_filename() for note in collection.notes_without_id]
+    if args.broken:
+        report["broken_links"] = collection.broken_links
+    if args.orphans:
+        report["orphans"] = [note.create_link_to() for note in collection.orphans]
+    if args.analytics:
+        with stats.phase("analytics") if stats else contextlib.nullcontext():
+            report["analytics"] = analyze_graph(collection.graph, args.top)
+    if args.related:
+        with stats.phase("find_related") if stats else contextlib.nullcontext():
+            related = katalorg.find_related_notes(collection, args.related_threshold)
+        report["related"] = [{"notes": [a.create_link_to(), b.create_link_to()], "similarity": round(similarity, 2)}
+                             for (a, b, similarity) in related[:args.top]]
+    if args.graph:
+        (nodes, edges) = export_graph(collection, args.graph, graph_format, args)
+        report["graph"] = {"file": args.graph, "format": graph_format, "nodes": nodes, "links": edges}
+    if stats:
+        report["stats"] = stats.to_dict()
+
+    if args.format == "json":
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report, args.dry_run)
+
+    if args.serve:
+        service = katalorg.NoteQueryService(collection)
+        server = katalorg.NoteQueryServer(service, args.serve)
+        server.start()
+        if args.format != "json":
+            print(f"\nServing queries on {server.get_address()}")
+        try:
+            watch(service, noteFactory, watcher, args.format, journal)
+        finally:
+            server.close()
+    elif watcher:
+        watch(collection, noteFactory, watcher, args.format, journal)
+
+    if index:
+        # After a dry run, the indexed backlinks would not match the files
+        if not args.dry_run:
+            index.save(collection.notes.values())
+        index.close()
+
+
+def get_changed_paths(args, path: str, ignore) -> Optional[list[str]]:
+    """The changed note files given with --changed, --changed-from-stdin or --since-git-rev,
+    or None to update all notes"""
+
+    if args.changed is None and not args.changed_from_stdin and not args.since_git_rev:
+        return None
+
+    paths = list(args.changed or [])
+    if args.changed_from_stdin:
+        paths.extend(line.rstrip("\r\n") for line in sys.stdin if line.strip())
+    if args.since_git_rev:
+        paths.extend(os.path.join(path, name) for name in git_changed_files(path, args.since_git_rev))
+
+    changed = set()
+    for changed_path in paths:
+        changed_path = os.path.abspath(changed_path)
+        relative_path = os.path.relpath(changed_path, path).replace(os.sep, "/")
+        if relative_path.startswith("../") or os.path.splitext(changed_path)[1] not in args.extension:
+            continue
+        if not ignore.ignores_file(relative_path):
+            changed.add(changed_path)
+    return sorted(changed)
+
+
+def git_changed_files(path: str, rev: str) -> list[str]:
+    """Files changed since the revision, including uncommitted and untracked files, relative to the path"""
+
+    def git(*arguments) -> list[str]:
+        try:
+            result = subprocess.run(["git", "-C", path, *arguments], capture_output=True, check=True,
+                                    encoding="utf-8")
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Can't list the files changed since {rev}: {getattr(e, 'stderr', None) or e}".rstrip())
+            sys.exit(1)
+        return result.stdout.split("\0")
+
+    files = git("diff", "--name-only", "--no-renames", "--relative", "-z", rev, "--") + \
+        git("ls-files", "--others", "--exclude-standard", "-z")
+    return [file for file in files if file]
+
+
+def print_error(path: str, error: Exception):
+    print(f"- Ignores {path}: {error}", file=sys.stderr)
+
 
-    if args.missing and collection.notes_without_id:
+def fix_links(collection, suggestions: dict, threshold: float, noteFactory, parser, dry_run: bool) -> dict:
+    fixes = katalorg.choose_fixes(suggestions, threshold)
+    if not fixes:
+        return {}
+
+    # Only the notes with the broken links have to be rewritten
+    rewriter = katalorg.IdRewriter(fixes, parser, links_only=True)
+    paths = sorted({note.get_path() for link in fixes for note in collection.backlinks.get(link, [])})
+    changed = [file.get_path() for (file, _) in rewriter.rewrite_files(map(katalorg.NoteFile, paths), dry_run)]
+
+    if changed and not dry_run:
+        # Read the rewritten notes again, and let the backlinks be updated as usual
+        collection.reload(changed, noteFactory)
+        collection.find_backlinks()
+        collection.get_more_note_data()
+    return fixes
+
+
+def export_graph(collection, filename: str, format: str, args) -> tuple[int, int]:
+    nodes = None
+    try:
+        if args.graph_from:
+            nodes = katalorg.find_neighbourhood(collection.graph, args.graph_from, args.graph_hops)
+    except KeyError:
+        print(f"No such note: '{args.graph_from}'", file=sys.stderr)
+        sys.exit(1)
+    if args.graph_directory:
+        in_directory = katalorg.find_directory_nodes(collection.graph,
+                                                     os.path.join(args.path, args.graph_directory))
+        nodes = in_directory if nodes is None else nodes & in_directory
+
+    with open(filename, "w", encoding="utf-8") as file:
+        return katalorg.export_graph(collection.graph, file, format, nodes)
+
+
+def analyze_graph(graph, top: int) -> dict:
+    analytics = katalorg.GraphAnalytics(graph)
+    components = analytics.find_components()
+    ranks = analytics.pagerank()
+    (hubs, authorities) = analytics.hits()
+
+    def links_to(indexes) -> list[str]:
+        return [graph.get_note(i).create_link_to() for i in indexes]
+
+    def top_notes(scores) -> list[dict]:
+        return [{"note": graph.get_note(i).create_link_to(), "score": round(score, 6)}
+                for (i, score) in katalorg.top_scores(scores, top) if score > 0]
+
+    return {
+        "components": len(components),
+        "largest_component": len(components[0]) if components else 0,
+        "isolated_notes": sum(1 for component in components if len(component) == 1),
+        # The other groups of notes that link to each other but not to the rest
+        "clusters": [links_to(component) for component in components[1:top + 1] if len(component) > 1],
+        "pagerank": top_notes(ranks),
+        "hubs": top_notes(hubs),
+        "authorities": top_notes(authorities),
+    }
+
+
+def print_report(report: dict, dry_run: bool = False):
+    print("# Backlinkz Report\n")
+    print(f"Path:        {report['path']}")
+    print(f"Time:        {report['time']}")
+    print(f"Notes found: {report['notes_found']}")
+    if "changed_notes" in report:
+        print(f"Changed:     {report['changed_notes']}")
+
+    print(f"\n{'Would update' if dry_run else 'Updated'} backlinks in {report['updated_backlinks']} files")
+    print(f"Wrote {report['files_written']} files, {report['bytes_written']} bytes")
+
+    if "graph" in report:
+        graph = report["graph"]
+        print(f"Exported {graph['nodes']} nodes and {graph['links']} links to {graph['file']}")
+
+    if report.get("notes_without_id"):
         print("\n## Notes Without ID\n")
-        for note in collection.notes_without_id:
-            print(f"- {note.get_filename()}")
+        for filename in report["notes_without_id"]:
+            print(f"- {filename}")
 
-    if args.broken and collection.broken_links:
+    if report.get("broken_links"):
         print("\n## Broken Links\n")
-        for link in collection.broken_links:
+        for link in report["broken_links"]:
             print(f"- {link}")
 
-    if args.orphans and collection.orphans:
+    if report.get("suggestions"):
+        print("\n## Suggestions for Broken Links\n")
+        for (link, found) in report["suggestions"].items():
+            candidates = ", ".join(f"{s['uri']} ({s['score']:.2f})" for s in found) or "no suggestion"
+            print(f"- {link}: {candidates}")
+
+    if report.get("fixed_links"):
+        print("\n## Fixed Links\n")
+        for (link, uri) in report["fixed_links"].items():
+            print(f"- {link} --> {uri}")
+
+    if report.get("orphans"):
         print("\n## Orphans\n")
-        for note in collection.orphans:
-            print(f"- {note.create_link_to()}")
+        for link in report["orphans"]:
+            print(f"- {link}")
+
+    if report.get("related"):
+        print("\n## Related Notes\n")
+        for pair in report["related"]:
+            print(f"- {pair['similarity']:.2f} {pair['notes'][0]} -- {pair['notes'][1]}")
+
+    if "analytics" in report:
+        analytics = report["analytics"]
+        print("\n## Connected Components\n")
+        print(f"Components:  {analytics['components']}")
+        print(f"Largest:     {analytics['largest_component']} notes")
+        print(f"Isolated:    {analytics['isolated_notes']} notes")
+        if analytics["clusters"]:
+            print("\n### Isolated Clusters\n")
+            for cluster in analytics["clusters"]:
+                print(f"- {len(cluster)} notes: {', '.join(cluster)}")
+        for (key, heading) in [("pagerank", "PageRank"), ("hubs", "Hubs"), ("authorities", "Authorities")]:
+            if analytics[key]:
+                print(f"\n## {heading}\n")
+                for item in analytics[key]:
+                    print(f"- {item['score']:.4f} {item['note']}")
+
+    if "stats" in report:
+        print("\n## Statistics\n")
+        for (phase, seconds) in report["stats"]["phases"].items():
+            print(f"- {phase}: {seconds:.3f} s")
+        print()
+        for (counter, value) in report["stats"]["counters"].items():
+            print(f"- {counter}: {value}")
+
+        if report["stats"]["slowest_notes"]:
+            print("\n### Slowest Notes to Parse\n")
+            for note in report["stats"]["slowest_notes"]:
+                print(f"- {note['seconds'] * 1000:.2f} ms {note['path']}")
+
+
+def watch(collection, noteFactory, watcher, format: str, journal):
+    if format != "json":
+        method = "inotify" if watcher.uses_inotify() else "polling"
+        print(f"\nWatching for changes ({method}), press Ctrl+C to stop\n")
 
-    # TODO: Generate PUML graph of links
+    try:
+        while True:
+            (changed, removed) = watcher.poll()
+            updated_notes = collection.update_files(changed, removed, noteFactory, print_error, journal)
+            watcher.refresh([note.get_path() for note in updated_notes])
+            if format == "json":
+                print(json.dumps({"time": datetime.now().isoformat(timespec="seconds"), "changed": sorted(changed),
+                                  "removed": sorted(removed), "updated": [n.get_path() for n in updated_notes]},
+                                 ensure_ascii=False), flush=True)
+            else:
+                print(datetime.now().strftime("%H:%M:%S") + f" {len(changed)} changed, {len(removed)} removed, "
+                      f"updated backlinks in {len(updated_notes)} files")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 def parse_args():
@@ -53,10 +347,71 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Add backlinks to wiki-linked notes")
     parser.add_argument("path", nargs="?", default=default_path)
     parser.add_argument("-o", "--overwrite", action="store_true", help="overwrite existing backlinks, even if the same")
-    parser.add_argument("-e", "--extension", default=".md", help="file extension of note files")
+    parser.add_argument("-n", "--dry-run", action="store_true", default=False,
+                        help="report which notes would be updated, without writing any files")
+    parser.add_argument("-e", "--extension", nargs="+", default=[".md"], help="file extension(s) of note files")
+    parser.add_argument("-x", "--exclude", action="append", default=[], metavar="PATTERN",
+                        help="ignore files and directories matching the pattern, in addition to those in "
+                             f"{katalorg.IgnorePatterns.FILENAME}")
+    parser.add_argument("--follow-symlinks", action="store_true", default=False,
+                        help="search directories behind symbolic links too (links to files are always followed)")
     parser.add_argument("--missing", action="store_true", default=False, help="print list of notes missing id")
     parser.add_argument("--broken", action="store_true", default=False, help="print list of broken links")
+    parser.add_argument("--suggest", action="store_true", default=False,
+                        help="print the notes most similar to each broken link")
+    parser.add_argument("--fix", action="store_true", default=False,
+                        help="replace broken links with the most similar note, if similar enough")
+    parser.add_argument("--fix-threshold", type=float, default=0.9, metavar="SCORE",
+                        help="least similarity (0-1) of a note to replace a broken link with, with --fix")
     parser.add_argument("--orphans", action="store_true", default=False, help="print list of orphans")
+    parser.add_argument("--analytics", action="store_true", default=False,
+                        help="report connected components, isolated clusters, PageRank, hubs and authorities "
+                             "of the notes")
+    parser.add_argument("--related", action="store_true", default=False,
+                        help="print pairs of notes with similar content that don't link to each other")
+    parser.add_argument("--related-threshold", type=float, default=0.5, metavar="SIMILARITY",
+                        help="least estimated similarity (0-1) of related notes, with --related")
+    parser.add_argument("--top", type=int, default=10, metavar="N",
+                        help="number of notes, clusters and related notes to list with --analytics and --related")
+    parser.add_argument("--graph", metavar="FILE",
+                        help="export the graph of links to the file, in the format given by its extension")
+    parser.add_argument("--graph-format", choices=list(katalorg.EXPORT_FORMATS), help="format of the graph file")
+    parser.add_argument("--graph-from", metavar="NOTE", help="export only the notes near the note with this id")
+    parser.add_argument("--graph-hops", type=int, default=1, metavar="N",
+                        help="number of links away from --graph-from to export (default 1)")
+    parser.add_argument("--graph-directory", metavar="DIR",
+                        help="export only the notes in this directory, relative to the path")
+    parser.add_argument("--format", choices=["markdown", "json"], default="markdown", help="format of the report")
+    parser.add_argument("--stats", action="store_true", default=False,
+                        help="report time and counters of each phase, and the slowest notes to parse")
+    parser.add_argument("--slowest", type=int, default=10, metavar="N",
+                        help="number of slowest notes to report with --stats")
+    parser.add_argument("--profile", metavar="FILE", help="profile the run with cProfile, and save it to the file")
+    parser.add_argument("--write-jobs", type=int, default=1, help="number of threads to write notes in")
+    parser.add_argument("--fsync", action="store_true", default=False, help="flush written notes to disk")
+    parser.add_argument("-w", "--watch", action="store_true", default=False,
+                        help="keep running, and update backlinks when notes change")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="keep running like --watch, and answer queries on a Unix socket path or [HOST:]PORT")
+    parser.add_argument("--compact", action="store_true", default=False,
+                        help="keep only metadata of notes in memory, to use less memory for large collections")
+    parser.add_argument("--mmap-size", type=int, metavar="BYTES",
+                        help="scan notes of at least this size in a memory map, without decoding all of the text "
+                             "(with --compact or --jobs)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes to parse notes in")
+    parser.add_argument("--read-jobs", type=int, default=1,
+                        help="number of threads to read notes in, which helps on network drives")
+    parser.add_argument("--changed", nargs="*", metavar="PATH",
+                        help="read only these notes, which have changed since the last run, and update only the "
+                             "notes they link or linked to (the other notes are taken from the index)")
+    parser.add_argument("--changed-from-stdin", action="store_true", default=False,
+                        help="like --changed, with the paths of the changed notes on standard input, one per line")
+    parser.add_argument("--since-git-rev", metavar="REV",
+                        help="like --changed, with the notes that git lists as changed since the revision")
+    parser.add_argument("--no-cache", action="store_true", default=False,
+                        help="read and parse all notes, without using or updating the index")
+    parser.add_argument("--rebuild-index", action="store_true", default=False,
+                        help="read and parse all notes, and replace the index")
     return parser.parse_args()
 
 
@@ -64,4 +419,8 @@ if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     import katalorg
 
-    main(parse_args())
+    args = parse_args()
+    if args.profile:
+        cProfile.run("main(args)", args.profile)
+    else:
+        main(args)
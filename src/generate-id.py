@@ -2,7 +2,6 @@ import argparse
 import datetime
 import os
 import os.path
-import random
 import sys
 
 
@@ -12,44 +11,21 @@ def main(args):
         print(f"No such directory: '{path}'")
         sys.exit(1)
 
-    parser = katalorg.NoteMarkdownParser()
-    def noteFactory(filename: str): return katalorg.Note(katalorg.NoteFile(filename), parser)
+    # Only use an existing index, this is no reason to create or update one
+    index = None if args.no_cache else katalorg.NoteIndex.open_existing(path)
 
-    collection = katalorg.NoteCollection()
-    collection.import_files(args.path, args.extension, noteFactory)
-
-    new_id = suggest_id_from_date(args.date)
-    while new_id in collection.notes:
-        new_id = suggest_id_from_date(args.date)
-
-    print(new_id)
-
-
-def suggest_id_from_date(date: str) -> str:
-    if len(date) == 4:
-        # Add month, day, hour, minute, second
-        return date + "0101" + random_number(23) + random_number(59) + random_number(59)
-    elif len(date) == 6:
-        # Add day, hour, minute, second
-        return date + "01" + random_number(23) + random_number(59) + random_number(59)
-    elif len(date) == 8:
-        # Add hour, minute, second
-        return date + random_number(23) + random_number(59) + random_number(59)
-    elif len(date) == 10:
-        # Add minute, second
-        return date + random_number(59) + random_number(59)
-    elif len(date) == 12:
-        # Add second
-        return date + random_number(59)
-    elif len(date) == 14:
-        # Replace seconds
-        return date + date[:12] + random_number(59)
-    else:
-        raise ValueError(f"Unknown date format: {date}")
+    existing_ids = katalorg.find_note_ids(path, args.extension, katalorg.NoteMarkdownParser(), index)
+    if index:
+        index.close()
 
+    try:
+        new_ids = katalorg.generate_ids(args.date, args.count, existing_ids)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
 
-def random_number(max: int, positions: int = 2) -> str:
-    return str(random.randint(0, max)).zfill(positions)
+    for new_id in new_ids:
+        print(new_id)
 
 
 def parse_args():
@@ -60,6 +36,9 @@ def parse_args():
                         "--date",
                         default=datetime.datetime.now().strftime("%Y%m%d%H%M"),
                         help="date or time stamp to embed in id")
+    parser.add_argument("-c", "--count", type=int, default=1, help="number of different ids to generate")
+    parser.add_argument("--no-cache", action="store_true", default=False,
+                        help="read all notes, without using the index of backlinkz.py")
     return parser.parse_args()
 
 
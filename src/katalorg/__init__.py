@@ -1,3 +1,63 @@
-from .zettel import *
+import importlib
+from typing import TYPE_CHECKING
+
+# The modules are imported when one of their names is first used, so that
+# quick commands don't have to import all of them
+__modules = {
+    "graph": ["LinkGraph", "BacklinksView"],
+    "analytics": ["GraphAnalytics", "top_scores"],
+    "export": ["GraphExporter", "PlantUmlExporter", "DotExporter", "GraphMLExporter", "JsonLinesExporter",
+               "EXPORT_FORMATS", "EXPORT_EXTENSIONS", "export_format_for", "export_graph", "find_neighbourhood",
+               "find_directory_nodes"],
+    "rewrite": ["IdRewriter"],
+    "stats": ["CollectionStats"],
+    "zettel": ["stricmp", "fingerprint", "RegEx", "NoteMarkdownParser", "NoteScan", "NoteRecord", "NoteFile", "Note",
+               "NoteFactory", "IgnorePatterns", "find_note_files", "find_note_ids", "NoteCollection",
+               "SpliceJournal", "NoteWriter"],
+    "index": ["NoteIndex"],
+    "watch": ["NoteWatcher", "Inotify"],
+    "serve": ["QueryError", "NoteQueryService", "NoteQueryServer", "parse_address", "NoteQueryClient"],
+    "suggest": ["TrigramIndex", "suggest_links", "find_typos", "choose_fixes"],
+    "shard": ["SHARD_VERSION", "ShardError", "ShardRecord", "write_shard", "read_shard", "get_updates_path",
+              "ShardReduction", "apply_shard_updates"],
+    "ids": ["get_id_prefix", "generate_ids", "time_to_offset", "offset_to_time"],
+    "rename": ["NoteRenamer", "suggest_id_from_date", "strip_date_from_title", "get_date_from_file_name"],
+    "related": ["SIGNATURE_SIZE", "SHINGLE_SIZE", "minhash", "estimate_similarity", "find_related_notes"],
+}
+
+# Key = name, value = module
+__exports = {name: module for (module, names) in __modules.items() for name in names}
+
+__all__ = list(__exports)
+
+
+def __getattr__(name: str):
+    if name not in __exports:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    value = getattr(importlib.import_module("." + __exports[name], __name__), name)
+    # Found directly the next time
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__exports))
+
+
+if TYPE_CHECKING:
+    from .graph import *
+    from .analytics import *
+    from .export import *
+    from .rewrite import *
+    from .stats import *
+    from .zettel import *
+    from .index import *
+    from .watch import *
+    from .serve import *
+    from .suggest import *
+    from .shard import *
+    from .ids import *
+    from .rename import *
+    from .related import *
 
 __version__ = '0.1.0'
@@ -0,0 +1,195 @@
+import heapq
+import itertools
+from typing import Optional, Sequence
+
+from .graph import LinkGraph
+
+try:
+    import numpy
+except ImportError:
+    # The same results are computed in pure Python, only slower
+    numpy = None
+
+
+class GraphAnalytics:
+    """Structure of the links between notes: weakly connected components, hubs and
+    authorities (HITS), and PageRank
+
+    Only links between notes count, not broken links. The links are taken from the
+    compressed sparse rows of the graph, as arrays of sources and targets. With NumPy,
+    each iteration is a few vectorized operations over those arrays, otherwise a loop
+    over the links. Scores are returned as lists, indexed like the notes of the graph."""
+
+    def __init__(self, graph: LinkGraph, use_numpy: Optional[bool] = None):
+        """Uses NumPy if it is installed, unless use_numpy is False"""
+
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ImportError("NumPy is not installed")
+        self.__use_numpy = use_numpy
+
+        count = self.__count = graph.get_note_count()
+        (out_offsets, out_targets, _, _) = graph.get_csr()
+        if use_numpy:
+            offsets = numpy.asarray(out_offsets, dtype=numpy.intp)
+            targets = numpy.asarray(out_targets, dtype=numpy.intp)
+            sources = numpy.repeat(numpy.arange(count), numpy.diff(offsets))
+            between_notes = targets < count
+            self.__sources = sources[between_notes]
+            self.__targets = targets[between_notes]
+            self.__out_degrees = numpy.bincount(self.__sources, minlength=count)
+        else:
+            links = [(source, target) for source in range(count)
+                     for target in out_targets[out_offsets[source]:out_offsets[source + 1]] if target < count]
+            self.__sources = [source for (source, _) in links]
+            self.__targets = [target for (_, target) in links]
+            self.__out_degrees = [0] * count
+            for source in self.__sources:
+                self.__out_degrees[source] += 1
+
+    def uses_numpy(self) -> bool:
+        return self.__use_numpy
+
+    def get_link_count(self) -> int:
+        """Number of links between notes"""
+        return len(self.__sources)
+
+    def find_components(self) -> list[list[int]]:
+        """The weakly connected components, as lists of note indexes, largest first
+
+        Notes that neither link to nor are linked from another note are components of their own."""
+
+        labels = self.__find_component_labels()
+        components: dict[int, list[int]] = {}
+        for (index, label) in enumerate(labels):
+            components.setdefault(label, []).append(index)
+        # Components of the same size in order of their first note
+        return sorted(components.values(), key=lambda component: (-len(component), component[0]))
+
+    def __find_component_labels(self) -> Sequence[int]:
+        """The smallest note index in the component of each note"""
+
+        if self.__use_numpy:
+            # Hook the larger of the roots at both ends of each link onto the smaller, and then
+            # jump pointers until each note points to its root, until no link joins two roots
+            parents = numpy.arange(self.__count)
+            (sources, targets) = (self.__sources, self.__targets)
+            while True:
+                (source_roots, target_roots) = (parents[sources], parents[targets])
+                joining = source_roots != target_roots
+                if not joining.any():
+                    return parents.tolist()
+                (source_roots, target_roots) = (source_roots[joining], target_roots[joining])
+                numpy.minimum.at(parents, numpy.maximum(source_roots, target_roots),
+                                 numpy.minimum(source_roots, target_roots))
+                while True:
+                    grandparents = parents[parents]
+                    if numpy.array_equal(grandparents, parents):
+                        break
+                    parents = grandparents
+
+        # Union-find, keeping the smallest index as the root
+        parents = list(range(self.__count))
+
+        def find(index: int) -> int:
+            root = index
+            while parents[root] != root:
+                root = parents[root]
+            while parents[index] != root:
+                (parents[index], index) = (root, parents[index])
+            return root
+
+        for (source, target) in zip(self.__sources, self.__targets):
+            (source_root, target_root) = (find(source), find(target))
+            if source_root != target_root:
+                parents[max(source_root, target_root)] = min(source_root, target_root)
+        return [find(index) for index in range(self.__count)]
+
+    def pagerank(self, damping: float = 0.85, tolerance: float = 1e-6, max_iterations: int = 100) -> list[float]:
+        """The PageRank of each note, summing to 1
+
+        The rank of notes without links to other notes is spread over all notes. Iterates
+        until the ranks change less than the tolerance per note, like NetworkX."""
+
+        count = self.__count
+        if count == 0:
+            return []
+        (sources, targets) = (self.__sources, self.__targets)
+
+        if self.__use_numpy:
+            ranks = numpy.full(count, 1.0 / count)
+            dangling = self.__out_degrees == 0
+            # Avoid dividing by zero, those notes have no links to share their rank over
+            out_degrees = numpy.maximum(self.__out_degrees, 1)
+            for _ in range(max_iterations):
+                shared = numpy.bincount(targets, weights=(ranks / out_degrees)[sources], minlength=count)
+                new_ranks = damping * shared + (damping * ranks[dangling].sum() + 1.0 - damping) / count
+                change = numpy.abs(new_ranks - ranks).sum()
+                ranks = new_ranks
+                if change < count * tolerance:
+                    break
+            return ranks.tolist()
+
+        ranks = [1.0 / count] * count
+        out_degrees = self.__out_degrees
+        for _ in range(max_iterations):
+            shares = [rank / degree if degree else 0.0 for (rank, degree) in zip(ranks, out_degrees)]
+            dangling = sum(rank for (rank, degree) in zip(ranks, out_degrees) if degree == 0)
+            new_ranks = [(damping * dangling + 1.0 - damping) / count] * count
+            for (source, target) in zip(sources, targets):
+                new_ranks[target] += damping * shares[source]
+            change = sum(abs(new - old) for (new, old) in zip(new_ranks, ranks))
+            ranks = new_ranks
+            if change < count * tolerance:
+                break
+        return ranks
+
+    def hits(self, tolerance: float = 1e-8, max_iterations: int = 100) -> tuple[list[float], list[float]]:
+        """The hub and authority scores of each note, each summing to 1
+
+        Good hubs link to many good authorities, and good authorities are linked from
+        many good hubs. Notes without links between them score 0."""
+
+        count = self.__count
+        if count == 0 or not self.get_link_count():
+            return ([0.0] * count, [0.0] * count)
+        (sources, targets) = (self.__sources, self.__targets)
+
+        if self.__use_numpy:
+            hubs = numpy.full(count, 1.0 / count)
+            for _ in range(max_iterations):
+                authorities = numpy.bincount(targets, weights=hubs[sources], minlength=count)
+                authorities /= authorities.sum()
+                new_hubs = numpy.bincount(sources, weights=authorities[targets], minlength=count)
+                new_hubs /= new_hubs.sum()
+                change = numpy.abs(new_hubs - hubs).sum()
+                hubs = new_hubs
+                if change < tolerance:
+                    break
+            return (hubs.tolist(), authorities.tolist())
+
+        hubs = [1.0 / count] * count
+        for _ in range(max_iterations):
+            authorities = [0.0] * count
+            for (source, target) in zip(sources, targets):
+                authorities[target] += hubs[source]
+            total = sum(authorities)
+            authorities = [authority / total for authority in authorities]
+
+            new_hubs = [0.0] * count
+            for (source, target) in zip(sources, targets):
+                new_hubs[source] += authorities[target]
+            total = sum(new_hubs)
+            new_hubs = [hub / total for hub in new_hubs]
+            change = sum(abs(new - old) for (new, old) in zip(new_hubs, hubs))
+            hubs = new_hubs
+            if change < tolerance:
+                break
+        return (hubs, authorities)
+
+
+def top_scores(scores: Sequence[float], count: int) -> list[tuple[int, float]]:
+    """The (index, score) of the highest scores, highest first, and by index when equal"""
+
+    return heapq.nlargest(count, zip(itertools.count(), scores), key=lambda item: item[1])
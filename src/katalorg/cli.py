@@ -0,0 +1,337 @@
+import argparse
+import collections
+import datetime
+import json
+import os
+import os.path
+import sys
+from typing import Callable, Optional
+
+# The rest of the package is imported by each command, when needed, to start quickly
+
+
+class Vault:
+    """The notes directory, scanned and parsed once when first needed, and shared by all commands"""
+
+    def __init__(self, args):
+        self.args = args
+        self.path = os.path.abspath(args.path)
+        self.__collection = None
+        self.__noteFactory = None
+        self.__index = None
+        self.__journal = None
+        # Whether the backlinks and other note data must be found again
+        self.__stale = True
+
+    def get_note_factory(self):
+        if self.__noteFactory is None:
+            from .zettel import NoteFactory
+            self.__noteFactory = NoteFactory(compact=self.args.compact, mmap_size=self.args.mmap_size)
+        return self.__noteFactory
+
+    def get_ignore_patterns(self):
+        from .zettel import IgnorePatterns
+        return IgnorePatterns.for_directory(self.path, self.args.exclude)
+
+    def get_journal(self):
+        """The journal for splicing backlinks sections, or None in a dry run"""
+
+        if self.__journal is None and not self.args.dry_run:
+            from .zettel import SpliceJournal
+            self.__journal = SpliceJournal.open_for(self.path)
+        return self.__journal
+
+    def get_index(self):
+        """The index of the notes, or None without one. In a dry run, only an existing index is read."""
+
+        if self.__index is None and not self.args.no_cache:
+            from .index import NoteIndex
+            if not self.args.dry_run:
+                self.__index = NoteIndex.open_for(self.path, self.args.rebuild_index)
+            elif not self.args.rebuild_index:
+                self.__index = NoteIndex.open_existing(self.path)
+        return self.__index
+
+    def has_collection(self) -> bool:
+        return self.__collection is not None
+
+    def get_collection(self):
+        """The notes, with their backlinks and other note data up to date"""
+
+        if self.__collection is None:
+            from .zettel import NoteCollection
+
+            # Complete the backlinks sections of an interrupted run, before reading the notes
+            self.get_journal()
+            self.__collection = NoteCollection()
+            self.__collection.import_files(self.path, self.args.extension, self.get_note_factory(), self.get_index(),
+                                           self.args.jobs, self.get_ignore_patterns(), self.args.follow_symlinks,
+                                           self.args.read_jobs)
+        if self.__stale:
+            self.__collection.find_backlinks()
+            self.__collection.get_more_note_data()
+            self.__stale = False
+        return self.__collection
+
+    def reload(self, paths: list[str]) -> None:
+        """Update the collection after notes were renamed or rewritten, instead of scanning again"""
+
+        if self.args.dry_run:
+            # The files are unchanged, so only key the notes by their new IDs
+            paths = []
+        self.__collection.reload(paths, self.get_note_factory())
+        self.__stale = True
+
+    def close(self) -> None:
+        if self.__index:
+            # After a dry run, the indexed backlinks would not match the files
+            if self.__collection and not self.args.dry_run:
+                self.__index.save(self.__collection.notes.values())
+            self.__index.close()
+        if self.__journal:
+            self.__journal.close()
+
+
+def generate_ids(vault: Vault, args) -> None:
+    from .ids import generate_ids
+
+    if vault.has_collection():
+        existing_ids = {note.get_id() for note in vault.get_collection().notes.values() if note.get_id()}
+    else:
+        from .index import NoteIndex
+        from .zettel import find_note_ids
+
+        # Only use an existing index, this is no reason to create or update one
+        index = None if vault.args.no_cache or vault.args.rebuild_index else NoteIndex.open_existing(vault.path)
+        existing_ids = find_note_ids(vault.path, vault.args.extension, index=index,
+                                     ignore=vault.get_ignore_patterns())
+        if index:
+            index.close()
+
+    try:
+        new_ids = generate_ids(args.date, args.count, existing_ids)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    for new_id in new_ids:
+        print(new_id)
+
+
+def rename_notes(vault: Vault, args) -> None:
+    from .rename import NoteRenamer
+    from .rewrite import IdRewriter
+    from .zettel import NoteFile
+
+    dry_run = vault.args.dry_run
+    collection = vault.get_collection()
+    renamer = NoteRenamer(args.index, dry_run)
+    renamer.rename(collection)
+    for file_name in renamer.skipped:
+        print(f"- Ignores file {file_name} without ID")
+    for (old_file_name, new_file_name) in renamer.renamed:
+        print(f"- {'Would rename' if dry_run else 'Renaming'} {old_file_name} --> {new_file_name}")
+
+    rewritten = []
+    if renamer.changed_ids:
+        # Replace the changed IDs in all notes, in one pass over them
+        replacements = dict(renamer.changed_ids)
+        rewriter = IdRewriter(replacements)
+        total: collections.Counter = collections.Counter()
+        files = (NoteFile(note.get_path()) for note in collection.notes.values())
+        for (file, counts) in rewriter.rewrite_files(files, dry_run):
+            rewritten.append(file.get_path())
+            total.update(counts)
+        if dry_run:
+            # The files still link to the old IDs, so change only the links in memory for the later commands
+            for note in collection.notes.values():
+                note.replace_links(replacements)
+        for (old_id, new_id) in renamer.changed_ids:
+            print(f"- {old_id} --> {new_id}: {total[old_id]} times")
+        print(f"{'Would replace' if dry_run else 'Replaced'} {sum(total.values())} IDs in {len(rewritten)} files")
+
+    vault.reload(rewritten)
+
+
+def update_backlinks(vault: Vault, args) -> None:
+    from .zettel import NoteWriter
+
+    collection = vault.get_collection()
+    writer = NoteWriter(args.write_jobs, args.fsync, vault.args.dry_run, vault.get_journal())
+    try:
+        updated = collection.update_backlinks_sections(args.overwrite, writer)
+    finally:
+        writer.close()
+    print(f"{'Would update' if vault.args.dry_run else 'Updated'} backlinks in {updated} files")
+    print(f"Wrote {writer.files_written} files, {writer.bytes_written} bytes")
+
+
+def print_report(vault: Vault, args) -> None:
+    collection = vault.get_collection()
+    report = {
+        "path": vault.path,
+        "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "notes": len(collection.notes),
+        "notes_without_id": [note.get_filename() for note in collection.notes_without_id],
+        "orphans": [note.create_link_to() for note in collection.orphans],
+        "broken_links": collection.broken_links,
+    }
+
+    if args.format == "json":
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print("# Katalorg Report\n")
+    print(f"Path:        {report['path']}")
+    print(f"Time:        {report['time']}")
+    print(f"Notes:       {report['notes']}")
+    print(f"Without ID:  {len(report['notes_without_id'])}")
+    print(f"Orphans:     {len(report['orphans'])}")
+    print(f"Broken:      {len(report['broken_links'])}")
+    for (key, heading, shown) in [("notes_without_id", "Notes Without ID", args.missing),
+                                  ("orphans", "Orphans", args.orphans),
+                                  ("broken_links", "Broken Links", args.broken)]:
+        if shown and report[key]:
+            print(f"\n## {heading}\n")
+            for item in report[key]:
+                print(f"- {item}")
+
+
+# Key = command, value = (function, help)
+COMMANDS: dict[str, tuple[Callable[[Vault, argparse.Namespace], None], str]] = {
+    "id": (generate_ids, "print new, unused note IDs"),
+    "rename": (rename_notes, "rename note files to their ID and title, and give notes new IDs from dates "
+                             "in their file names"),
+    "backlinks": (update_backlinks, "update the backlinks sections of all notes"),
+    "report": (print_report, "print the number of notes, orphans and broken links"),
+}
+
+
+def create_command_parser(command: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=f"katalorg {command}", description=COMMANDS[command][1])
+    if command == "id":
+        parser.add_argument("-d", "--date", default=datetime.datetime.now().strftime("%Y%m%d%H%M"),
+                            help="date or time stamp to embed in id")
+        parser.add_argument("-c", "--count", type=int, default=1, help="number of different ids to generate")
+    elif command == "rename":
+        parser.add_argument("-i", "--index", default="§", help="prefix for index files, not to be renamed")
+    elif command == "backlinks":
+        parser.add_argument("-o", "--overwrite", action="store_true",
+                            help="overwrite existing backlinks, even if the same")
+        parser.add_argument("--write-jobs", type=int, default=1, help="number of threads to write notes in")
+        parser.add_argument("--fsync", action="store_true", default=False, help="flush written notes to disk")
+    elif command == "report":
+        parser.add_argument("--missing", action="store_true", default=False, help="list notes missing id")
+        parser.add_argument("--broken", action="store_true", default=False, help="list broken links")
+        parser.add_argument("--orphans", action="store_true", default=False, help="list orphans")
+        parser.add_argument("--format", choices=["markdown", "json"], default="markdown",
+                            help="format of the report")
+    return parser
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="katalorg",
+        usage="katalorg [OPTIONS] COMMAND [COMMAND OPTIONS] [COMMAND [COMMAND OPTIONS] ...]",
+        description="Catalogue a Zettelkasten-like pile of notes. The commands are run in order, "
+                    "on notes that are scanned only once.",
+        epilog="commands: " + "; ".join(f"{name}: {help}" for (name, (_, help)) in COMMANDS.items()) +
+               ". See katalorg COMMAND -h for the options of each command.")
+    parser.add_argument("-C", "--path", default=os.getcwd(), help="notes directory (default: current directory)")
+    parser.add_argument("-n", "--dry-run", action="store_true", default=False,
+                        help="report what would be changed, without writing any files")
+    parser.add_argument("-e", "--extension", nargs="+", default=[".md"], help="file extension(s) of note files")
+    parser.add_argument("-x", "--exclude", action="append", default=[], metavar="PATTERN",
+                        help="ignore files and directories matching the pattern, in addition to those in "
+                             ".katalorgignore")
+    parser.add_argument("--follow-symlinks", action="store_true", default=False,
+                        help="search directories behind symbolic links too (links to files are always followed)")
+    parser.add_argument("--compact", action="store_true", default=False,
+                        help="keep only metadata of notes in memory, to use less memory for large collections")
+    parser.add_argument("--mmap-size", type=int, metavar="BYTES",
+                        help="scan notes of at least this size in a memory map (with --compact or --jobs)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes to parse notes in")
+    parser.add_argument("--read-jobs", type=int, default=1, help="number of threads to read notes in")
+    parser.add_argument("--no-cache", action="store_true", default=False,
+                        help="read and parse all notes, without using or updating the index")
+    parser.add_argument("--rebuild-index", action="store_true", default=False,
+                        help="read and parse all notes, and replace the index")
+    return parser
+
+
+def split_commands(argv: list[str]) -> tuple[list[str], list[tuple[str, list[str]]]]:
+    """The global arguments, and each command with its arguments
+
+    Each command name starts a new command, unless it is the value of an option, like
+    in --extension id. Options with several values end at a command name, like at the
+    next option."""
+
+    (global_args, commands) = ([], [])
+    (args, values) = (global_args, get_option_values(create_parser()))
+    # Number of values the last option still takes
+    remaining = 0
+    for arg in argv:
+        if remaining:
+            remaining -= 1
+        elif arg in COMMANDS:
+            (args, values) = ([], get_option_values(create_command_parser(arg)))
+            commands.append((arg, args))
+            continue
+        elif arg.startswith("-"):
+            remaining = count_values(arg, values)
+        args.append(arg)
+    return (global_args, commands)
+
+
+def get_option_values(parser: argparse.ArgumentParser) -> dict[str, int]:
+    """The number of values each option of the parser must be given. Key = option string."""
+
+    values = {}
+    for action in parser._actions:
+        if action.nargs is None or action.nargs == "+":
+            count = 1
+        else:
+            # Flags, and options with optional values
+            count = action.nargs if isinstance(action.nargs, int) else 0
+        for option in action.option_strings:
+            values[option] = count
+    return values
+
+
+def count_values(arg: str, values: dict[str, int]) -> int:
+    """The number of values an option argument takes from the arguments after it"""
+
+    if arg.startswith("--"):
+        if "=" in arg:
+            return 0
+        # Like argparse, an unambiguous prefix of an option is that option
+        options = [option for option in values if option.startswith(arg)]
+        return values[arg] if arg in values else values[options[0]] if len(options) == 1 else 0
+
+    # Short options may be combined, like -nC DIR, where only the last one takes the next argument
+    for (i, option) in enumerate(arg[1:], 2):
+        if values.get("-" + option):
+            return values["-" + option] if i == len(arg) else 0
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    (global_args, commands) = split_commands(sys.argv[1:] if argv is None else argv)
+    parser = create_parser()
+    args = parser.parse_args(global_args)
+    if not commands:
+        parser.error("no command given")
+    # Parse all commands before running any, to not stop halfway on a typo
+    steps = [(COMMANDS[command][0], create_command_parser(command).parse_args(command_args))
+             for (command, command_args) in commands]
+
+    if not os.path.exists(args.path):
+        print(f"No such directory: '{os.path.abspath(args.path)}'")
+        sys.exit(1)
+
+    vault = Vault(args)
+    try:
+        for (function, command_args) in steps:
+            function(vault, command_args)
+    finally:
+        vault.close()
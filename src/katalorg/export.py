@@ -0,0 +1,206 @@
+import abc
+import collections
+import json
+import os.path
+from typing import Iterable, Optional, TextIO
+from xml.sax.saxutils import escape
+
+from .graph import LinkGraph
+
+
+class GraphExporter(abc.ABC):
+    """Writes the nodes and edges of a link graph to a file, one at a time
+
+    Nodes are named by their index in the graph. Broken link targets are nodes
+    without a note, marked as missing. Subclasses must write both nodes and edges."""
+
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    def begin(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def node(self, index: int, uri: str, title: str, path: Optional[str]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def edge(self, source: int, target: int, source_uri: str, target_uri: str) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+class PlantUmlExporter(GraphExporter):
+    def begin(self) -> None:
+        self.file.write("@startuml\n")
+
+    def node(self, index: int, uri: str, title: str, path: Optional[str]) -> None:
+        stereotype = "" if path else " <<missing>>"
+        self.file.write(f"object \"{self.__quote(title)}\" as n{index}{stereotype}\n")
+
+    def edge(self, source: int, target: int, source_uri: str, target_uri: str) -> None:
+        self.file.write(f"n{source} --> n{target}\n")
+
+    def end(self) -> None:
+        self.file.write("@enduml\n")
+
+    @staticmethod
+    def __quote(s: str) -> str:
+        # PlantUML has no escape for double quotes in names
+        return s.replace("\"", "'")
+
+
+class DotExporter(GraphExporter):
+    def begin(self) -> None:
+        self.file.write("digraph notes {\n")
+
+    def node(self, index: int, uri: str, title: str, path: Optional[str]) -> None:
+        if path:
+            self.file.write(f"  n{index} [label={self.__quote(title)}, tooltip={self.__quote(path)}];\n")
+        else:
+            self.file.write(f"  n{index} [label={self.__quote(title)}, style=dashed];\n")
+
+    def edge(self, source: int, target: int, source_uri: str, target_uri: str) -> None:
+        self.file.write(f"  n{source} -> n{target};\n")
+
+    def end(self) -> None:
+        self.file.write("}\n")
+
+    @staticmethod
+    def __quote(s: str) -> str:
+        return "\"" + s.replace("\\", "\\\\").replace("\"", "\\\"") + "\""
+
+
+class GraphMLExporter(GraphExporter):
+    def begin(self) -> None:
+        self.file.write(
+            "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+            "<graphml xmlns=\"http://graphml.graphdrawing.org/xmlns\">\n"
+            "  <key id=\"uri\" for=\"node\" attr.name=\"uri\" attr.type=\"string\"/>\n"
+            "  <key id=\"title\" for=\"node\" attr.name=\"title\" attr.type=\"string\"/>\n"
+            "  <key id=\"path\" for=\"node\" attr.name=\"path\" attr.type=\"string\"/>\n"
+            "  <key id=\"missing\" for=\"node\" attr.name=\"missing\" attr.type=\"boolean\">"
+            "<default>false</default></key>\n"
+            "  <graph id=\"notes\" edgedefault=\"directed\">\n")
+
+    def node(self, index: int, uri: str, title: str, path: Optional[str]) -> None:
+        data = f"<data key=\"uri\">{escape(uri)}</data><data key=\"title\">{escape(title)}</data>"
+        if path:
+            data += f"<data key=\"path\">{escape(path)}</data>"
+        else:
+            data += "<data key=\"missing\">true</data>"
+        self.file.write(f"    <node id=\"n{index}\">{data}</node>\n")
+
+    def edge(self, source: int, target: int, source_uri: str, target_uri: str) -> None:
+        self.file.write(f"    <edge source=\"n{source}\" target=\"n{target}\"/>\n")
+
+    def end(self) -> None:
+        self.file.write("  </graph>\n</graphml>\n")
+
+
+class JsonLinesExporter(GraphExporter):
+    """One JSON object per line, with nodes and edges identified by URI"""
+
+    def node(self, index: int, uri: str, title: str, path: Optional[str]) -> None:
+        node = {"type": "node", "uri": uri, "title": title, "path": path}
+        self.file.write(json.dumps(node, ensure_ascii=False) + "\n")
+
+    def edge(self, source: int, target: int, source_uri: str, target_uri: str) -> None:
+        edge = {"type": "edge", "source": source_uri, "target": target_uri}
+        self.file.write(json.dumps(edge, ensure_ascii=False) + "\n")
+
+
+# Key = format name
+EXPORT_FORMATS: dict[str, type[GraphExporter]] = {
+    "puml": PlantUmlExporter,
+    "dot": DotExporter,
+    "graphml": GraphMLExporter,
+    "jsonl": JsonLinesExporter,
+}
+
+# Key = file extension, value = format name
+EXPORT_EXTENSIONS = {
+    ".puml": "puml",
+    ".plantuml": "puml",
+    ".dot": "dot",
+    ".gv": "dot",
+    ".graphml": "graphml",
+    ".jsonl": "jsonl",
+}
+
+
+def export_format_for(filename: str) -> Optional[str]:
+    """The export format of a file name, by its extension"""
+    return EXPORT_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def export_graph(graph: LinkGraph, file: TextIO, format: str = "puml",
+                 nodes: Optional[Iterable[int]] = None) -> tuple[int, int]:
+    """Write the graph, or the subgraph of the given nodes, to the file
+
+    Nodes and edges are written as they are visited, so memory use doesn't grow
+    with the size of the output. Returns the number of nodes and edges written."""
+
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}'")
+    exporter = EXPORT_FORMATS[format](file)
+
+    selected = None if nodes is None else set(nodes)
+    order: Iterable[int] = range(graph.get_node_count()) if selected is None else sorted(selected)
+
+    exporter.begin()
+    node_count = 0
+    for index in order:
+        note = graph.get_note(index)
+        if note is not None:
+            exporter.node(index, graph.get_uri(index), note.get_title(), note.get_path())
+        else:
+            exporter.node(index, graph.get_uri(index), graph.get_uri(index), None)
+        node_count += 1
+
+    edge_count = 0
+    for source in range(graph.get_note_count()) if selected is None else sorted(selected):
+        source_uri = graph.get_uri(source)
+        for target in graph.get_linked(source):
+            if selected is None or target in selected:
+                exporter.edge(source, target, source_uri, graph.get_uri(target))
+                edge_count += 1
+    exporter.end()
+
+    return (node_count, edge_count)
+
+
+def find_neighbourhood(graph: LinkGraph, uri: str, hops: int = 1) -> set[int]:
+    """Nodes at most a number of links away from a note, following links in both directions"""
+
+    start = graph.get_index(uri)
+    if start is None:
+        raise KeyError(uri)
+
+    found = {start}
+    queue = collections.deque([(start, 0)])
+    while queue:
+        (index, distance) = queue.popleft()
+        if distance >= hops:
+            continue
+        for neighbour in (*graph.get_linked(index), *graph.get_linking(index)):
+            if neighbour not in found:
+                found.add(neighbour)
+                queue.append((neighbour, distance + 1))
+
+    return found
+
+
+def find_directory_nodes(graph: LinkGraph, directory: str) -> set[int]:
+    """Notes in a directory or its subdirectories, and the broken links from them"""
+
+    prefix = os.path.join(os.path.abspath(directory), "")
+    found = set()
+    for index in range(graph.get_note_count()):
+        if os.path.abspath(graph.get_note(index).get_path()).startswith(prefix):  # type: ignore
+            found.add(index)
+            found.update(target for target in graph.get_linked(index) if target >= graph.get_note_count())
+
+    return found
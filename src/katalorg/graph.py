@@ -0,0 +1,135 @@
+import array
+import collections.abc
+import itertools
+from typing import TYPE_CHECKING, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .zettel import Note
+
+
+class LinkGraph:
+    """Compact graph of the links between notes
+
+    Each URI is interned to an integer index: the notes first, in collection order,
+    then the targets of broken links. Outgoing and incoming links are stored as
+    compressed sparse rows, i.e. offsets into flat arrays of indexes."""
+
+    def __init__(self, notes: dict[str, "Note"]):
+        self.__notes = list(notes.values())
+        self.__uris = list(notes.keys())
+        # Key = URI, value = index
+        self.__indexes = {uri: i for (i, uri) in enumerate(self.__uris)}
+
+        # Outgoing links of note i are out_targets[out_offsets[i]:out_offsets[i + 1]],
+        # and the notes linking to node i are collected in incoming[i]
+        (indexes, uris) = (self.__indexes, self.__uris)
+        out_offsets = [0]
+        out_targets: list[int] = []
+        incoming: list[list[int]] = [[] for _ in uris]
+        for (source, note) in enumerate(self.__notes):
+            for link in note.get_outgoing_links():
+                target = indexes.get(link)
+                if target is None:
+                    # Broken link
+                    target = indexes[link] = len(uris)
+                    uris.append(link)
+                    incoming.append([])
+                out_targets.append(target)
+                incoming[target].append(source)
+            out_offsets.append(len(out_targets))
+
+        self.__out_offsets = array.array("i", out_offsets)
+        self.__out_targets = array.array("i", out_targets)
+        self.__in_offsets = array.array("i", itertools.accumulate(map(len, incoming), initial=0))
+        self.__in_sources = array.array("i", itertools.chain.from_iterable(incoming))
+        self.__target_count = len(incoming) - incoming.count([])
+
+    def get_note_count(self) -> int:
+        return len(self.__notes)
+
+    def get_node_count(self) -> int:
+        """Number of notes and broken link targets"""
+        return len(self.__uris)
+
+    def get_link_count(self) -> int:
+        return len(self.__out_targets)
+
+    def get_target_count(self) -> int:
+        """Number of notes and broken link targets that are linked to"""
+        return self.__target_count
+
+    def get_index(self, uri: str) -> Optional[int]:
+        return self.__indexes.get(uri)
+
+    def get_uri(self, index: int) -> str:
+        return self.__uris[index]
+
+    def get_note(self, index: int) -> Optional["Note"]:
+        """Returns None for broken link targets"""
+        return self.__notes[index] if index < len(self.__notes) else None
+
+    def in_degree(self, index: int) -> int:
+        return self.__in_offsets[index + 1] - self.__in_offsets[index]
+
+    def out_degree(self, index: int) -> int:
+        if index >= len(self.__notes):
+            return 0
+        return self.__out_offsets[index + 1] - self.__out_offsets[index]
+
+    def get_linked(self, index: int) -> array.array:
+        """Indexes of the nodes the node links to"""
+        if index >= len(self.__notes):
+            return array.array("i")
+        return self.__out_targets[self.__out_offsets[index]:self.__out_offsets[index + 1]]
+
+    def get_linking(self, index: int) -> array.array:
+        """Indexes of the notes that link to the node"""
+        return self.__in_sources[self.__in_offsets[index]:self.__in_offsets[index + 1]]
+
+    def get_linking_notes(self, index: int) -> list["Note"]:
+        return [self.__notes[source] for source in self.get_linking(index)]
+
+    def get_csr(self) -> tuple[array.array, array.array, array.array, array.array]:
+        """The arrays of outgoing links (offsets, targets) and incoming links (offsets, sources)"""
+        return (self.__out_offsets, self.__out_targets, self.__in_offsets, self.__in_sources)
+
+    def find_unlinked_notes(self) -> list["Note"]:
+        """Notes that no other note links to"""
+
+        offsets = self.__in_offsets
+        return [note for (i, note) in enumerate(self.__notes) if offsets[i] == offsets[i + 1]]
+
+    def find_broken_links(self) -> list[str]:
+        """Links to notes that don't exist, once for each linking note"""
+
+        note_count = len(self.__notes)
+        return [self.__uris[target] for target in self.__out_targets if target >= note_count]
+
+    def backlinks(self) -> "BacklinksView":
+        return BacklinksView(self)
+
+
+class BacklinksView(collections.abc.Mapping):
+    """The linking notes by target URI, like the dict built by NoteCollection.find_backlinks
+
+    The lists are created from the graph when accessed, so changing them has no effect."""
+
+    def __init__(self, graph: LinkGraph):
+        self.__graph = graph
+
+    def __getitem__(self, uri: str) -> list["Note"]:
+        index = self.__graph.get_index(uri)
+        if index is None or self.__graph.in_degree(index) == 0:
+            raise KeyError(uri)
+        return self.__graph.get_linking_notes(index)
+
+    def __contains__(self, uri: object) -> bool:
+        index = self.__graph.get_index(uri)  # type: ignore
+        return index is not None and self.__graph.in_degree(index) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        graph = self.__graph
+        return (graph.get_uri(i) for i in range(graph.get_node_count()) if graph.in_degree(i) > 0)
+
+    def __len__(self) -> int:
+        return self.__graph.get_target_count()
@@ -0,0 +1,79 @@
+import random
+from typing import Optional
+
+
+def get_id_prefix(date: str) -> tuple[str, int]:
+    """The ID prefix for a date, and the number of digits of time after it"""
+
+    if len(date) == 4:
+        # Add month and day, then hour, minute, second
+        return (date + "0101", 6)
+    elif len(date) == 6:
+        # Add day, then hour, minute, second
+        return (date + "01", 6)
+    elif len(date) == 8:
+        # Add hour, minute, second
+        return (date, 6)
+    elif len(date) == 10:
+        # Add minute, second
+        return (date, 4)
+    elif len(date) == 12:
+        # Add second
+        return (date, 2)
+    elif len(date) == 14:
+        # Replace seconds
+        return (date[:12], 2)
+    else:
+        raise ValueError(f"Unknown date format: {date}")
+
+
+def generate_ids(date: str, count: int, existing_ids: set[str]) -> list[str]:
+    """Random IDs for the date, all different and not among the existing IDs
+
+    The IDs are picked at random from the free times after the date prefix, so
+    there is no need to retry on collisions."""
+
+    (prefix, digits) = get_id_prefix(date)
+    # Number of possible times: seconds in a minute, hour or day
+    span = {2: 60, 4: 60 * 60, 6: 24 * 60 * 60}[digits]
+
+    taken = sorted(set(
+        offset for offset in (time_to_offset(id[len(prefix):]) for id in existing_ids
+                              if len(id) == len(prefix) + digits and id.startswith(prefix))
+        if offset is not None
+    ))
+    if count > span - len(taken):
+        raise ValueError(f"Only {span - len(taken)} free IDs for the date {date}")
+
+    # Pick among the free times, then skip over the taken times to get the actual times
+    offsets = []
+    skipped = 0
+    for free_offset in sorted(random.sample(range(span - len(taken)), count)):
+        while skipped < len(taken) and taken[skipped] <= free_offset + skipped:
+            skipped += 1
+        offsets.append(free_offset + skipped)
+
+    ids = [prefix + offset_to_time(offset, digits) for offset in offsets]
+    random.shuffle(ids)
+    return ids
+
+
+def time_to_offset(time: str) -> Optional[int]:
+    """Seconds since the start of the day, hour or minute, of a time like HHMMSS, MMSS or SS"""
+
+    if not time.isdigit():
+        return None
+    parts = [int(time[i:i + 2]) for i in range(0, len(time), 2)]
+    if parts[-1] > 59 or (len(parts) > 1 and parts[-2] > 59) or (len(parts) > 2 and parts[-3] > 23):
+        return None
+
+    offset = 0
+    for part in parts:
+        offset = offset * 60 + part
+    return offset
+
+
+def offset_to_time(offset: int, digits: int) -> str:
+    (hours, rest) = divmod(offset, 3600)
+    (minutes, seconds) = divmod(rest, 60)
+    return f"{hours:02}{minutes:02}{seconds:02}"[-digits:]
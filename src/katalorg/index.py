@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import os.path
+import sqlite3
+import urllib.parse
+from typing import Iterable, Iterator, Optional
+
+from .zettel import Note, NoteRecord
+
+
+class NoteIndex:
+    """Persistent cache of parsed note metadata, stored in an SQLite database
+
+    Each note is keyed by its path, and considered unchanged if the modification
+    time and size are the same as when it was indexed. If only the modification
+    time differs, the content hash decides. MinHash signatures are stored too,
+    for the notes parsed with signatures."""
+
+    DEFAULT_FILENAME = ".katalorg-index.sqlite"
+
+    # Increase when the stored data or the parsing changes, to discard old indexes
+    VERSION = "3"
+
+    def __init__(self, path: str, rebuild: bool = False, signatures: bool = False, read_only: bool = False):
+        """With signatures, notes indexed without a signature are looked up as changed, to parse them again
+
+        Read only, the index must exist, and is left as it is: an index of another
+        version looks empty instead of being discarded, and can't be saved."""
+
+        self.__signatures = signatures
+        # Key = note path
+        self.__rows: dict[str, tuple] = {}
+        # File status seen during lookup, to avoid rereading unchanged notes when saving
+        self.__seen: dict[str, os.stat_result] = {}
+        # Notes read from the index without checking their files, which are not checked when saving either
+        self.__unchecked: set[str] = set()
+
+        if read_only:
+            self.__connection = sqlite3.connect(f"{NoteIndex.__file_uri(path)}?mode=ro", uri=True)
+            try:
+                version = self.__connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            except sqlite3.OperationalError:
+                # No meta table
+                version = None
+            if rebuild or not version or version[0] != NoteIndex.VERSION:
+                return
+        else:
+            self.__connection = sqlite3.connect(path)
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+            version = self.__connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if rebuild or not version or version[0] != NoteIndex.VERSION:
+                # The columns may have changed too
+                self.__connection.execute("DROP TABLE IF EXISTS notes")
+                self.__connection.execute("REPLACE INTO meta VALUES ('version', ?)", (NoteIndex.VERSION,))
+
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS notes ("
+                "path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, hash TEXT, "
+                "uri TEXT, title TEXT, links TEXT, backlinks TEXT, content_end INTEGER, signature BLOB)"
+            )
+            self.__connection.commit()
+
+        for row in self.__connection.execute("SELECT * FROM notes"):
+            self.__rows[row[0]] = row[1:]
+
+    @staticmethod
+    def open_for(directory: str, rebuild: bool = False, signatures: bool = False) -> "NoteIndex":
+        """Open (or create) the index in the root of a notes directory"""
+        return NoteIndex(os.path.join(directory, NoteIndex.DEFAULT_FILENAME), rebuild, signatures)
+
+    @staticmethod
+    def open_existing(directory: str, signatures: bool = False) -> Optional["NoteIndex"]:
+        """Open the index in the root of a notes directory read only, if there is one, see __init__"""
+
+        path = os.path.join(directory, NoteIndex.DEFAULT_FILENAME)
+        return NoteIndex(path, signatures=signatures, read_only=True) if os.path.exists(path) else None
+
+    def get_note_count(self) -> int:
+        return len(self.__rows)
+
+    def lookup(self, path: str) -> Optional[NoteRecord]:
+        """Return the cached record for the note file, if it hasn't changed since it was indexed"""
+
+        row = self.__rows.get(path)
+        if not row:
+            return None
+
+        (mtime, size, hash, uri, title, links, backlinks, content_end, signature) = row
+        if self.__signatures and signature is None:
+            return None
+
+        try:
+            stat = os.stat(path)
+            if stat.st_size != size:
+                return None
+
+            if stat.st_mtime_ns != mtime and NoteIndex.hash_file(path) != hash:
+                return None
+        except OSError:
+            # Removed since it was found, so read it as usual, or find that it's gone
+            return None
+
+        # If only touched, the new time is stored when saving
+        self.__seen[path] = stat
+        return NoteRecord(uri, title, set(json.loads(links)), backlinks, content_end, signature)
+
+    def records(self) -> Iterator[tuple[str, NoteRecord]]:
+        """The path and record of each indexed note, as they were when saved, without checking the files
+
+        Such notes are saved without checking their files too, unless their records have changed
+        or they are marked as changed."""
+
+        for (path, (mtime, size, hash, uri, title, links, backlinks, content_end, signature)) in self.__rows.items():
+            self.__unchecked.add(path)
+            yield (path, NoteRecord(uri, title, set(json.loads(links)), backlinks, content_end, signature))
+
+    def mark_changed(self, paths: Iterable[str]) -> None:
+        """Check the files when saving, since they have changed since they were looked up or read from the index"""
+
+        for path in paths:
+            self.__seen.pop(path, None)
+            self.__unchecked.discard(path)
+
+    def save(self, notes: Iterable[Note]) -> None:
+        """Store the records of all notes, and forget notes that no longer exist"""
+
+        paths = set()
+        for note in notes:
+            path = note.get_path()
+            paths.add(path)
+
+            record = note.get_record()
+            row = self.__rows.get(path)
+            if row and (path in self.__seen or path in self.__unchecked) and \
+                    row[3:] == (record.uri, record.title, NoteIndex.__dump_links(record.links),
+                                record.backlinks_fingerprint, record.content_end, record.signature):
+                # Cached and not rewritten
+                if path in self.__seen and row[0] != self.__seen[path].st_mtime_ns:
+                    self.__store(path, (self.__seen[path].st_mtime_ns,) + row[1:3], record)
+                continue
+
+            stat = os.stat(path)
+            self.__store(path, (stat.st_mtime_ns, stat.st_size, NoteIndex.hash_file(path)), record)
+
+        for path in [p for p in self.__rows if p not in paths]:
+            del self.__rows[path]
+            self.__connection.execute("DELETE FROM notes WHERE path = ?", (path,))
+
+        self.__connection.commit()
+
+    def __store(self, path: str, file_data: tuple, record: NoteRecord):
+        row = file_data[0:3] + (
+            record.uri, record.title, NoteIndex.__dump_links(record.links), record.backlinks_fingerprint,
+            record.content_end, record.signature
+        )
+        self.__rows[path] = row
+        self.__connection.execute("REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (path,) + row)
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    @staticmethod
+    def __file_uri(path: str) -> str:
+        """A file: URI for SQLite, like file:///C:/Notes/index.sqlite on Windows"""
+
+        uri_path = urllib.parse.quote(os.path.abspath(path).replace(os.sep, "/"), safe="/:")
+        return "file://" + ("" if uri_path.startswith("/") else "/") + uri_path
+
+    @staticmethod
+    def __dump_links(links: set[str]) -> str:
+        return json.dumps(sorted(links), ensure_ascii=False)
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        with open(path, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()
@@ -0,0 +1,83 @@
+import collections
+import concurrent.futures
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch(items: Iterable[T], size: int, cancel: Optional[threading.Event] = None) -> Iterator[T]:
+    """Iterate over the items in a background thread, at most size items ahead of the caller
+
+    Raises concurrent.futures.CancelledError if the cancel event is set."""
+
+    buffer: queue.Queue = queue.Queue(size)
+    stopped = threading.Event()
+    # Marks the end of the items, or an error
+    done = object()
+
+    def put(entry: tuple) -> bool:
+        # Give up when the caller has stopped iterating
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            if cancel and cancel.is_set():
+                raise concurrent.futures.CancelledError()
+            try:
+                (item, error) = buffer.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is done:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def map_bounded(function: Callable[[T], R], items: Iterable[T], jobs: int, size: Optional[int] = None,
+                cancel: Optional[threading.Event] = None) -> Iterator[R]:
+    """Like map, but the function is called in a pool of threads, with at most size items in progress
+
+    The results are yielded in the order of the items. Raises concurrent.futures.CancelledError
+    if the cancel event is set."""
+
+    size = size or jobs * 4
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        pending: collections.deque[concurrent.futures.Future] = collections.deque()
+        try:
+            for item in items:
+                if cancel and cancel.is_set():
+                    raise concurrent.futures.CancelledError()
+                pending.append(pool.submit(function, item))
+                if len(pending) >= size:
+                    yield pending.popleft().result()
+
+            while pending:
+                if cancel and cancel.is_set():
+                    raise concurrent.futures.CancelledError()
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,105 @@
+import array
+import re
+import zlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .zettel import Note, NoteCollection
+
+# Number of values in a signature, each 4 bytes
+SIGNATURE_SIZE = 64
+# Number of words in each shingle
+SHINGLE_SIZE = 3
+
+# Words in UTF-8 text, where any non-ASCII character counts as a letter
+__word_regex = re.compile(rb"(?:[0-9A-Za-z]|[\x80-\xff])+")
+# Hashes are 32 bits, of which the remainder chooses the bin and the quotient is the value
+__value_range = 2 ** 32 // SIGNATURE_SIZE
+
+
+def minhash(data: bytes) -> bytes:
+    """MinHash signature of lower case UTF-8 text, to estimate how similar it is to other texts
+
+    The text is split into shingles of SHINGLE_SIZE consecutive words, which are hashed
+    once each. Instead of the smallest hash of many hash functions, the signature is the
+    smallest hash in each of SIGNATURE_SIZE bins of one hash function ("one permutation
+    hashing"), which takes a fraction of the time. An empty bin takes the value of the
+    next bin that isn't, offset by the distance to it. Empty for fewer words than that."""
+
+    words = __word_regex.findall(data)
+    hashes = set(map(zlib.crc32, map(b" ".join, zip(*(words[i:] for i in range(SHINGLE_SIZE))))))
+    if not hashes:
+        return b""
+
+    empty = __value_range
+    bins = [empty] * SIGNATURE_SIZE
+    for hash in hashes:
+        (value, bin) = divmod(hash, SIGNATURE_SIZE)
+        if value < bins[bin]:
+            bins[bin] = value
+
+    if empty in bins:
+        signature = list(bins)
+        # Go backwards from the last bin that isn't empty, around to the bin after it
+        last = max(bin for bin in range(SIGNATURE_SIZE) if bins[bin] < empty)
+        next = last + SIGNATURE_SIZE
+        for position in range(next - 1, last, -1):
+            bin = position % SIGNATURE_SIZE
+            if bins[bin] < empty:
+                next = position
+            else:
+                signature[bin] = bins[next % SIGNATURE_SIZE] + (next - position) * __value_range
+        bins = signature
+    return array.array("I", bins).tobytes()
+
+
+def estimate_similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of the shingles of two texts, from their signatures"""
+
+    if not a or not b:
+        return 0.0
+    return sum(x == y for (x, y) in zip(memoryview(a).cast("I"), memoryview(b).cast("I"))) / SIGNATURE_SIZE
+
+
+def find_related_notes(collection: "NoteCollection", threshold: float = 0.5, bands: int = 16,
+                       max_bucket: int = 100) -> list[tuple["Note", "Note", float]]:
+    """Pairs of notes with similar content that don't link to each other, most similar first
+
+    Requires the notes to have signatures, see NoteMarkdownParser. Instead of comparing
+    all pairs of notes, the signatures are split into bands, and only notes that have
+    all values of some band in common are compared (locality-sensitive hashing). With
+    16 bands of 4 values, notes with a similarity of 0.5 are found with a probability
+    of 0.64, and notes with 0.7 with a probability of 0.99. Bands shared by more than
+    max_bucket notes, like those of a common template, are skipped, to not compare
+    them all with each other."""
+
+    if SIGNATURE_SIZE % bands:
+        raise ValueError(f"The number of bands must divide {SIGNATURE_SIZE}")
+    width = SIGNATURE_SIZE // bands * 4
+
+    notes = [note for note in collection.notes.values() if note.get_signature()]
+    # Key = band number and values, value = indexes of the notes with those values
+    buckets: dict[bytes, list[int]] = {}
+    for (i, note) in enumerate(notes):
+        signature = note.get_signature()
+        for band in range(bands):
+            key = band.to_bytes(1, "little") + signature[band * width:(band + 1) * width]
+            buckets.setdefault(key, []).append(i)
+
+    candidates = set()
+    for bucket in buckets.values():
+        if 1 < len(bucket) <= max_bucket:
+            candidates.update((a, b) for (n, a) in enumerate(bucket) for b in bucket[n + 1:])
+
+    related = []
+    for (a, b) in candidates:
+        (note_a, note_b) = (notes[a], notes[b])
+        if note_b.get_uri() in note_a.get_outgoing_links() or note_a.get_uri() in note_b.get_outgoing_links():
+            # Already linked
+            continue
+        similarity = estimate_similarity(note_a.get_signature(), note_b.get_signature())
+        if similarity >= threshold:
+            related.append((note_a, note_b, similarity))
+
+    related.sort(key=lambda pair: (-pair[2], pair[0].get_uri(), pair[1].get_uri()))
+    return related
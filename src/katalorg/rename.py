@@ -0,0 +1,95 @@
+import datetime
+import os.path
+import re
+from typing import Optional
+
+from .ids import generate_ids
+from .zettel import NoteCollection, NoteFile, NoteMarkdownParser
+
+
+class NoteRenamer:
+    """Renames note files to their ID and title, like "20201020093536 Some random thoughts.md"
+
+    A note with a date in its file name that its ID doesn't start with gets a new ID
+    on that date. Notes without ID, and index notes whose file names start with the
+    index prefix, are not renamed."""
+
+    def __init__(self, index_prefix: str = "§", dry_run: bool = False,
+                 parser: Optional[NoteMarkdownParser] = None):
+        """In a dry run, the notes are given their new IDs but no files are renamed"""
+
+        self.__index_prefix = index_prefix
+        self.__parser = parser or NoteMarkdownParser()
+        self.__dry_run = dry_run
+        # (old file name, new file name) of the renamed notes
+        self.renamed: list[tuple[str, str]] = []
+        # (old ID, new ID) of the notes given new IDs
+        self.changed_ids: list[tuple[str, str]] = []
+        # File names of the notes without ID
+        self.skipped: list[str] = []
+
+    def rename(self, collection: NoteCollection) -> None:
+        """Rename the notes of the collection. See NoteCollection.reload to key them by their new IDs."""
+
+        used_ids = set(collection.notes)
+        for note in collection.notes.values():
+            old_file_name = note.get_filename()
+            old_id = note.get_id()
+
+            # Don't rename index/outline notes
+            if old_file_name.startswith(self.__index_prefix):
+                continue
+
+            # Notes without ID have their file names as URIs
+            if not self.__parser.is_id(old_id):
+                self.skipped.append(old_file_name)
+                continue
+
+            title = strip_date_from_title(note.get_title())
+
+            date = get_date_from_file_name(old_file_name)
+            if date is not None and len(date) < 14 and not old_id.startswith(date):
+                # Date in file name is shorter than an ID and doesn't match ID
+                new_id = suggest_id_from_date(date, used_ids)
+                used_ids.add(new_id)
+                note.set_id(new_id)
+                self.changed_ids.append((old_id, new_id))
+
+            extension = os.path.splitext(old_file_name)[1]
+            new_file_name = NoteFile.escape_filename(f"{note.get_id()} {title}".strip()) + extension
+
+            if old_file_name != new_file_name:
+                self.renamed.append((old_file_name, new_file_name))
+                if not self.__dry_run:
+                    note.rename_file(new_file_name)
+
+
+def suggest_id_from_date(date: str, existing_ids: Optional[set[str]] = None) -> str:
+    """A random ID on the date, like 20201020 or 202010, that is not among the existing IDs"""
+
+    if len(date) == 4:
+        # Add month and day
+        date += "0101"
+    elif len(date) == 6:
+        # Add day
+        date += "01"
+
+    if len(date) != 8:
+        raise ValueError(f"Unknown date format: {date}")
+    # Raises ValueError for dates that don't exist
+    datetime.datetime.strptime(date, "%Y%m%d")
+
+    return generate_ids(date, 1, existing_ids or set())[0]
+
+
+def strip_date_from_title(title: str) -> str:
+    # Allow "x" in date strings
+    return re.sub(r"^[12]\d{3}[x\d]* ", "", title)
+
+
+def get_date_from_file_name(file_name: str) -> Optional[str]:
+    match = re.match(r"^([12]\d{3}\d*)[ x]", file_name)
+    if match:
+        return match.group(1)
+    else:
+        return None
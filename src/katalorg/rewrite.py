@@ -0,0 +1,55 @@
+import collections
+import re
+from typing import Iterable, Iterator, Mapping, Optional
+
+from .zettel import NoteFile, NoteMarkdownParser
+
+
+class IdRewriter:
+    """Replaces many note IDs at once, in one pass over each note
+
+    IDs are replaced wherever they occur as whole words, like in links and in the
+    note's own ID line. URIs that aren't IDs, like file names, are only replaced
+    in links. Each replacement is made once, so swapping two IDs works."""
+
+    def __init__(self, replacements: Mapping[str, str], parser: Optional[NoteMarkdownParser] = None,
+                 links_only: bool = False):
+        """With links_only, IDs are also only replaced in links"""
+
+        # Key = old URI, value = new URI
+        self.__replacements = {old: new for (old, new) in replacements.items() if old and old != new}
+        self.__parser = parser or NoteMarkdownParser()
+        self.__regex = re.compile(self.__parser.get_rewrite_regex_pattern(self.__replacements, links_only)) \
+            if self.__replacements else None
+
+    def rewrite(self, text: str) -> tuple[str, collections.Counter]:
+        """Returns the new text, and the number of replacements of each old URI"""
+
+        counts: collections.Counter = collections.Counter()
+        if not self.__regex:
+            return (text, counts)
+
+        def replace(match: re.Match) -> str:
+            # Only one of the groups is in the pattern, if all URIs are IDs or none is
+            groups = match.groupdict()
+            if groups.get("id"):
+                counts[groups["id"]] += 1
+                return self.__replacements[groups["id"]]
+            else:
+                counts[groups["uri"]] += 1
+                return self.__parser.create_link(self.__replacements[groups["uri"]])
+
+        return (self.__regex.sub(replace, text), counts)
+
+    def rewrite_files(self, files: Iterable[NoteFile], dry_run: bool = False,
+                      fsync: bool = False) -> Iterator[tuple[NoteFile, collections.Counter]]:
+        """Rewrite the files, and yield those with any replacements
+
+        Each file is replaced atomically. In a dry run, no files are written."""
+
+        for file in files:
+            (text, counts) = self.rewrite(file.read())
+            if counts:
+                if not dry_run:
+                    file.write(text, fsync)
+                yield (file, counts)
@@ -0,0 +1,323 @@
+import bisect
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+from typing import Any, Callable, Iterable, Optional, Union
+
+from .zettel import Note, NoteCollection, SpliceJournal
+
+
+class QueryError(Exception):
+    pass
+
+
+class NoteQueryService:
+    """Answers queries about a note collection, which can be updated in between
+
+    Queries and updates may come from different threads. The collection must
+    have had find_backlinks and get_more_note_data called."""
+
+    # Default number of notes returned by a search
+    SEARCH_LIMIT = 20
+    # Key = query argument, value = its type
+    ARGUMENT_TYPES = {"uri": str, "title": str, "prefix": str, "limit": int}
+
+    def __init__(self, collection: NoteCollection):
+        self.__collection = collection
+        self.__lock = threading.Lock()
+        # Sorted (casefolded title or ID, URI) for prefix search, built when first needed
+        self.__keys: Optional[list[tuple[str, str]]] = None
+        # Whether orphans and broken links must be found again
+        self.__stale = False
+
+        self.__queries: dict[str, Callable[..., Any]] = {
+            "ping": lambda: "pong",
+            "note": self.__note,
+            "backlinks": self.__backlinks,
+            "links": self.__links,
+            "title": self.__title,
+            "search": self.__search,
+            "orphans": self.__orphans,
+            "broken_links": self.__broken_links,
+            "stats": self.__stats,
+        }
+
+    def update_files(self, changed: Iterable[str], removed: Iterable[str], noteFactory: Callable[..., Note],
+                     on_error: Optional[Callable[[str, Exception], None]] = None,
+                     journal: Optional[SpliceJournal] = None) -> list[Note]:
+        """Update the collection and its backlinks sections, see NoteCollection.update_files"""
+
+        with self.__lock:
+            updated_notes = self.__collection.update_files(changed, removed, noteFactory, on_error, journal)
+            self.__keys = None
+            self.__stale = True
+        return updated_notes
+
+    def query(self, request: dict) -> dict:
+        """Answer a request, e.g. {"query": "backlinks", "uri": "20210104073402"}
+
+        The response has the result, or an error message. An "id" in the request
+        is returned in the response."""
+
+        response: dict[str, Any] = {"id": request["id"]} if "id" in request else {}
+        try:
+            name = request.get("query")
+            if name not in self.__queries:
+                raise QueryError(f"Unknown query '{name}'")
+            arguments = {key: value for (key, value) in request.items() if key not in ("query", "id")}
+            for (key, value) in arguments.items():
+                expected = NoteQueryService.ARGUMENT_TYPES.get(key)
+                # JSON booleans are ints in Python
+                if expected and (not isinstance(value, expected) or isinstance(value, bool)):
+                    raise QueryError(f"The {key} must be a {'string' if expected is str else 'number'}")
+            with self.__lock:
+                response["result"] = self.__queries[name](**arguments)
+        except TypeError as e:
+            response["error"] = f"Invalid arguments: {e}"
+        except QueryError as e:
+            response["error"] = str(e)
+        return response
+
+    def __note(self, uri: str) -> Optional[dict]:
+        note = self.__collection.notes.get(uri)
+        return NoteQueryService.__describe(note) if note else None
+
+    def __backlinks(self, uri: str) -> list[dict]:
+        return [NoteQueryService.__describe(note) for note in self.__collection.backlinks.get(uri, [])]
+
+    def __links(self, uri: str) -> list[dict]:
+        note = self.__collection.notes.get(uri)
+        if not note:
+            raise QueryError(f"No such note: '{uri}'")
+
+        links = []
+        for link in note.get_outgoing_links():
+            target = self.__collection.notes.get(link)
+            # Broken links have no title or path
+            links.append(NoteQueryService.__describe(target) if target else {"uri": link, "title": None, "path": None})
+        return links
+
+    def __title(self, title: str) -> list[dict]:
+        """Notes with exactly the title, ignoring case"""
+
+        key = title.casefold()
+        notes = self.__collection.notes
+        # The IDs are among the keys too
+        uris = dict.fromkeys(self.__find_keys(key, lambda k: k == key))
+        return [NoteQueryService.__describe(notes[uri]) for uri in uris if notes[uri].get_title().casefold() == key]
+
+    def __search(self, prefix: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+        """Notes whose title or ID starts with the prefix, ignoring case"""
+
+        if not isinstance(limit, int) or limit < 1:
+            raise QueryError("The limit must be a positive integer")
+
+        key = prefix.casefold()
+        found: dict[str, dict] = {}
+        for uri in self.__find_keys(key, lambda k: k.startswith(key)):
+            if uri not in found:
+                found[uri] = NoteQueryService.__describe(self.__collection.notes[uri])
+                if len(found) == limit:
+                    break
+        return list(found.values())
+
+    def __find_keys(self, start: str, matches: Callable[[str], bool]) -> Iterable[str]:
+        if self.__keys is None:
+            keys = []
+            for (uri, note) in self.__collection.notes.items():
+                keys.append((note.get_title().casefold(), uri))
+                if note.get_id():
+                    keys.append((note.get_id().casefold(), uri))
+            keys.sort()
+            self.__keys = keys
+
+        keys = self.__keys
+        for i in range(bisect.bisect_left(keys, (start, "")), len(keys)):
+            if not matches(keys[i][0]):
+                break
+            yield keys[i][1]
+
+    def __orphans(self) -> list[dict]:
+        self.__refresh()
+        return [NoteQueryService.__describe(note) for note in self.__collection.orphans]
+
+    def __broken_links(self) -> list[str]:
+        self.__refresh()
+        return self.__collection.broken_links
+
+    def __stats(self) -> dict:
+        self.__refresh()
+        collection = self.__collection
+        return {"notes": len(collection.notes), "orphans": len(collection.orphans),
+                "broken_links": len(collection.broken_links), "notes_without_id": len(collection.notes_without_id)}
+
+    def __refresh(self) -> None:
+        if self.__stale:
+            self.__collection.get_more_note_data()
+            self.__stale = False
+
+    @staticmethod
+    def __describe(note: Note) -> dict:
+        return {"uri": note.get_uri(), "title": note.get_title(), "path": note.get_path()}
+
+
+class NoteQueryServer:
+    """Serves a query service on a Unix domain socket or a localhost TCP port
+
+    The protocol is one JSON object per line, both ways: each request line gets
+    one response line. Clients may keep the connection open for many requests."""
+
+    def __init__(self, service: NoteQueryService, address: str):
+        """The address is a Unix socket path, or [HOST:]PORT for TCP (the host defaults to localhost)"""
+
+        (family, socket_address) = parse_address(address)
+        if family == socket.AF_INET:
+            self.__server: socketserver.BaseServer = _ThreadingTCPServer(socket_address, _QueryHandler)
+        else:
+            try:
+                status = os.lstat(socket_address)
+            except FileNotFoundError:
+                pass
+            else:
+                if not stat.S_ISSOCK(status.st_mode):
+                    raise FileExistsError(f"'{socket_address}' exists and is not a socket")
+                # Left from an earlier server, since a listening socket isn't removed when closed
+                os.remove(socket_address)
+            self.__server = _ThreadingUnixServer(socket_address, _QueryHandler)
+        self.__server.service = service  # type: ignore
+        self.__socket_path = socket_address if family != socket.AF_INET else None
+        self.__thread: Optional[threading.Thread] = None
+
+    def get_address(self) -> str:
+        """The address to connect to, with the actual port if the port was 0"""
+
+        if self.__socket_path:
+            return self.__socket_path
+        (host, port) = self.__server.server_address[:2]  # type: ignore
+        return f"{host}:{port}"
+
+    def start(self) -> None:
+        """Serve requests in a background thread"""
+
+        self.__thread = threading.Thread(target=self.__server.serve_forever, args=(0.1,), daemon=True)
+        self.__thread.start()
+
+    def serve_forever(self) -> None:
+        self.__server.serve_forever()
+
+    def close(self) -> None:
+        if self.__thread:
+            self.__server.shutdown()
+            self.__thread.join()
+        self.__server.server_close()
+        if self.__socket_path and os.path.exists(self.__socket_path):
+            os.remove(self.__socket_path)
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        service: NoteQueryService = self.server.service  # type: ignore
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("The request must be an object")
+                response = service.query(request)
+            except ValueError as e:
+                response = {"error": f"Invalid request: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _ThreadingUnixServer(socketserver.ThreadingUnixStreamServer):  # type: ignore
+        daemon_threads = True
+else:
+    _ThreadingUnixServer = None  # type: ignore
+
+
+def parse_address(address: str) -> tuple[int, Union[str, tuple[str, int]]]:
+    """The socket family and address of a Unix socket path or [HOST:]PORT"""
+
+    (host, _, port) = address.rpartition(":")
+    if port.isdigit() and os.sep not in address:
+        return (socket.AF_INET, (host or "127.0.0.1", int(port)))
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError(f"Unix sockets are not supported here, use [HOST:]PORT instead of '{address}'")
+    return (socket.AF_UNIX, address)
+
+
+class NoteQueryClient:
+    """Sends queries to a NoteQueryServer, over one connection"""
+
+    def __init__(self, address: str, timeout: Optional[float] = 10.0):
+        (family, socket_address) = parse_address(address)
+        self.__socket = socket.socket(family, socket.SOCK_STREAM)
+        self.__socket.settimeout(timeout)
+        self.__socket.connect(socket_address)
+        if family == socket.AF_INET:
+            # Requests are small, so don't wait to fill a packet
+            self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__reader = self.__socket.makefile("rb")
+
+    def __enter__(self) -> "NoteQueryClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.__reader.close()
+        self.__socket.close()
+
+    def request(self, query: str, **arguments) -> Any:
+        """Send a query and return its result. Raises QueryError if the server returns an error."""
+
+        request = dict(arguments, query=query)
+        self.__socket.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        line = self.__reader.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise QueryError(response["error"])
+        return response["result"]
+
+    def note(self, uri: str) -> Optional[dict]:
+        """The note's URI, title and path, or None if there is no such note"""
+        return self.request("note", uri=uri)
+
+    def backlinks(self, uri: str) -> list[dict]:
+        """The notes that link to the URI"""
+        return self.request("backlinks", uri=uri)
+
+    def links(self, uri: str) -> list[dict]:
+        """The notes the note links to. Broken links have no title and path."""
+        return self.request("links", uri=uri)
+
+    def title(self, title: str) -> list[dict]:
+        """The notes with the title, ignoring case"""
+        return self.request("title", title=title)
+
+    def search(self, prefix: str, limit: int = NoteQueryService.SEARCH_LIMIT) -> list[dict]:
+        """The notes whose title or ID starts with the prefix, ignoring case"""
+        return self.request("search", prefix=prefix, limit=limit)
+
+    def orphans(self) -> list[dict]:
+        return self.request("orphans")
+
+    def broken_links(self) -> list[str]:
+        return self.request("broken_links")
+
+    def stats(self) -> dict:
+        return self.request("stats")
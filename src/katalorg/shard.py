@@ -0,0 +1,178 @@
+import json
+import os
+import os.path
+from typing import Callable, Iterable, Iterator, Optional
+
+from .zettel import Note, NoteCollection, NoteWriter, fingerprint
+
+# Increase when the shard or update files change, to not mix files from different versions
+SHARD_VERSION = 1
+
+
+class ShardError(Exception):
+    pass
+
+
+class ShardRecord:
+    """What the reduce step needs to know about a note in a shard"""
+
+    __slots__ = ("uri", "title", "path", "has_id", "link", "links", "backlinks_fingerprint")
+
+    def __init__(self, uri: str, title: str, path: str, has_id: bool, link: str, links: list[str],
+                 backlinks_fingerprint: str):
+        self.uri = uri
+        self.title = title
+        # Relative to the root of the shard, with "/" separators
+        self.path = path
+        self.has_id = has_id
+        # How other notes link to this note in their backlinks sections
+        self.link = link
+        self.links = links
+        self.backlinks_fingerprint = backlinks_fingerprint
+
+    @staticmethod
+    def for_note(note: Note, root: str) -> "ShardRecord":
+        path = os.path.relpath(note.get_path(), root).replace(os.sep, "/")
+        return ShardRecord(note.get_uri(), note.get_title(), path, bool(note.get_id()), note.create_link_to(),
+                           list(note.get_outgoing_links()), note.get_record().backlinks_fingerprint)
+
+    def to_dict(self) -> dict:
+        return {"uri": self.uri, "title": self.title, "path": self.path, "id": self.has_id, "link": self.link,
+                "links": self.links, "backlinks": self.backlinks_fingerprint}
+
+    @staticmethod
+    def from_dict(d: dict) -> "ShardRecord":
+        return ShardRecord(d["uri"], d["title"], d["path"], d["id"], d["link"], d["links"], d["backlinks"])
+
+
+def write_shard(collection: NoteCollection, root: str, path: str) -> int:
+    """Map step: write the notes of a collection imported from root to a shard file
+
+    The file is JSON Lines: a header, then one record per note. Returns the number of notes."""
+
+    with open(path, "w", encoding="utf-8") as file:
+        _write_json_line(file, {"version": SHARD_VERSION, "kind": "shard", "root": os.path.abspath(root),
+                                "notes": len(collection.notes)})
+        for note in collection.notes.values():
+            _write_json_line(file, ShardRecord.for_note(note, root).to_dict())
+    return len(collection.notes)
+
+
+def read_shard(path: str) -> Iterator[ShardRecord]:
+    lines = _read_json_lines(path)
+    _read_header(path, lines, "shard")
+    for d in lines:
+        yield ShardRecord.from_dict(d)
+
+
+def get_updates_path(shard_path: str) -> str:
+    """Where the reduce step writes the updates for a shard, next to the shard file"""
+    return os.path.splitext(shard_path)[0] + ".updates"
+
+
+class ShardReduction:
+    """Reduce step: the backlinks of the notes in all shards
+
+    Notes are linked to in the order of the shards, and of the notes in each shard,
+    so a single shard gives the same backlinks sections as a NoteCollection.
+    A URI in more than one shard is a duplicate, and the backlinks sections of its
+    notes are left as they are, since links to it are ambiguous."""
+
+    def __init__(self, shard_paths: Iterable[str], overwrite: bool = False):
+        self.shard_paths = list(shard_paths)
+        # Key = URI, value = (shard path, note path) of each note with the URI
+        self.duplicates: dict[str, list[tuple[str, str]]] = {}
+        # Key = shard path, value = (note path, links to linking notes) of the notes to update
+        self.updates: dict[str, list[tuple[str, list[str]]]] = {}
+        self.note_count = 0
+        self.link_count = 0
+
+        shards = [list(read_shard(path)) for path in self.shard_paths]
+
+        # Key = URI, value = (shard number, record)
+        notes: dict[str, tuple[int, ShardRecord]] = {}
+        for (shard, records) in enumerate(shards):
+            for record in records:
+                if record.uri in notes:
+                    (first_shard, first) = notes[record.uri]
+                    locations = self.duplicates.setdefault(record.uri, [(self.shard_paths[first_shard], first.path)])
+                    locations.append((self.shard_paths[shard], record.path))
+                else:
+                    notes[record.uri] = (shard, record)
+        self.note_count = sum(map(len, shards))
+
+        # Key = target URI, value = links to the notes linking to it
+        backlinks: dict[str, list[str]] = {}
+        for records in shards:
+            for record in records:
+                for link in record.links:
+                    backlinks.setdefault(link, []).append(record.link)
+                self.link_count += len(record.links)
+
+        for (shard, records) in enumerate(shards):
+            updates = self.updates[self.shard_paths[shard]] = []
+            for record in records:
+                if record.uri in self.duplicates:
+                    continue
+                links = backlinks.get(record.uri)
+                if links is None and not record.has_id:
+                    # Like NoteCollection, only notes with an ID have their backlinks removed
+                    continue
+                links = links or []
+                if overwrite or record.backlinks_fingerprint != fingerprint(links):
+                    updates.append((record.path, links))
+
+    def write_updates(self, on_write: Optional[Callable[[str, int], None]] = None) -> None:
+        """Write the updates of each shard next to its shard file, see get_updates_path"""
+
+        for (shard_path, updates) in self.updates.items():
+            path = get_updates_path(shard_path)
+            with open(path, "w", encoding="utf-8") as file:
+                _write_json_line(file, {"version": SHARD_VERSION, "kind": "updates",
+                                        "shard": os.path.basename(shard_path), "notes": len(updates)})
+                for (note_path, links) in updates:
+                    _write_json_line(file, {"path": note_path, "backlinks": links})
+            if on_write:
+                on_write(path, len(updates))
+
+
+def apply_shard_updates(updates_path: str, root: str, noteFactory: Callable[..., Note],
+                        writer: Optional[NoteWriter] = None, overwrite: bool = False) -> int:
+    """Apply step: update the backlinks sections of the notes in a shard, from its updates file
+
+    Notes that have changed since the shard file was written are still updated, if their
+    backlinks sections differ from the new ones. Returns the number of notes updated."""
+
+    writer = writer or NoteWriter()
+    notes_updated = writer.notes_updated
+    lines = _read_json_lines(updates_path)
+    _read_header(updates_path, lines, "updates")
+    for d in lines:
+        path = os.path.join(root, *d["path"].split("/"))
+        if not os.path.exists(path):
+            # Removed since the shard file was written
+            continue
+        writer.set_backlinks(noteFactory(path), d["backlinks"], overwrite)
+    writer.wait()
+    return writer.notes_updated - notes_updated
+
+
+def _write_json_line(file, d: dict) -> None:
+    file.write(json.dumps(d, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def _read_json_lines(path: str) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_header(path: str, lines: Iterator[dict], kind: str) -> dict:
+    header = next(lines, None)
+    if not header or header.get("kind") != kind:
+        raise ShardError(f"Not a {kind} file: '{path}'")
+    if header.get("version") != SHARD_VERSION:
+        raise ShardError(f"The {kind} file '{path}' is of version {header.get('version')}, "
+                         f"not {SHARD_VERSION}")
+    return header
@@ -0,0 +1,70 @@
+import contextlib
+import heapq
+import time
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class CollectionStats:
+    """Wall time of each phase of processing a note collection, counters, and the slowest notes to parse"""
+
+    def __init__(self, slowest_count: int = 10):
+        # Key = phase name, value = seconds
+        self.phases: dict[str, float] = {}
+        # Key = counter name
+        self.counters: dict[str, int] = {}
+
+        self.__slowest_count = slowest_count
+        # Min-heap of (seconds, path), so the fastest of the slowest is replaced first
+        self.__slowest: list[tuple[float, str]] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure the time of a phase, added to any earlier time of the same phase"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def timed(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """Iterate over the items, measuring the time spent producing them as a phase"""
+
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def note_parsed(self, path: str, seconds: float, size: int) -> None:
+        self.count("notes_parsed")
+        self.count("bytes_read", size)
+        if len(self.__slowest) < self.__slowest_count:
+            heapq.heappush(self.__slowest, (seconds, path))
+        elif self.__slowest and seconds > self.__slowest[0][0]:
+            heapq.heapreplace(self.__slowest, (seconds, path))
+
+    def get_slowest_notes(self) -> list[tuple[str, float]]:
+        """The slowest notes to read and parse, slowest first"""
+        return [(path, seconds) for (seconds, path) in sorted(self.__slowest, reverse=True)]
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": {name: round(seconds, 6) for (name, seconds) in self.phases.items()},
+            "counters": dict(self.counters),
+            "slowest_notes": [{"path": path, "seconds": round(seconds, 6)}
+                              for (path, seconds) in self.get_slowest_notes()],
+        }
@@ -0,0 +1,197 @@
+import array
+import bisect
+import collections
+import itertools
+import math
+import re
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+
+from .zettel import NoteMarkdownParser
+
+if TYPE_CHECKING:
+    from .zettel import Note, NoteCollection
+
+
+class TrigramIndex:
+    """Finds the names most similar to a string, by the trigrams they have in common
+
+    Names are case folded and split into words, and each word is padded like in
+    PostgreSQL's pg_trgm, so "Note" has the trigrams "  n", " no", "not", "ote"
+    and "te ". The similarity is the number of shared trigrams divided by the
+    number of trigrams in either (the Jaccard index), from 0 to 1."""
+
+    __word_regex = re.compile(r"\w+")
+
+    def __init__(self):
+        # The names, their URIs and their number of trigrams, by entry number
+        self.__names: list[str] = []
+        self.__uris: list[str] = []
+        self.__sizes = array.array("i")
+        # Key = trigram, value = entry numbers
+        self.__postings: dict[str, array.array] = {}
+        # Key = case folded name, value = URIs
+        self.__exact: dict[str, list[str]] = {}
+
+    @staticmethod
+    def for_notes(notes: Iterable["Note"], skip: Optional[Callable[[str], bool]] = None) -> "TrigramIndex":
+        """Index the title, file name and URI of each note, except the names that skip returns True for"""
+
+        index = TrigramIndex()
+        for note in notes:
+            uri = note.get_uri()
+            for name in {uri, note.get_title(), note.get_filename_without_extension()}:
+                if not (skip and skip(name)):
+                    index.add(name, uri)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def add(self, name: str, uri: str) -> None:
+        trigrams = TrigramIndex.get_trigrams(name)
+        if not trigrams:
+            return
+
+        entry = len(self.__names)
+        self.__names.append(name)
+        self.__uris.append(uri)
+        self.__sizes.append(len(trigrams))
+        for trigram in trigrams:
+            postings = self.__postings.get(trigram)
+            if postings is None:
+                postings = self.__postings[trigram] = array.array("i")
+            postings.append(entry)
+        self.__exact.setdefault(name.casefold(), []).append(uri)
+
+    def search(self, text: str, limit: int = 3, min_score: float = 0.3) -> list[tuple[str, float]]:
+        """The URIs of the names most similar to the text, with their similarity, best first
+
+        Names that are equal to the text when case folded always come first, with
+        similarity 1. Each URI is returned once, with its most similar name."""
+
+        exact = self.__exact.get(text.casefold(), [])
+        found: dict[str, float] = {uri: 1.0 for uri in exact}
+        trigrams = TrigramIndex.get_trigrams(text)
+        if trigrams:
+            for (entry, score) in self.__find_similar(trigrams, min_score):
+                uri = self.__uris[entry]
+                if score > found.get(uri, 0.0):
+                    found[uri] = score
+
+        # Best first, with the case folded matches before other names with all trigrams in common
+        ranked = sorted(found.items(), key=lambda item: (-item[1], item[0] not in exact, item[0]))
+        return ranked[:limit]
+
+    def __find_similar(self, trigrams: set[str], min_score: float) -> Iterable[tuple[int, float]]:
+        size = len(trigrams)
+        # A name with min_score in common shares at least this many trigrams
+        needed = max(1, math.ceil(min_score * size))
+
+        # Count the shared trigrams of the rarer ones, and only look up the most common ones for the names
+        # that have enough of the rarer ones. Any such name has at least one of the (size - needed + 1) rarest.
+        by_frequency = sorted(trigrams, key=lambda t: len(self.__postings.get(t, ())))
+        scanned = size - needed + 1
+        while scanned < size and len(self.__postings.get(by_frequency[scanned], ())) <= self.__common_size():
+            scanned += 1
+        common_trigrams = by_frequency[scanned:]
+
+        counts = collections.Counter(itertools.chain.from_iterable(
+            self.__postings.get(t, ()) for t in by_frequency[:scanned]))
+        for (entry, count) in counts.items():
+            if count + len(common_trigrams) < needed:
+                continue
+            # The similarity is at most the ratio of the sizes
+            entry_size = self.__sizes[entry]
+            if min(size, entry_size) < min_score * max(size, entry_size):
+                continue
+            for trigram in common_trigrams:
+                postings = self.__postings[trigram]
+                i = bisect.bisect_left(postings, entry)
+                if i < len(postings) and postings[i] == entry:
+                    count += 1
+            score = count / (size + entry_size - count)
+            if score >= min_score:
+                yield (entry, score)
+
+    def __common_size(self) -> int:
+        # Trigrams in more names than this are looked up rather than counted
+        return max(1000, len(self.__names) // 100)
+
+    @staticmethod
+    def get_trigrams(text: str) -> set[str]:
+        trigrams = set()
+        for word in TrigramIndex.__word_regex.findall(text.casefold()):
+            padded = "  " + word + " "
+            trigrams.update({padded[i:i + 3] for i in range(len(padded) - 2)})
+        return trigrams
+
+    @staticmethod
+    def similarity(a: str, b: str) -> float:
+        (a_trigrams, b_trigrams) = (TrigramIndex.get_trigrams(a), TrigramIndex.get_trigrams(b))
+        if not a_trigrams and not b_trigrams:
+            return 1.0 if a.casefold() == b.casefold() else 0.0
+        return len(a_trigrams & b_trigrams) / len(a_trigrams | b_trigrams)
+
+
+def suggest_links(collection: "NoteCollection", parser: Optional["NoteMarkdownParser"] = None, limit: int = 3,
+                  min_score: float = 0.3) -> dict[str, list[tuple[str, float]]]:
+    """The URIs most similar to each broken link, with their similarity, best first
+
+    IDs all have many trigrams in common, so a broken link that is an ID is only
+    compared with the IDs that are one typo away from it. Requires get_more_note_data
+    to have been called.
+
+    The trigram index is built here from the notes in memory, not while importing
+    them, since it is only needed for broken links that aren't IDs, and the notes
+    may still be renamed or reloaded after the import."""
+
+    parser = parser or NoteMarkdownParser()
+    # Built when first needed
+    index: Optional[TrigramIndex] = None
+    ids = [uri for uri in collection.notes if parser.is_id(uri)]
+    alphabet = set("".join(ids))
+
+    suggestions = {}
+    for link in sorted(set(collection.broken_links)):
+        if parser.is_id(link):
+            found = [(uri, TrigramIndex.similarity(link, uri)) for uri in find_typos(link, alphabet)
+                     if uri in collection.notes]
+            suggestions[link] = sorted(found, key=lambda item: (-item[1], item[0]))[:limit]
+        else:
+            if index is None:
+                index = TrigramIndex.for_notes(collection.notes.values(), skip=parser.is_id)
+            suggestions[link] = index.search(link, limit, min_score)
+    return suggestions
+
+
+def find_typos(text: str, alphabet: Iterable[str]) -> set[str]:
+    """All strings one typo away: one character replaced, added or removed, or two swapped"""
+
+    found = set()
+    for i in range(len(text) + 1):
+        (before, after) = (text[:i], text[i:])
+        for c in alphabet:
+            found.add(before + c + after)
+            if after:
+                found.add(before + c + after[1:])
+        if after:
+            found.add(before + after[1:])
+        if len(after) > 1:
+            found.add(before + after[1] + after[0] + after[2:])
+    found.discard(text)
+    return found
+
+
+def choose_fixes(suggestions: dict[str, list[tuple[str, float]]], min_score: float) -> dict[str, str]:
+    """The URI to replace each broken link with, if the best suggestion is similar enough and
+    clearly better than the next one. Key = broken link, value = URI."""
+
+    fixes = {}
+    for (link, candidates) in suggestions.items():
+        if not candidates or candidates[0][1] < min_score:
+            continue
+        if len(candidates) > 1 and candidates[1][1] == candidates[0][1]:
+            # Ambiguous
+            continue
+        fixes[link] = candidates[0][0]
+    return fixes
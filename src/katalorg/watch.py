@@ -0,0 +1,251 @@
+import ctypes
+import ctypes.util
+import os
+import os.path
+import select
+import stat
+import struct
+import sys
+import time
+from typing import Iterable, Optional, Union
+
+from .zettel import IgnorePatterns
+
+
+class NoteWatcher:
+    """Detects added, changed and removed note files in a directory tree
+
+    Uses inotify on Linux when available. Otherwise the tree is polled: all note
+    files are checked for changed size or modification time, but only directories
+    whose modification time has changed are listed again."""
+
+    def __init__(self, path: str, extension: Union[str, Iterable[str]], interval: float = 0.5,
+                 use_inotify: bool = True, ignore: Optional[IgnorePatterns] = None):
+        self.__root = os.path.abspath(path)
+        self.__extensions = (extension,) if isinstance(extension, str) else tuple(extension)
+        self.__ignore = ignore or IgnorePatterns.for_directory(self.__root)
+        self.__interval = interval
+
+        # Key = file path, value = (modification time, size)
+        self.__files: dict[str, tuple[int, int]] = {}
+        # Key = directory path, value = modification time
+        self.__directories: dict[str, int] = {}
+
+        self.__inotify = Inotify.create() if use_inotify else None
+        self.__scan_directory(self.__root, self.__files)
+
+    def uses_inotify(self) -> bool:
+        return self.__inotify is not None
+
+    def close(self) -> None:
+        if self.__inotify:
+            self.__inotify.close()
+
+    def poll(self, timeout: Optional[float] = None) -> tuple[set[str], set[str]]:
+        """Wait for changes and return the changed (or added) and removed note files
+
+        Returns two empty sets if nothing has changed before the timeout."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.__inotify:
+                candidates = self.__wait_for_events(deadline)
+            else:
+                candidates = self.__poll_tree()
+
+            (changed, removed) = self.__compare(candidates)
+            if changed or removed:
+                return (changed, removed)
+            if deadline is not None and time.monotonic() >= deadline:
+                return (set(), set())
+            if not self.__inotify:
+                time.sleep(self.__interval if deadline is None else
+                           max(0.0, min(self.__interval, deadline - time.monotonic())))
+
+    def refresh(self, paths: list[str]) -> None:
+        """Remember the current state of files we have written ourselves, to not report them as changed"""
+
+        for path in paths:
+            status = NoteWatcher.__stat(path)
+            if status:
+                self.__files[path] = status
+
+    def __is_note(self, path: str) -> bool:
+        return os.path.splitext(path)[1] in self.__extensions and not self.__is_ignored(path, False)
+
+    def __is_ignored(self, path: str, is_directory: bool) -> bool:
+        relative_path = os.path.relpath(path, self.__root).replace(os.sep, "/")
+        return self.__ignore.ignores(relative_path, is_directory)
+
+    def __scan_directory(self, directory: str, files: dict[str, tuple[int, int]]) -> None:
+        """Find all note files and directories in a directory tree"""
+
+        try:
+            self.__directories[directory] = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+
+        if self.__inotify:
+            self.__inotify.add_watch(directory)
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not self.__is_ignored(entry.path, True):
+                    self.__scan_directory(entry.path, files)
+            elif self.__is_note(entry.path) and entry.is_file():
+                status = NoteWatcher.__stat(entry.path)
+                if status:
+                    files[entry.path] = status
+
+    def __poll_tree(self) -> set[str]:
+        """Find files that may have been added, changed or removed since the last poll"""
+
+        candidates = set(self.__files)
+        for directory, mtime in list(self.__directories.items()):
+            try:
+                current_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                del self.__directories[directory]
+                continue
+
+            if current_mtime != mtime:
+                self.__directories[directory] = current_mtime
+                for entry in os.scandir(directory):
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in self.__directories and not self.__is_ignored(entry.path, True):
+                            found: dict[str, tuple[int, int]] = {}
+                            self.__scan_directory(entry.path, found)
+                            candidates.update(found)
+                    elif self.__is_note(entry.path):
+                        candidates.add(entry.path)
+
+        return candidates
+
+    def __wait_for_events(self, deadline: Optional[float]) -> set[str]:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        candidates: set[str] = set()
+
+        # Editors often write a file in several steps, so wait a little for more events
+        (events, overflowed) = self.__inotify.read_events(timeout, settle=0.05)
+        if overflowed:
+            # Events were lost, so look at the whole tree again, and watch any new directories
+            found: dict[str, tuple[int, int]] = {}
+            self.__directories = {}
+            self.__scan_directory(self.__root, found)
+            return set(self.__files) | set(found)
+
+        for (directory, name, is_directory) in events:
+            path = os.path.join(directory, name) if name else directory
+            if is_directory:
+                # Added, moved or removed directory
+                candidates.update(p for p in self.__files if p.startswith(path + os.sep))
+                for d in [d for d in self.__directories if d == path or d.startswith(path + os.sep)]:
+                    del self.__directories[d]
+                if os.path.isdir(path) and not self.__is_ignored(path, True):
+                    found = {}
+                    self.__scan_directory(path, found)
+                    candidates.update(found)
+            elif self.__is_note(path):
+                candidates.add(path)
+
+        return candidates
+
+    def __compare(self, candidates: set[str]) -> tuple[set[str], set[str]]:
+        changed = set()
+        removed = set()
+
+        for path in candidates:
+            status = NoteWatcher.__stat(path)
+            if status is None:
+                if self.__files.pop(path, None):
+                    removed.add(path)
+            elif self.__files.get(path) != status:
+                self.__files[path] = status
+                changed.add(path)
+
+        return (changed, removed)
+
+    @staticmethod
+    def __stat(path: str) -> Optional[tuple[int, int]]:
+        try:
+            status = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(status.st_mode):
+            return None
+        return (status.st_mtime_ns, status.st_size)
+
+
+class Inotify:
+    """Minimal inotify binding, using ctypes to call libc"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+
+    EVENT_HEADER = struct.Struct("iIII")
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, libc: ctypes.CDLL, fd: int):
+        self.__libc = libc
+        self.__fd = fd
+        # Key = watch descriptor, value = directory path
+        self.__watches: dict[int, str] = {}
+
+    @staticmethod
+    def create() -> Optional["Inotify"]:
+        """Returns None if inotify isn't available on this system"""
+
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(Inotify.IN_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+        return Inotify(libc, fd) if fd >= 0 else None
+
+    def add_watch(self, directory: str) -> None:
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), Inotify.WATCH_MASK)
+        if wd >= 0:
+            self.__watches[wd] = directory
+
+    def read_events(self, timeout: Optional[float], settle: float) -> tuple[list[tuple[str, str, bool]], bool]:
+        """Wait for events, and return (directory, name, is directory) for each of them, and
+        whether the event queue overflowed, so that other events were lost"""
+
+        events = []
+        overflowed = False
+        while select.select([self.__fd], [], [], timeout)[0]:
+            try:
+                buffer = os.read(self.__fd, 65536)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                (wd, mask, cookie, length) = Inotify.EVENT_HEADER.unpack_from(buffer, offset)
+                offset += Inotify.EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & Inotify.IN_Q_OVERFLOW:
+                    overflowed = True
+                elif mask & Inotify.IN_IGNORED:
+                    self.__watches.pop(wd, None)
+                elif wd in self.__watches:
+                    events.append((self.__watches[wd], name, bool(mask & Inotify.IN_ISDIR)))
+
+            timeout = settle
+
+        return (events, overflowed)
+
+    def close(self) -> None:
+        os.close(self.__fd)
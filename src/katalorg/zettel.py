@@ -1,9 +1,29 @@
 import os
 import os.path
-import pathlib
 import re
+import base64
+import json
+import fnmatch
+import codecs
+import hashlib
+import mmap
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import collections
-from typing import Callable, Optional
+import contextlib
+import concurrent.futures
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Mapping, Optional, Union
+
+from .graph import LinkGraph
+from .pipeline import map_bounded, prefetch
+from .related import minhash
+from .stats import CollectionStats
+
+if TYPE_CHECKING:
+    from .index import NoteIndex
 
 
 def stricmp(a: Optional[str], b: Optional[str]) -> bool:
@@ -14,6 +34,11 @@ def stricmp(a: Optional[str], b: Optional[str]) -> bool:
         return False
 
 
+def fingerprint(links: list[str]) -> str:
+    """Order independent fingerprint of a list of backlinks"""
+    return hashlib.sha1("\n".join(sorted(links)).encode("utf-8")).hexdigest()
+
+
 class RegEx:
     NEWLINE = r"(?:\r?\n)"
 
@@ -29,41 +54,133 @@ class RegEx:
     def not_preceded_by(s: str) -> str:
         return f"(?<!{s})"
 
+    @staticmethod
+    def any_of(strings: Iterable[str]) -> str:
+        """Matches any of the strings, preferring the longest
+
+        The strings are merged into a trie, so matching takes about the same time
+        however many strings there are, unlike a plain alternation."""
+
+        trie: dict = {}
+        for s in strings:
+            node = trie
+            for c in s:
+                node = node.setdefault(c, {})
+            # End of a string
+            node[""] = {}
+        return RegEx.__trie_pattern(trie)
+
+    @staticmethod
+    def __trie_pattern(node: dict) -> str:
+        branches = [re.escape(c) + RegEx.__trie_pattern(child) for (c, child) in sorted(node.items()) if c]
+        if not branches:
+            return ""
+
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # A string ends here, but longer strings are tried first
+            pattern = f"(?:{pattern})?"
+        return pattern
+
 
 class NoteMarkdownParser:
     DEFAULT_ID_PATTERN = r"(?:19|20)\d{12}"
     DEFAULT_LINK_PREFIX = "[["
     DEFAULT_LINK_POSTFIX = "]]"
 
-    def __init__(self, id_pattern: str = "", link_prefix: str = "", link_postfix: str = ""):
+    def __init__(self, id_pattern: str = "", link_prefix: str = "", link_postfix: str = "",
+                 signatures: bool = False):
+        """With signatures, each scan also computes a MinHash signature of the note content, see minhash"""
+
+        self.__signatures = signatures
         self.__id_pattern = RegEx.as_word(id_pattern or NoteMarkdownParser.DEFAULT_ID_PATTERN)
         self.__link_prefix = link_prefix or NoteMarkdownParser.DEFAULT_LINK_PREFIX
         self.__link_postfix = link_postfix or NoteMarkdownParser.DEFAULT_LINK_POSTFIX
 
         # Matches an ID not between link start and link end
         self.__id_regex = re.compile(self.get_nonlink_id_regex_pattern())
+        # Matches what may be an ID, without checking for word boundaries or links at every
+        # position, which makes searching with it much faster than with the above
+        self.__id_candidate_regex = re.compile(id_pattern or NoteMarkdownParser.DEFAULT_ID_PATTERN)
 
-        # Matches anything between link start and link end
-        self.__link_regex = re.compile(self.get_link_regex_pattern(id_pattern=r"[^][]+?"))
+        # Matches anything between link start and link end. Brackets can't be inside a link,
+        # so a search never looks further than to the next bracket. If the link end starts with
+        # a bracket, the greedy match ends where the lazy one would, without trying the link
+        # end after every character.
+        self.__link_regex = re.compile(self.get_link_regex_pattern(
+            id_pattern=r"[^][]+" if self.__link_postfix.startswith("]") else r"[^][]+?"))
 
         # Matches Markdown level 1 header on a line of its own
         self.__title_regex = re.compile(r"^#\s+(.+)$", re.MULTILINE)
 
         self.__backlinks_section_heading = "\n-----------------\n**Links to this note**\n"
-        self.__backlinks_section_pattern = re.compile(
-            r"\n[-*]{3,}\n+\*\*(?:Backlinks|Links to this note)\*\*(.+)\Z".replace(r"\n", RegEx.NEWLINE),
+
+        # The backlinks section is a horizontal rule, the heading, and the list of links, e.g.
+        #   \n---\n**Links to this note**\n- [[link]]
+        # Only the heading is matched with a regex. The rule before it is checked backwards,
+        # since searching for a pattern starting with a newline is slow.
+        self.__backlinks_heading_regex = re.compile(
+            r"\*\*(?:Backlinks|Links to this note)\*\*(?=.)",
+            re.DOTALL | re.IGNORECASE
+        )
+        self.__backlink_regex = re.compile(r"^[-*] (.*)$", re.MULTILINE)
+        # The first backlink can be on the same line as the heading
+        self.__first_backlink_regex = re.compile(r"[-*] (.*)$", re.MULTILINE)
+
+        self.__compile_byte_regexes()
+
+    def __compile_byte_regexes(self) -> None:
+        """Byte versions of the regexes, for scanning memory mapped files
+
+        On ASCII text, a byte pattern matches the same as the text pattern, except that
+        \\s doesn't match the separators \\x1c-\\x1f. Other text is decoded before searching."""
+
+        # When ignoring case, the text pattern also matches some non-ASCII letters:
+        # dotted and dotless i, the Kelvin sign for k, and the long s
+        (i, k, s) = (rb"(?:i|\xc4\xb0|\xc4\xb1)", rb"(?:k|\xe2\x84\xaa)", rb"(?:s|\xc5\xbf)")
+        self.__backlinks_heading_bytes_regex = re.compile(
+            rb"\*\*(?:Bac" + k + b"l" + i + b"n" + k + s + b"|L" + i + b"n" + k + s + b" to th" + i + s +
+            rb" note)\*\*(?=.)",
             re.DOTALL | re.IGNORECASE
         )
 
+        self.__title_bytes_regex = re.compile(self.__title_regex.pattern.encode(), re.MULTILINE)
+        try:
+            self.__id_bytes_regex: Optional[re.Pattern] = re.compile(self.__id_regex.pattern.encode())
+            self.__id_candidate_bytes_regex = re.compile(self.__id_candidate_regex.pattern.encode())
+            self.__link_bytes_regex = re.compile(self.__link_regex.pattern.encode())
+        except re.error:
+            # The patterns use something that isn't supported in byte patterns, like \u escapes
+            self.__id_bytes_regex = None
+
     def get_note_id(self, text: str) -> Optional[str]:
         """Extract ID from note text"""
 
-        match = self.__id_regex.search(text)
+        match = self.__search_id(text, len(text))
         if match:
             return match.group(0)
         else:
             return None
 
+    def __search_id(self, text: str, endpos: int) -> Optional[re.Match]:
+        """Same as self.__id_regex.search(text, 0, endpos), but faster"""
+        return NoteMarkdownParser.__search_with_candidates(self.__id_regex, self.__id_candidate_regex, text, endpos)
+
+    @staticmethod
+    def __search_with_candidates(regex: re.Pattern, candidate_regex: re.Pattern, text, endpos: int) \
+            -> Optional[re.Match]:
+        """Search with the regex only where the faster candidate regex matches first"""
+
+        pos = 0
+        while True:
+            candidate = candidate_regex.search(text, pos, endpos)
+            if not candidate:
+                return None
+            match = regex.match(text, candidate.start(), endpos)
+            if match:
+                return match
+            pos = candidate.start() + 1
+
     def get_note_links(self, text: str) -> set[str]:
         """Extract links from note text"""
         return set(self.__link_regex.findall(text))
@@ -77,6 +194,88 @@ class NoteMarkdownParser:
         else:
             return None
 
+    def scan(self, text: str) -> "NoteScan":
+        """Extract everything needed from note text, without copying it
+
+        Gives the same result as get_note_title, get_note_id and get_note_links
+        on the text without backlinks, and get_backlinks on the whole text.
+
+        Takes time linear in the length of the text, however many rules, brackets or
+        digits it has: no search looks at a character more than a few times. See the
+        notes in tests/testdata/pathological, which the tests time."""
+
+        (start, list_start) = self.find_backlinks_section(text)
+        return self.__scan_before(
+            text, start,
+            self.__get_backlinks_from(text, list_start) if start < len(text) else []
+        )
+
+    def __scan_before(self, text: str, start: int, backlinks: list[str]) -> "NoteScan":
+        title = self.__title_regex.search(text, 0, start)
+        id = self.__search_id(text, start)
+
+        return NoteScan(
+            title.group(1) if title else None,
+            id.group(0) if id else None,
+            set(self.__link_regex.findall(text, 0, start)),
+            start,
+            backlinks,
+            signature=minhash(text[:start].lower().encode("utf-8")) if self.__signatures else None
+        )
+
+    def scan_bytes(self, buffer) -> Optional["NoteScan"]:
+        """Same as scan, on UTF-8 encoded text in a bytes-like object, like a memory map
+
+        If the text before the backlinks section is ASCII, it is searched without decoding
+        it, and only the matches are decoded. Otherwise that part is decoded and scanned
+        as text. Either way, the backlinks section is only decoded by itself.
+
+        Returns None if the bytes can't be scanned like the text that would be read from
+        the file, because it has carriage returns that would be read as newlines."""
+
+        if buffer.find(b"\r") >= 0 or not self.__id_bytes_regex:
+            return None
+
+        (start, list_start) = self.__find_backlinks_section_in_bytes(buffer)
+        backlinks = []
+        if start < len(buffer):
+            section = buffer[start:].decode("utf-8")
+            heading_length = len(buffer[start:list_start].decode("utf-8"))
+            backlinks = self.__get_backlinks_from(section, heading_length)
+
+        if not NoteMarkdownParser.__is_ascii(buffer, start):
+            text = buffer[:start].decode("utf-8")
+            scan = self.__scan_before(text, len(text), backlinks)
+            end = len(text)
+            while end > 0 and text[end - 1].isspace():
+                end -= 1
+            scan.content_end = start - len(text[end:].encode("utf-8"))
+            return scan
+
+        title = self.__title_bytes_regex.search(buffer, 0, start)
+        id = NoteMarkdownParser.__search_with_candidates(self.__id_bytes_regex, self.__id_candidate_bytes_regex,
+                                                         buffer, start)
+        end = start
+        while end > 0 and buffer[end - 1] in b" \t\n\r\x0b\x0c":
+            end -= 1
+        return NoteScan(
+            title.group(1).decode("ascii") if title else None,
+            id.group(0).decode("ascii") if id else None,
+            set(link.decode("ascii") for link in self.__link_bytes_regex.findall(buffer, 0, start)),
+            start,
+            backlinks,
+            end,
+            minhash(buffer[:start].lower()) if self.__signatures else None
+        )
+
+    def create_record(self, scan: "NoteScan", filename: str, content_end: Optional[int] = None) -> "NoteRecord":
+        uri = \
+            scan.id or \
+            self.get_note_id(filename) or \
+            os.path.splitext(filename)[0]
+
+        return NoteRecord(uri, scan.title, scan.links, fingerprint(scan.backlinks), content_end, scan.signature)
+
     def remove_id_prefix(self, text: str) -> str:
         """Remove potential ID prefix from string"""
 
@@ -91,6 +290,28 @@ class NoteMarkdownParser:
             "(" + self.__id_pattern + ")" + \
             RegEx.not_followed_by(re.escape(self.__link_postfix))
 
+    def get_rewrite_regex_pattern(self, uris: Iterable[str], links_only: bool = False) -> str:
+        """Matches any of the URIs, IDs as whole words and other URIs only in links
+
+        A matched ID is in the group "id". For other URIs, or all URIs if links_only,
+        the whole link is matched, with the URI in the group "uri"."""
+
+        ids = []
+        others = []
+        for uri in uris:
+            (ids if self.is_id(uri) and not links_only else others).append(uri)
+
+        patterns = []
+        if ids:
+            patterns.append(r"(?<!\w)(?P<id>" + RegEx.any_of(ids) + r")(?!\w)")
+        if others:
+            patterns.append(re.escape(self.__link_prefix) + "(?P<uri>" + RegEx.any_of(others) + ")" +
+                            re.escape(self.__link_postfix))
+        return "|".join(patterns)
+
+    def is_id(self, s: str) -> bool:
+        return re.fullmatch(self.__id_pattern, s) is not None
+
     def get_link_regex_pattern(self, id_pattern: str = None) -> str:
         if not id_pattern:
             id_pattern = self.__id_pattern
@@ -103,29 +324,154 @@ class NoteMarkdownParser:
         else:
             return ""
 
+    def find_backlinks_section(self, text: str) -> tuple[int, int]:
+        """Find where the backlinks section starts, and where its list of links starts
+
+        Returns the length of the text for both, if there is no backlinks section.
+        The rule before each heading is checked by going backwards over newlines and
+        rule characters, which stops at the text of the heading before, so each
+        character is looked at no more than twice."""
+
+        for match in self.__backlinks_heading_regex.finditer(text):
+            start = NoteMarkdownParser.__find_rule_before(text, match.start())
+            if start >= 0:
+                return (start, match.end())
+
+        return (len(text), len(text))
+
+    @staticmethod
+    def __find_rule_before(text: str, pos: int) -> int:
+        """Find the start of a line with a horizontal rule, followed by newlines up to pos"""
+
+        i = pos
+        while i > 0 and text[i - 1] == "\n":
+            i -= 1
+            if i > 0 and text[i - 1] == "\r":
+                i -= 1
+        if i == pos:
+            return -1
+
+        rule_end = i
+        while i > 0 and text[i - 1] in "-*":
+            i -= 1
+        if rule_end - i < 3 or i == 0 or text[i - 1] != "\n":
+            return -1
+
+        i -= 1
+        if i > 0 and text[i - 1] == "\r":
+            i -= 1
+        return i
+
+    @staticmethod
+    def __is_ascii(buffer, end: int, chunk_size: int = 1 << 20) -> bool:
+        """Whether the bytes are ASCII, without the separators \\x1c-\\x1f that only text patterns see as spaces
+
+        Checked in chunks, since bytes.isascii is much faster than searching with a regex."""
+
+        for pos in range(0, end, chunk_size):
+            chunk = buffer[pos:min(pos + chunk_size, end)]
+            if not chunk.isascii() or any(separator in chunk for separator in (b"\x1c", b"\x1d", b"\x1e", b"\x1f")):
+                return False
+        return True
+
+    def __find_backlinks_section_in_bytes(self, buffer) -> tuple[int, int]:
+        """Same as find_backlinks_section, on bytes without carriage returns"""
+
+        for match in self.__backlinks_heading_bytes_regex.finditer(buffer):
+            # Same as __find_rule_before, without carriage returns
+            i = match.start()
+            while i > 0 and buffer[i - 1] == ord("\n"):
+                i -= 1
+            rule_end = i
+            while i > 0 and buffer[i - 1] in b"-*":
+                i -= 1
+            if rule_end < match.start() and rule_end - i >= 3 and i > 0 and buffer[i - 1] == ord("\n"):
+                return (i - 1, match.end())
+
+        return (len(buffer), len(buffer))
+
+    def __get_backlinks_from(self, text: str, pos: int) -> list[str]:
+        first = self.__first_backlink_regex.match(text, pos)
+        links = [first.group(1)] if first else []
+        links.extend(self.__backlink_regex.findall(text, pos))
+        return links
+
     def get_backlinks(self, text: str) -> list[str]:
-        match = self.__backlinks_section_pattern.search(text)
-        if match:
-            section = match.group(1)
-            return re.findall(r"^[-*] (.*)$", section, re.MULTILINE)
+        (start, list_start) = self.find_backlinks_section(text)
+        if start < len(text):
+            return self.__get_backlinks_from(text, list_start)
         else:
             return []
 
     def remove_backlinks(self, text: str) -> str:
         """Remove backlinks section from note text"""
-        return self.__backlinks_section_pattern.sub("", text)
+        return text[:self.find_backlinks_section(text)[0]]
+
+    def create_backlinks_section(self, links: list[str]) -> str:
+        """The backlinks section to put after the content, or nothing if there are no links"""
 
-    def append_backlinks(self, text: str, links: list[str]) -> str:
-        return text.rstrip() + "\n" + \
+        if not links:
+            return ""
+        return "\n" + \
             self.__backlinks_section_heading + \
             "".join(list(map(lambda l: "\n- " + l, links)))
 
+    def is_backlinks_tail(self, text: str) -> bool:
+        """Whether the text is only whitespace and maybe a backlinks section, like the end of a note"""
+
+        start = self.find_backlinks_section(text)[0]
+        return not text[:start].strip()
+
+
+class NoteScan:
+    """Result of scanning the text of a note"""
+
+    def __init__(self, title: Optional[str], id: Optional[str], links: set[str],
+                 backlinks_start: int, backlinks: list[str], content_end: Optional[int] = None,
+                 signature: Optional[bytes] = None):
+        self.title = title
+        self.id = id
+        self.links = links
+        # Position of the backlinks section, or the length of the text if there is none
+        self.backlinks_start = backlinks_start
+        self.backlinks = backlinks
+        # Byte offset of the end of the content before the backlinks section, when scanning bytes
+        self.content_end = content_end
+        # MinHash signature of the content, if the parser computes them
+        self.signature = signature
+
+
+class NoteRecord:
+    """Metadata parsed from a note, enough to link notes without reading them again"""
+
+    def __init__(self, uri: str, title: Optional[str], links: set[str], backlinks_fingerprint: str,
+                 content_end: Optional[int] = None, signature: Optional[bytes] = None):
+        self.uri = uri
+        self.title = title
+        self.links = links
+        self.backlinks_fingerprint = backlinks_fingerprint
+        # Byte offset in the file where the content before the backlinks section ends,
+        # if the backlinks section can be replaced without rewriting the content
+        self.content_end = content_end
+        # MinHash signature of the content before the backlinks section, or None if not computed
+        self.signature = signature
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, NoteRecord) and \
+            (self.uri, self.title, self.links, self.backlinks_fingerprint, self.content_end, self.signature) == \
+            (other.uri, other.title, other.links, other.backlinks_fingerprint, other.content_end, other.signature)
+
 
 class NoteFile:
+    __slots__ = ("__path", "__encoding")
+
     def __init__(self, path: str, encoding: str = "utf-8"):
         self.__path = path
         self.__encoding = encoding
 
+    def get_path(self) -> str:
+        return self.__path
+
     def get_name(self) -> str:
         return os.path.basename(self.__path)
 
@@ -136,11 +482,120 @@ class NoteFile:
         with open(self.__path, "r", encoding=self.__encoding) as file:
             return file.read()
 
-    def write(self, contents: str):
-        with open(self.__path, "w", encoding=self.__encoding) as file:
-            file.seek(0)
+    def read_bytes(self) -> bytes:
+        with open(self.__path, "rb") as file:
+            return file.read()
+
+    def read_checking_newlines(self, data: Optional[bytes] = None) -> tuple[str, bool]:
+        """Read the text, and whether the file has the newlines that writing the text would give
+
+        Only then do the byte offsets of the text in the file match those after writing.
+        If the file's bytes have already been read, they are decoded instead."""
+
+        if data is None:
+            with open(self.__path, "r", encoding=self.__encoding, newline="") as file:
+                text = file.read()
+        else:
+            text = data.decode(self.__encoding)
+
+        if "\r" not in text:
+            return (text, os.linesep == "\n")
+
+        native = os.linesep == "\r\n" and text.count("\r\n") == text.count("\r") == text.count("\n")
+        # Same as reading with universal newlines
+        return (text.replace("\r\n", "\n").replace("\r", "\n"), native)
+
+    def get_byte_length(self, text: str) -> int:
+        """Length of the text when written to the file"""
+
+        if text.isascii() and codecs.lookup(self.__encoding).name == "utf-8":
+            size = len(text)
+        else:
+            size = len(text.encode(self.__encoding))
+        return size + text.count("\n") * (len(os.linesep) - 1)
+
+    def splice(self, offset: int, tail: str, is_replaceable: Callable[[str], bool],
+               journal: "SpliceJournal", fsync: bool = False) -> Optional[int]:
+        """Replace the end of the file from a byte offset with the tail, without rewriting the start
+
+        The end is only replaced if it can be decoded and is_replaceable accepts it. The old
+        end is saved in the journal first, so an interrupted write can be completed. Returns the
+        number of bytes written, 0 if the file already ends with the tail, or None if the end
+        can't be replaced."""
+
+        data = tail.replace("\n", os.linesep).encode(self.__encoding)
+        with open(self.__path, "r+b") as file:
+            if offset > os.fstat(file.fileno()).st_size:
+                return None
+            file.seek(offset)
+            old = file.read()
+            try:
+                if not is_replaceable(old.decode(self.__encoding)):
+                    return None
+            except UnicodeDecodeError:
+                # The offset isn't at the start of a character, so the file has changed
+                return None
+            if old == data:
+                return 0
+
+            journal.begin(self.__path, offset, old, data, fsync)
+            file.seek(offset)
+            file.write(data)
             file.truncate()
-            file.write(contents)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        journal.end()
+
+        return len(data)
+
+    @contextlib.contextmanager
+    def map(self) -> Iterator[Union[mmap.mmap, bytes]]:
+        """Memory map the file for reading. An empty file can't be mapped, and gives empty bytes."""
+
+        with open(self.__path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+
+    def write(self, contents: str, fsync: bool = False) -> int:
+        """Replace the file with the contents, unless it already has exactly those
+
+        The contents are written to a temporary file, which then replaces the note,
+        so a crash never leaves a partially written note. Returns the number of bytes
+        written, or 0 if the file wasn't written."""
+
+        data = contents.replace("\n", os.linesep).encode(self.__encoding)
+        if self.__has_data(data):
+            return 0
+
+        # Replace the target of a symbolic link, not the link
+        path = os.path.realpath(self.__path)
+        (fd, temp_path) = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+                if fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            shutil.copymode(path, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        return len(data)
+
+    def __has_data(self, data: bytes) -> bool:
+        try:
+            if os.stat(self.__path).st_size != len(data):
+                return False
+            with open(self.__path, "rb") as file:
+                return file.read() == data
+        except FileNotFoundError:
+            return False
 
     def rename(self, name: str) -> str:
         new_path = os.path.join(os.path.dirname(self.__path), NoteFile.escape_filename(name))
@@ -157,47 +612,97 @@ class NoteFile:
 
 
 class Note:
-    def __init__(self, file: NoteFile, parser: Optional[NoteMarkdownParser] = None):
+    # Slots, since there is one instance for each note in the collection
+    __slots__ = ("__file", "__parser", "__compact", "__content", "__uri", "__title", "__links",
+                 "__backlinks_fingerprint", "__content_end", "__section", "__signature")
+
+    def __init__(self, file: NoteFile, parser: Optional[NoteMarkdownParser] = None,
+                 record: Optional[NoteRecord] = None, compact: bool = False, data: Optional[bytes] = None):
+        """In compact mode, only the metadata is kept in memory. The content is read
+        again if the backlinks section is updated, and then released when written.
+        Without a record, the note is parsed from the file's data, or read from the file."""
+
         self.__file = file
         self.__parser = parser or NoteMarkdownParser()
-        self.__read_from_file()
+        self.__compact = compact
+        self.__content: Optional[str] = None
+        # New backlinks section, not yet written
+        self.__section: Optional[str] = None
+        if record:
+            # Metadata is already known, the content is read when needed
+            self.__load_record(record)
+        else:
+            self.__read_from_file(data)
 
-    def __read_from_file(self):
-        self.__content = self.__file.read()
-        content_except_backlinks = self.__parser.remove_backlinks(self.__content)
-        self.__title = self.__parser.get_note_title(content_except_backlinks)
-        self.__links = self.__parser.get_note_links(content_except_backlinks)
-        self.__uri = \
-            self.__parser.get_note_id(content_except_backlinks) or \
-            self.__parser.get_note_id(self.get_filename()) or \
-            self.get_filename_without_extension()
+    def __read_from_file(self, data: Optional[bytes] = None):
+        (content, native_newlines) = self.__file.read_checking_newlines(data)
+        scan = self.__parser.scan(content)
+        content_end = None
+        if native_newlines:
+            content_end = self.__file.get_byte_length(content[:scan.backlinks_start].rstrip())
 
-    def write_to_file(self):
-        self.__file.write(self.__content.rstrip() + "\n")
+        self.__load_record(self.__parser.create_record(scan, self.get_filename(), content_end))
+        if not self.__compact:
+            self.__content = content
+
+    def __load_record(self, record: NoteRecord):
+        self.__uri = record.uri
+        self.__title = record.title
+        # Many notes link to the same notes, so share the strings
+        self.__links = tuple(sys.intern(link) for link in record.links)
+        self.__backlinks_fingerprint = record.backlinks_fingerprint
+        self.__content_end = record.content_end
+        self.__signature = record.signature
+
+    def __get_content(self) -> str:
+        if self.__content is None:
+            self.__content = self.__file.read()
+        return self.__content
+
+    def get_record(self) -> NoteRecord:
+        return NoteRecord(self.__uri, self.__title, set(self.__links), self.__backlinks_fingerprint,
+                          self.__content_end, self.__signature)
+
+    def write_to_file(self, fsync: bool = False, journal: Optional["SpliceJournal"] = None) -> int:
+        """Returns the number of bytes written, or 0 if the file already had the content
+
+        With a journal, only the backlinks section is replaced, if the file still ends
+        with the section that was there when the note was read."""
+
+        size = None
+        if journal and self.__section is not None and self.__content_end is not None:
+            size = self.__file.splice(self.__content_end, self.__section + "\n", self.__parser.is_backlinks_tail,
+                                      journal, fsync)
+
+        if size is None:
+            if self.__section is not None and self.__content is None:
+                # The section was to be spliced in, without reading the content
+                self.__content = self.__parser.remove_backlinks(self.__get_content()).rstrip() + self.__section
+            content = self.__get_content().rstrip() + "\n"
+            size = self.__file.write(content, fsync)
+            if self.__section is not None:
+                self.__content_end = self.__file.get_byte_length(content[:len(content) - len(self.__section) - 1])
+
+        self.__section = None
+        if self.__compact:
+            self.__content = None
+        return size
 
     def rename_file(self, name: str) -> str:
         return self.__file.rename(name)
 
-    def backlinks_has_changed(self, linking_notes: list["Note"]) -> bool:
-        current_list = list(self.__parser.get_backlinks(self.__content))
-        new_list = list(map(lambda n: n.create_link_to(), linking_notes))
-        # If there is any added or removed link, update the section
-        return collections.Counter(current_list) != collections.Counter(new_list)
-
     def update_backlinks(self, linking_notes: list["Note"], overwrite: bool = False) -> bool:
-        if overwrite or self.backlinks_has_changed(linking_notes):
-            content = self.__parser.remove_backlinks(self.__content)
-            if len(linking_notes) > 0:
-                content = self.__parser.append_backlinks(
-                    content,
-                    list(
-                        map(
-                            lambda n: n.create_link_to(),
-                            linking_notes
-                        )
-                    )
-                )
-            self.__content = content
+        return self.set_backlinks(list(map(lambda n: n.create_link_to(), linking_notes)), overwrite)
+
+    def set_backlinks(self, links: list[str], overwrite: bool = False) -> bool:
+        """Like update_backlinks, with the links to the linking notes, see create_link_to"""
+
+        # If there is any added or removed link, update the section
+        if overwrite or self.__backlinks_fingerprint != fingerprint(links):
+            self.__section = self.__parser.create_backlinks_section(links)
+            if self.__content is not None:
+                self.__content = self.__parser.remove_backlinks(self.__content).rstrip() + self.__section
+            self.__backlinks_fingerprint = fingerprint(links)
             return True
         else:
             return False
@@ -208,6 +713,9 @@ class Note:
     def set_id(self, id: str):
         self.__uri = id
 
+    def get_path(self) -> str:
+        return self.__file.get_path()
+
     def get_filename(self) -> str:
         """Returns file name without path, but with extension"""
         return self.__file.get_name()
@@ -235,22 +743,381 @@ class Note:
 
         return link
 
-    def get_outgoing_links(self) -> set[str]:
+    def get_outgoing_links(self) -> tuple[str, ...]:
         return self.__links
 
+    def replace_links(self, replacements: dict[str, str]) -> None:
+        """Link to new URIs instead of old ones, without changing the file, like in a dry run of a rename"""
+        self.__links = tuple(replacements.get(link, link) for link in self.__links)
+
+    def get_signature(self) -> Optional[bytes]:
+        """MinHash signature of the content, or None if the parser didn't compute it"""
+        return self.__signature
+
+
+class NoteFactory:
+    """Creates notes from file paths, all sharing the same parser"""
+
+    def __init__(self, parser: Optional[NoteMarkdownParser] = None, encoding: str = "utf-8",
+                 compact: bool = False, mmap_size: Optional[int] = None):
+        """Notes of at least mmap_size bytes are scanned in a memory map, without decoding
+        all of the text, if they are UTF-8 encoded and there is no need to keep the text."""
+
+        self.__parser = parser or NoteMarkdownParser()
+        self.__encoding = encoding
+        self.__compact = compact
+        self.__mmap_size = mmap_size if codecs.lookup(encoding).name == "utf-8" else None
+
+    def __call__(self, path: str, record: Optional[NoteRecord] = None, data: Optional[bytes] = None) -> Note:
+        """Create a note from its record, or parse it from the data read with read, or from the file"""
+
+        if record is None and data is None and self.__compact and self.__mmap_size is not None:
+            # The text isn't kept in compact mode, so the note can be scanned the fast way
+            record = self.parse(path)
+        return Note(NoteFile(path, self.__encoding), self.__parser, record, self.__compact, data)
+
+    def read(self, path: str) -> Optional[bytes]:
+        """Read a note file, to create the note from later
+
+        Returns None for a note that would be scanned in a memory map, since then the
+        file is better read when the note is created."""
+
+        if self.__compact and self.__mmap_size is not None and os.path.getsize(path) >= self.__mmap_size:
+            return None
+        return NoteFile(path, self.__encoding).read_bytes()
+
+    def parse(self, path: str) -> NoteRecord:
+        """Read and parse a note file, without creating a note"""
+
+        file = NoteFile(path, self.__encoding)
+        scan = None
+        content_end = None
+        if self.__mmap_size is not None and os.path.getsize(path) >= self.__mmap_size:
+            with file.map() as buffer:
+                scan = self.__parser.scan_bytes(buffer)
+            if scan is not None and os.linesep == "\n":
+                content_end = scan.content_end
+        if scan is None:
+            (content, native_newlines) = file.read_checking_newlines()
+            scan = self.__parser.scan(content)
+            if native_newlines:
+                content_end = file.get_byte_length(content[:scan.backlinks_start].rstrip())
+        return self.__parser.create_record(scan, file.get_name(), content_end)
+
+    def parse_files(self, paths: list[str]) -> list[tuple[NoteRecord, float]]:
+        """Read and parse note files, and measure the time it took for each of them"""
+
+        results = []
+        for path in paths:
+            start = time.perf_counter()
+            record = self.parse(path)
+            results.append((record, time.perf_counter() - start))
+        return results
+
+
+class IgnorePatterns:
+    """Glob patterns for files and directories to ignore, like a simple .gitignore
+
+    A pattern ending with a slash only matches directories. A pattern containing
+    a slash is matched against the path relative to the notes directory, other
+    patterns against the file or directory name. Lines starting with # are comments."""
+
+    FILENAME = ".katalorgignore"
+    DEFAULT_PATTERNS = [".git/", ".obsidian/", ".trash/", "node_modules/"]
+
+    def __init__(self, patterns: Iterable[str]):
+        name_patterns: list[str] = []
+        path_patterns: list[str] = []
+        directory_name_patterns: list[str] = []
+        directory_path_patterns: list[str] = []
+
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+
+            directory_only = pattern.endswith("/")
+            pattern = pattern.strip("/")
+            if "/" in pattern:
+                (directory_path_patterns if directory_only else path_patterns).append(fnmatch.translate(pattern))
+            else:
+                (directory_name_patterns if directory_only else name_patterns).append(fnmatch.translate(pattern))
+
+        self.__name_regex = IgnorePatterns.__compile(name_patterns)
+        self.__path_regex = IgnorePatterns.__compile(path_patterns)
+        self.__directory_name_regex = IgnorePatterns.__compile(directory_name_patterns + name_patterns)
+        self.__directory_path_regex = IgnorePatterns.__compile(directory_path_patterns + path_patterns)
+
+    @staticmethod
+    def __compile(patterns: list[str]) -> Optional[re.Pattern]:
+        return re.compile("|".join(patterns)) if patterns else None
+
+    @staticmethod
+    def for_directory(path: str, extra_patterns: Iterable[str] = ()) -> "IgnorePatterns":
+        """The default patterns, the patterns in the directory's ignore file, and the extra patterns"""
+
+        patterns = list(IgnorePatterns.DEFAULT_PATTERNS)
+        try:
+            with open(os.path.join(path, IgnorePatterns.FILENAME), "r", encoding="utf-8") as file:
+                patterns.extend(file.read().splitlines())
+        except FileNotFoundError:
+            pass
+
+        return IgnorePatterns(patterns + list(extra_patterns))
+
+    def ignores(self, relative_path: str, is_directory: bool) -> bool:
+        """Check a path relative to the notes directory, with / as separator"""
+
+        (name_regex, path_regex) = (self.__directory_name_regex, self.__directory_path_regex) \
+            if is_directory else (self.__name_regex, self.__path_regex)
+
+        return bool(name_regex and name_regex.match(relative_path.rpartition("/")[2])) or \
+            bool(path_regex and path_regex.match(relative_path))
+
+    def ignores_file(self, relative_path: str) -> bool:
+        """Check a file path relative to the notes directory, and each directory it is in"""
+
+        parts = relative_path.split("/")
+        return any(self.ignores("/".join(parts[:i]), True) for i in range(1, len(parts))) or \
+            self.ignores(relative_path, False)
+
+
+def find_note_files(path: str, extension: Union[str, Iterable[str]], ignore: Optional[IgnorePatterns] = None,
+                    follow_symlinks: bool = False) -> Iterator[str]:
+    """Find note files with the extension(s) in a directory tree, and yield them as they are found
+
+    Ignored directories are not searched at all. Without ignore patterns, the
+    default patterns and the directory's ignore file are used. Symbolic links to
+    files are always followed, links to directories only with follow_symlinks.
+    The files of each directory are found in order of their names, before the
+    files in its subdirectories, so the order doesn't depend on the file system."""
+
+    extensions = (extension,) if isinstance(extension, str) else tuple(extension)
+    ignore = ignore or IgnorePatterns.for_directory(path)
+    # Directories already searched, to not loop forever when following symlinks
+    visited: set[tuple[int, int]] = set()
+
+    # Directory paths with their paths relative to the root
+    stack = [(path, "")]
+    while stack:
+        (directory, relative_directory) = stack.pop()
+        if follow_symlinks:
+            status = os.stat(directory)
+            if (status.st_dev, status.st_ino) in visited:
+                continue
+            visited.add((status.st_dev, status.st_ino))
+
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative_path = relative_directory + entry.name
+            if entry.is_dir(follow_symlinks=follow_symlinks):
+                if not ignore.ignores(relative_path, True):
+                    subdirectories.append((entry.path, relative_path + "/"))
+            elif os.path.splitext(entry.name)[1] in extensions and \
+                    entry.is_file() and \
+                    not ignore.ignores(relative_path, False):
+                yield entry.path
+
+        # Search subdirectories in the order they were found
+        stack.extend(reversed(subdirectories))
+
+
+def find_note_ids(path: str, extension: Union[str, Iterable[str]], parser: Optional[NoteMarkdownParser] = None,
+                  index: Optional["NoteIndex"] = None, ignore: Optional[IgnorePatterns] = None,
+                  encoding: str = "utf-8") -> set[str]:
+    """The IDs of all notes, to check that a new ID is unique
+
+    Much faster than importing the notes: IDs in file names are used as they are,
+    unchanged notes are looked up in the index, and in other notes only the ID is
+    searched for. Notes with an ID in both the file name and the text give both."""
+
+    parser = parser or NoteMarkdownParser()
+    ids = set()
+    for note_path in find_note_files(path, extension, ignore):
+        id = parser.get_note_id(os.path.basename(note_path))
+        if id:
+            ids.add(id)
+
+        record = index.lookup(note_path) if index else None
+        if record:
+            ids.add(record.uri)
+        else:
+            with open(note_path, "r", encoding=encoding) as file:
+                id = parser.get_note_id(file.read())
+            if id:
+                ids.add(id)
+
+    return ids
+
 
 class NoteCollection:
-    def import_files(self, path: str, extension: str, noteFactory: Callable[[str], Note]) -> None:
-        """Import files with notes from the given path"""
+    # Number of notes parsed at a time by each process
+    PARSE_CHUNK_SIZE = 64
+    # Number of files found or read ahead of the notes being added
+    QUEUE_SIZE = 256
+
+    def __init__(self, stats: Optional[CollectionStats] = None):
+        """With stats, the time of each phase and counters are recorded in it"""
+        self.stats = stats
+
+    def import_files(self, path: str, extension: Union[str, Iterable[str]], noteFactory: Callable[..., Note],
+                     index: Optional["NoteIndex"] = None, jobs: int = 1,
+                     ignore: Optional[IgnorePatterns] = None, follow_symlinks: bool = False,
+                     read_jobs: int = 1, progress: Optional[Callable[[int, str], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> None:
+        """Import files with notes from the given path
+
+        With an index, notes that haven't changed since they were indexed are created
+        from the cached record instead of being read and parsed again.
+
+        With more than one job, notes are parsed in that many processes. With more than
+        one read job, the files are looked up in the index and read in that many threads,
+        while the directory tree is searched in another thread. This helps when opening
+        a file takes long, like on a network drive. Both require the note factory to be
+        a NoteFactory. The stages are connected by bounded queues, so only a limited
+        number of files are read ahead.
+
+        After each note is added, progress is called with the number of notes so far
+        and the path. If the cancel event is set, the import stops and raises
+        concurrent.futures.CancelledError, leaving the notes imported so far.
+
+        See find_note_files for the other arguments."""
+
+        if (jobs > 1 or read_jobs > 1) and not isinstance(noteFactory, NoteFactory):
+            raise TypeError("Parsing or reading notes in parallel requires a NoteFactory")
 
         self.notes: dict[str, Note] = {}
 
-        for filename_obj in pathlib.Path(path).rglob("*" + extension):
-            file_path = str(filename_obj)
-            if not os.path.isfile(file_path) or not filename_obj.suffix == extension:
-                continue
+        with self.__phase("import_files"):
+            files: Iterable[str] = find_note_files(path, extension, ignore, follow_symlinks)
+            if self.stats:
+                files = self.stats.timed("find_note_files", files)
+            if read_jobs > 1:
+                files = prefetch(files, NoteCollection.QUEUE_SIZE, cancel)
+
+            if jobs > 1:
+                self.__import_in_parallel(files, noteFactory, index, jobs, read_jobs, progress, cancel)
+                return
+
+            if read_jobs > 1:
+                def read(file_path: str) -> tuple[str, Optional[NoteRecord], Optional[bytes]]:
+                    record = index.lookup(file_path) if index else None
+                    return (file_path, record, None if record else noteFactory.read(file_path))
+
+                loaded: Iterable[tuple[str, Optional[NoteRecord], Optional[bytes]]] = \
+                    map_bounded(read, files, read_jobs, NoteCollection.QUEUE_SIZE, cancel)
+            else:
+                # The notes read their files themselves
+                loaded = ((file_path, index.lookup(file_path) if index else None, None) for file_path in files)
+
+            for (file_path, record, data) in loaded:
+                if cancel and cancel.is_set():
+                    raise concurrent.futures.CancelledError()
+
+                self.__count("files_found")
+                if record:
+                    self.__count("notes_cached")
+                    self.add_note(noteFactory(file_path, record))
+                else:
+                    start = time.perf_counter()
+                    note = noteFactory(file_path) if data is None else noteFactory(file_path, data=data)
+                    self.__note_parsed(file_path, time.perf_counter() - start)
+                    self.add_note(note)
+
+                if progress:
+                    progress(len(self.notes), file_path)
+
+    def __note_parsed(self, path: str, seconds: float) -> None:
+        if self.stats:
+            self.stats.note_parsed(path, seconds, os.path.getsize(path))
+
+    def __phase(self, name: str) -> contextlib.AbstractContextManager:
+        return self.stats.phase(name) if self.stats else contextlib.nullcontext()
+
+    def __count(self, name: str, amount: int = 1) -> None:
+        if self.stats:
+            self.stats.count(name, amount)
+
+    def __import_in_parallel(self, files: Iterable[str], noteFactory: NoteFactory, index: Optional["NoteIndex"],
+                             jobs: int, read_jobs: int, progress: Optional[Callable[[int, str], None]],
+                             cancel: Optional[threading.Event]) -> None:
+        # Notes are parsed in chunks while the directory tree is still being searched.
+        # The workers only return the parsed records, which are much cheaper
+        # to send between processes than the notes with their content.
+        if index and read_jobs > 1:
+            looked_up: Iterable[tuple[str, Optional[NoteRecord]]] = map_bounded(
+                lambda file_path: (file_path, index.lookup(file_path)), files, read_jobs,
+                NoteCollection.QUEUE_SIZE, cancel)
+        else:
+            looked_up = ((file_path, index.lookup(file_path) if index else None) for file_path in files)
+
+        def add(file_path: str, note: Note):
+            self.add_note(note)
+            if progress:
+                progress(len(self.notes), file_path)
+
+        def add_parsed(paths: list[str], future: concurrent.futures.Future):
+            for (file_path, (record, seconds)) in zip(paths, future.result()):
+                self.__note_parsed(file_path, seconds)
+                add(file_path, noteFactory(file_path, record))
+
+        pool = concurrent.futures.ProcessPoolExecutor(jobs)
+        try:
+            # Chunks being parsed, limited to keep the parsed records from piling up
+            chunks: collections.deque[tuple[list[str], concurrent.futures.Future]] = collections.deque()
+            chunk: list[str] = []
+
+            for (file_path, record) in looked_up:
+                if cancel and cancel.is_set():
+                    raise concurrent.futures.CancelledError()
+
+                self.__count("files_found")
+                if record:
+                    self.__count("notes_cached")
+                    add(file_path, noteFactory(file_path, record))
+                    continue
+
+                chunk.append(file_path)
+                if len(chunk) == NoteCollection.PARSE_CHUNK_SIZE:
+                    chunks.append((chunk, pool.submit(noteFactory.parse_files, chunk)))
+                    chunk = []
+                    if len(chunks) > jobs * 2:
+                        add_parsed(*chunks.popleft())
+
+            if chunk:
+                chunks.append((chunk, pool.submit(noteFactory.parse_files, chunk)))
+
+            while chunks:
+                if cancel and cancel.is_set():
+                    raise concurrent.futures.CancelledError()
+                add_parsed(*chunks.popleft())
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def import_index(self, index: "NoteIndex", noteFactory: Callable[..., Note]) -> None:
+        """Add the notes as they were when the index was saved, without reading any files
+
+        The notes that have changed since then can be updated with update_files."""
+
+        self.notes = {}
+        with self.__phase("import_index"):
+            # In the order import_files finds them, so that the backlinks are in the same order
+            for (path, record) in sorted(index.records(), key=lambda item: NoteCollection.__path_order(item[0])):
+                self.add_note(noteFactory(path, record))
+
+        self.__count("notes_from_index", len(self.notes))
+
+    @staticmethod
+    def __path_order(path: str) -> tuple[list[str], str]:
+        """Sort key for the order in which find_note_files finds note files"""
 
-            self.add_note(noteFactory(file_path))
+        (directory, name) = os.path.split(path)
+        return (directory.split(os.sep), name)
 
     def add_note(self, note: Note):
         uri = note.get_uri()
@@ -259,49 +1126,399 @@ class NoteCollection:
         else:
             self.notes[uri] = note
 
+    def reload(self, paths: Iterable[str], noteFactory: Callable[..., Note],
+               on_error: Optional[Callable[[str, Exception], None]] = None) -> set[str]:
+        """Read the notes in the files again, add new notes, remove the notes whose files are
+        gone, and key all notes by their current URIs
+
+        For notes that were renamed, given new IDs, rewritten or changed, without importing all
+        notes again. A note that can't be added (e.g. duplicate URI) is skipped and passed to
+        on_error, or else the error is raised. Returns the URIs of the notes whose backlinks
+        may have changed. Call find_backlinks afterwards."""
+
+        paths = set(paths)
+        # URIs of the notes whose backlinks may have changed
+        affected: set[str] = set()
+
+        def add(note: Note) -> None:
+            try:
+                self.add_note(note)
+            except Exception as e:
+                if not on_error:
+                    raise
+                on_error(note.get_path(), e)
+
+        def read(path: str) -> None:
+            if os.path.isfile(path):
+                note = noteFactory(path)
+                affected.add(note.get_uri())
+                affected.update(note.get_outgoing_links())
+                add(note)
+
+        notes = {note.get_path(): note for note in self.notes.values()}
+        self.notes = {}
+        # New notes too, in the order import_files finds them, so that the backlinks are in the same order
+        for path in sorted(notes.keys() | paths, key=NoteCollection.__path_order):
+            if path not in paths:
+                add(notes[path])
+                continue
+            note = notes.get(path)
+            if note:
+                affected.add(note.get_uri())
+                affected.update(note.get_outgoing_links())
+            read(path)
+
+        return affected
+
     def find_backlinks(self) -> None:
-        # Key = target note id
-        self.backlinks: dict[str, list[Note]] = {}
+        with self.__phase("find_backlinks"):
+            self.graph: Optional[LinkGraph] = LinkGraph(self.notes)
+            # Key = target note id, a read-only view of the graph
+            self.backlinks: Mapping[str, list[Note]] = self.graph.backlinks()
+
+        self.__count("links_found", self.graph.get_link_count())
+
+    def __add_backlinks(self, note: Note) -> None:
+        for linked_id in note.get_outgoing_links():
+            if linked_id in self.backlinks:
+                self.backlinks[linked_id].append(note)
+            else:
+                self.backlinks[linked_id] = [note]
+
+    def __remove_backlinks(self, note: Note) -> None:
+        for linked_id in note.get_outgoing_links():
+            linking_notes = self.backlinks.get(linked_id)
+            if linking_notes and note in linking_notes:
+                linking_notes.remove(note)
+                if not linking_notes:
+                    del self.backlinks[linked_id]
+
+    def update_files(self, changed: Iterable[str], removed: Iterable[str], noteFactory: Callable[..., Note],
+                     on_error: Optional[Callable[[str, Exception], None]] = None,
+                     journal: Optional["SpliceJournal"] = None) -> list[Note]:
+        """Update the collection with changed, added and removed note files, and
+        update only the backlinks sections affected by the changes
+
+        Requires find_backlinks to have been called. Orphans and broken links are not
+        updated, call get_more_note_data for that. A note that can't be added (e.g.
+        duplicate URI) is skipped and passed to on_error, or else the error is raised.
+        With a journal, only the backlinks sections are rewritten. Returns the notes
+        whose files were updated."""
+
+        if not isinstance(self.backlinks, dict):
+            # The graph can't be changed, so keep the backlinks in a dict from now on
+            self.backlinks = {uri: list(linking_notes) for (uri, linking_notes) in self.backlinks.items()}
+            self.graph = None
+
+        notes_by_path = {note.get_path(): note for note in self.notes.values()}
+        # URIs of the notes whose backlinks may have changed
+        affected: set[str] = set()
+
+        for path in removed:
+            old_note = notes_by_path.pop(path, None)
+            if old_note:
+                self.__remove_note(old_note)
+                affected.update(old_note.get_outgoing_links())
+
+        for path in changed:
+            old_note = notes_by_path.pop(path, None)
+            if old_note:
+                self.__remove_note(old_note)
+
+            if not os.path.isfile(path):
+                # Removed again before we got to it
+                if old_note:
+                    affected.update(old_note.get_outgoing_links())
+                continue
 
-        for note in self.notes.values():
-            for linked_id in note.get_outgoing_links():
-                if linked_id in self.backlinks:
-                    self.backlinks[linked_id].append(note)
-                else:
-                    self.backlinks[linked_id] = [note]
+            note = noteFactory(path)
+            try:
+                self.add_note(note)
+            except Exception as e:
+                if old_note:
+                    affected.update(old_note.get_outgoing_links())
+                if on_error:
+                    on_error(path, e)
+                    continue
+                raise
+
+            notes_by_path[path] = note
+            self.__add_backlinks(note)
+            affected.add(note.get_uri())
+
+            if old_note and old_note.create_link_to() == note.create_link_to():
+                # Only added or removed links change the backlinks
+                affected.update(set(old_note.get_outgoing_links()) ^ set(note.get_outgoing_links()))
+            else:
+                affected.update(note.get_outgoing_links())
+                if old_note:
+                    affected.update(old_note.get_outgoing_links())
+
+        updated_notes = []
+        for uri in affected:
+            target_note = self.notes.get(uri)
+            linking_notes = self.backlinks.get(uri, [])
+            # Like update_backlinks_sections, only notes with an ID have their backlinks removed
+            if target_note and (linking_notes or target_note.get_id()) and \
+                    target_note.update_backlinks(linking_notes):
+                target_note.write_to_file(journal=journal)
+                updated_notes.append(target_note)
+        if journal:
+            journal.clear()
+
+        return updated_notes
+
+    def __remove_note(self, note: Note) -> None:
+        if self.notes.get(note.get_uri()) is note:
+            del self.notes[note.get_uri()]
+        self.__remove_backlinks(note)
 
     def get_more_note_data(self) -> None:
         self.orphans: list[Note] = []
         self.notes_without_id: list[Note] = []
         self.broken_links: list[str] = []
 
-        for note in self.notes.values():
-            if not note.get_id():
-                self.notes_without_id.append(note)
-            elif note.get_id() not in self.backlinks:
-                self.orphans.append(note)
+        with self.__phase("get_more_note_data"):
+            self.notes_without_id = [note for note in self.notes.values() if not note.get_id()]
 
-            self.broken_links.extend([link for link in note.get_outgoing_links() if link not in self.notes])
+            if self.graph:
+                self.orphans = [note for note in self.graph.find_unlinked_notes() if note.get_id()]
+                self.broken_links = self.graph.find_broken_links()
+            else:
+                for note in self.notes.values():
+                    if note.get_id() and note.get_id() not in self.backlinks:
+                        self.orphans.append(note)
 
-    def update_backlinks_sections(self, overwrite: bool = False) -> int:
-        count = 0
+                    self.broken_links.extend([link for link in note.get_outgoing_links() if link not in self.notes])
 
-        for backlink in self.backlinks:
-            if backlink not in self.notes:
-                # Broken link, no target to update
-                continue
+        self.__count("orphans", len(self.orphans))
+        self.__count("broken_links", len(self.broken_links))
+
+    def update_backlinks_sections(self, overwrite: bool = False, writer: Optional["NoteWriter"] = None,
+                                  uris: Optional[Iterable[str]] = None) -> int:
+        """Update and write the backlinks sections, with the given writer or one note at a time
 
-            target_note = self.notes[backlink]
-            linking_notes = self.backlinks[backlink]
+        With URIs, like those returned by reload, only the sections of those notes are
+        updated. Returns the number of notes whose backlinks were updated."""
 
-            if target_note.update_backlinks(linking_notes, overwrite):
-                count += 1
-                target_note.write_to_file()
+        writer = writer or NoteWriter()
+        counts_before = (writer.notes_updated, writer.files_written, writer.bytes_written)
 
-        for orphan in self.orphans:
-            # Remove previous backlinks from orphans
-            if orphan.update_backlinks([], overwrite):
-                count += 1
-                orphan.write_to_file()
+        with self.__phase("update_backlinks_sections"):
+            if uris is not None:
+                for uri in uris:
+                    note = self.notes.get(uri)
+                    linking_notes = self.backlinks.get(uri, [])
+                    # Like below, only notes with an ID have their backlinks removed
+                    if note and (linking_notes or note.get_id()):
+                        writer.update_backlinks(note, linking_notes, overwrite)
+            else:
+                for backlink in self.backlinks:
+                    if backlink not in self.notes:
+                        # Broken link, no target to update
+                        continue
 
-        return count
+                    target_note = self.notes[backlink]
+                    linking_notes = self.backlinks[backlink]
+                    writer.update_backlinks(target_note, linking_notes, overwrite)
+
+                for orphan in self.orphans:
+                    # Remove previous backlinks from orphans
+                    writer.update_backlinks(orphan, [], overwrite)
+
+            writer.wait()
+
+        self.__count("notes_updated", writer.notes_updated - counts_before[0])
+        self.__count("files_written", writer.files_written - counts_before[1])
+        self.__count("bytes_written", writer.bytes_written - counts_before[2])
+        return writer.notes_updated - counts_before[0]
+
+
+class SpliceJournal:
+    """Log of the backlinks sections being spliced into note files
+
+    Before the end of a file is replaced, the old and new bytes are appended to the
+    journal. If a run is interrupted, the next run completes the replacements that
+    had started, and the journal is removed when no replacement is in progress."""
+
+    FILENAME = ".katalorg-journal"
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__active = 0
+
+    @staticmethod
+    def open_for(directory: str) -> "SpliceJournal":
+        """Open the journal in the root of a notes directory, and recover from an interrupted run"""
+
+        journal = SpliceJournal(os.path.join(directory, SpliceJournal.FILENAME))
+        journal.recover()
+        return journal
+
+    def begin(self, path: str, offset: int, old: bytes, new: bytes, fsync: bool = False) -> None:
+        entry = {"path": os.path.abspath(path), "offset": offset,
+                 "old": base64.b64encode(old).decode("ascii"), "new": base64.b64encode(new).decode("ascii")}
+        with self.__lock:
+            if self.__file is None:
+                self.__file = open(self.__path, "a", encoding="utf-8")
+            self.__file.write(json.dumps(entry) + "\n")
+            self.__file.flush()
+            if fsync:
+                os.fsync(self.__file.fileno())
+            self.__active += 1
+
+    def end(self) -> None:
+        with self.__lock:
+            self.__active -= 1
+
+    def clear(self) -> None:
+        """Remove the journal, unless a replacement is in progress"""
+
+        with self.__lock:
+            if self.__file is not None and self.__active == 0:
+                self.__file.close()
+                self.__file = None
+                os.remove(self.__path)
+
+    def close(self) -> None:
+        """Close the journal, and remove it unless a replacement is in progress"""
+
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+                if self.__active == 0:
+                    os.remove(self.__path)
+
+    def recover(self) -> list[str]:
+        """Complete the replacements in the journal, and remove it. Returns the paths of the files written.
+
+        A file is only written if its end is still a mix of the old and new bytes,
+        i.e. it hasn't been changed since the replacement was interrupted."""
+
+        try:
+            with open(self.__path, "r", encoding="utf-8") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+        # Only the last replacement of each file matters
+        entries = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                entries[entry["path"]] = (entry["offset"], base64.b64decode(entry["old"]),
+                                          base64.b64decode(entry["new"]))
+            except (ValueError, KeyError):
+                # The last line may be incomplete, and then the file wasn't touched
+                continue
+
+        recovered = []
+        for (path, (offset, old, new)) in entries.items():
+            try:
+                with open(path, "r+b") as file:
+                    file.seek(offset)
+                    tail = file.read()
+                    if tail != new and SpliceJournal.__is_mixed(tail, old, new):
+                        file.seek(offset)
+                        file.write(new)
+                        file.truncate()
+                        file.flush()
+                        os.fsync(file.fileno())
+                        recovered.append(path)
+            except FileNotFoundError:
+                continue
+
+        os.remove(self.__path)
+        return recovered
+
+    @staticmethod
+    def __is_mixed(tail: bytes, old: bytes, new: bytes) -> bool:
+        # Each byte is from the old or the new end, or a zero where the file was extended
+        if len(tail) > max(len(old), len(new)):
+            return False
+        for (i, byte) in enumerate(tail):
+            if not ((i < len(new) and byte == new[i]) or (i < len(old) and byte == old[i]) or
+                    (i >= len(old) and byte == 0)):
+                return False
+        return True
+
+
+class NoteWriter:
+    """Updates and writes backlinks sections, in a number of threads
+
+    Counts updated notes, and how many files and bytes were actually written,
+    since files that already have the new content are not written."""
+
+    def __init__(self, jobs: int = 1, fsync: bool = False, dry_run: bool = False,
+                 journal: Optional[SpliceJournal] = None):
+        """With fsync, each file and its directory are flushed to disk before the writer is done.
+        With dry run, notes are updated in memory but never written. With a journal, only
+        the backlinks sections are rewritten, where possible."""
+
+        self.notes_updated = 0
+        self.files_written = 0
+        self.bytes_written = 0
+        # Paths of the files actually written
+        self.written_paths: list[str] = []
+
+        self.__fsync = fsync
+        self.__dry_run = dry_run
+        self.__journal = journal
+        self.__lock = threading.Lock()
+        self.__pool = concurrent.futures.ThreadPoolExecutor(jobs) if jobs > 1 else None
+        # Limits the number of notes waiting to be written, and their content in memory
+        self.__slots = threading.BoundedSemaphore(jobs * 4)
+        self.__futures: list[concurrent.futures.Future] = []
+        self.__directories: set[str] = set()
+
+    def update_backlinks(self, note: Note, linking_notes: list[Note], overwrite: bool = False) -> None:
+        self.set_backlinks(note, list(map(lambda n: n.create_link_to(), linking_notes)), overwrite)
+
+    def set_backlinks(self, note: Note, links: list[str], overwrite: bool = False) -> None:
+        if self.__pool:
+            self.__slots.acquire()
+            self.__futures.append(self.__pool.submit(self.__update, note, links, overwrite))
+        else:
+            self.__update(note, links, overwrite)
+
+    def __update(self, note: Note, links: list[str], overwrite: bool) -> None:
+        try:
+            if note.set_backlinks(links, overwrite):
+                size = 0 if self.__dry_run else note.write_to_file(self.__fsync, self.__journal)
+                with self.__lock:
+                    self.notes_updated += 1
+                    if size:
+                        self.files_written += 1
+                        self.bytes_written += size
+                        self.written_paths.append(note.get_path())
+                        self.__directories.add(os.path.dirname(note.get_path()))
+        finally:
+            if self.__pool:
+                self.__slots.release()
+
+    def wait(self) -> None:
+        """Wait until all notes have been written, and raise the first error, if any"""
+
+        (futures, self.__futures) = (self.__futures, [])
+        for future in futures:
+            future.result()
+
+        if self.__fsync and os.name == "posix":
+            # Make the file replacements durable
+            for directory in self.__directories:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        self.__directories.clear()
+        if self.__journal:
+            self.__journal.clear()
+
+    def close(self) -> None:
+        self.wait()
+        if self.__pool:
+            self.__pool.shutdown()
@@ -1,11 +1,8 @@
 import argparse
-import datetime
+import collections
 import os
 import os.path
-import random
-import re
 import sys
-from typing import Optional
 
 
 def main(args):
@@ -15,45 +12,44 @@ def main(args):
         sys.exit(1)
 
     parser = katalorg.NoteMarkdownParser()
-    def noteFactory(filename: str): return katalorg.Note(katalorg.NoteFile(filename), parser)
+    noteFactory = katalorg.NoteFactory(parser)
 
     collection = katalorg.NoteCollection()
     collection.import_files(args.path, args.extension, noteFactory)
 
-    changed_ids = []
+    renamer = katalorg.NoteRenamer(args.index, args.dry_run, parser)
+    renamer.rename(collection)
+    for file_name in renamer.skipped:
+        print(f"- Ignores file {file_name} without ID")
+    for (old_file_name, new_file_name) in renamer.renamed:
+        print(f"- {'Would rename' if args.dry_run else 'Renaming'} {old_file_name} --> {new_file_name}")
+    changed_ids = renamer.changed_ids
 
-    for note in collection.notes.values():
-        old_file_name = note.get_filename()
-        old_id = note.get_id()
-
-        # Don't rename index/outline notes
-        if old_file_name.startswith(args.index):
-            continue
-
-        if not old_id:
-            print(f"- Ignores file {old_file_name} without ID")
-            continue
-
-        title = strip_date_from_title(note.get_title())
+    if args.apply or args.dry_run:
+        replace_ids(collection, changed_ids, parser, args.dry_run)
+    else:
+        print_sed_replacements(changed_ids)
 
-        date = get_date_from_file_name(old_file_name)
-        if date is not None and len(date) < 14 and not old_id.startswith(date):
-            # Date in file name is shorter than an ID and doesn't match ID
-            new_id = suggest_id_from_date(date)
-            while new_id in collection.notes:
-                print("- Duplicate note id, generating again")
-                new_id = suggest_id_from_date(date)
 
-            note.set_id(new_id)
-            changed_ids.append((old_id, new_id))
+def replace_ids(collection, replacements: list, parser, dry_run: bool):
+    """Replace the changed IDs in all notes, in one pass over them"""
 
-        new_file_name = katalorg.NoteFile.escape_filename(f"{note.get_id()} {title}".strip()) + args.extension
+    if not replacements:
+        # Nothing renamed, no need to read the notes
+        return
 
-        if old_file_name != new_file_name:
-            print(f"- Renaming {old_file_name} --> {new_file_name}")
-            note.rename_file(new_file_name)
+    rewriter = katalorg.IdRewriter(dict(replacements), parser)
+    files = (katalorg.NoteFile(note.get_path()) for note in collection.notes.values())
+    total = collections.Counter()
+    file_count = 0
+    for (file, counts) in rewriter.rewrite_files(files, dry_run):
+        print(f"- {'Would replace' if dry_run else 'Replaced'} {sum(counts.values())} IDs in {file.get_name()}")
+        total.update(counts)
+        file_count += 1
 
-    print_sed_replacements(changed_ids)
+    for (old_id, new_id) in replacements:
+        print(f"- {old_id} --> {new_id}: {total[old_id]} times")
+    print(f"{'Would replace' if dry_run else 'Replaced'} {sum(total.values())} IDs in {file_count} files")
 
 
 def print_sed_replacements(replacements: list):
@@ -61,40 +57,14 @@ def print_sed_replacements(replacements: list):
         print(f"grep -FirlZ '{old_id}' | xargs -0 sed -i 's/{old_id}/{new_id}/g'")
 
 
-def suggest_id_from_date(date: str) -> str:
-    if len(date) == 4:
-        # Add month and day
-        date += "0101"
-    elif len(date) == 6:
-        # Add day
-        date += "01"
-
-    if len(date) != 8:
-        raise ValueError(f"Unknown date format: {date}")
-
-    ts = datetime.datetime.strptime(date, "%Y%m%d") + \
-        datetime.timedelta(seconds=random.randint(0, 86399))
-
-    return ts.strftime("%Y%m%d%H%M%S")
-
-
-def strip_date_from_title(title: str) -> str:
-    # Allow "x" in date strings
-    return re.sub(r"^[12]\d{3}[x\d]* ", "", title)
-
-
-def get_date_from_file_name(file_name: str) -> Optional[str]:
-    match = re.match(r"^([12]\d{3}\d*)[ x]", file_name)
-    if match:
-        return match.group(1)
-    else:
-        return None
-
-
 def parse_args():
     parser = argparse.ArgumentParser(description="Rename Zettelkasten note files")
     parser.add_argument("path", nargs="?", default=os.getcwd())
     parser.add_argument("-e", "--extension", default=".md", help="file extension of note files")
+    parser.add_argument("-a", "--apply", action="store_true", default=False,
+                        help="replace changed IDs in all notes, instead of printing sed commands to do it")
+    parser.add_argument("-n", "--dry-run", action="store_true", default=False,
+                        help="report which files would be renamed and changed, without changing any")
     parser.add_argument("-i", "--index", default="§", help="prefix for index files, not to be renamed")
     return parser.parse_args()
 
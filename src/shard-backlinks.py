@@ -0,0 +1,120 @@
+import argparse
+import os
+import os.path
+import sys
+
+
+def main(args):
+    if args.command == "map":
+        map_shard(args)
+    elif args.command == "reduce":
+        reduce_shards(args)
+    else:
+        apply_updates(args)
+
+
+def map_shard(args):
+    path = os.path.abspath(args.path)
+    if not os.path.exists(path):
+        print(f"No such directory: '{path}'")
+        sys.exit(1)
+
+    noteFactory = katalorg.NoteFactory(compact=True)
+    index = None if args.no_cache else katalorg.NoteIndex.open_for(path)
+    ignore = katalorg.IgnorePatterns.for_directory(path, args.exclude)
+
+    collection = katalorg.NoteCollection()
+    collection.import_files(path, args.extension, noteFactory, index, args.jobs, ignore)
+    count = katalorg.write_shard(collection, path, args.shard)
+    if index:
+        index.save(collection.notes.values())
+        index.close()
+    print(f"Wrote {count} notes from {path} to {args.shard}")
+
+
+def reduce_shards(args):
+    try:
+        reduction = katalorg.ShardReduction(args.shards, args.overwrite)
+    except (OSError, katalorg.ShardError) as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Merged {reduction.note_count} notes and {reduction.link_count} links from {len(args.shards)} shards")
+    if reduction.duplicates:
+        print("\n## Duplicate URIs\n")
+        for (uri, locations) in sorted(reduction.duplicates.items()):
+            print(f"- {uri}: " + ", ".join(f"{note_path} ({shard})" for (shard, note_path) in locations))
+        print()
+
+    def print_written(path: str, count: int): print(f"- {count} notes to update in {path}")
+
+    reduction.write_updates(print_written)
+
+
+def apply_updates(args):
+    path = os.path.abspath(args.path)
+    if not os.path.exists(path):
+        print(f"No such directory: '{path}'")
+        sys.exit(1)
+
+    updates = args.updates
+    if not updates.endswith(".updates"):
+        # The shard file was given
+        updates = katalorg.get_updates_path(updates)
+
+    journal = katalorg.SpliceJournal.open_for(path) if not args.dry_run else None
+    writer = katalorg.NoteWriter(args.write_jobs, args.fsync, args.dry_run, journal)
+    try:
+        updated = katalorg.apply_shard_updates(updates, path, katalorg.NoteFactory(compact=True), writer,
+                                               args.overwrite)
+    except (OSError, katalorg.ShardError) as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        writer.close()
+        if journal:
+            journal.close()
+    print(f"Updated backlinks in {updated} files")
+    print(f"Wrote {writer.files_written} files, {writer.bytes_written} bytes")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Add backlinks to notes split into shards, e.g. directories on different hosts: "
+                    "map each shard to a shard file, reduce all shard files, then apply the updates to each shard")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    map_parser = commands.add_parser("map", help="write the notes of a directory to a shard file")
+    map_parser.add_argument("path", help="root directory of the shard")
+    map_parser.add_argument("shard", help="shard file to write, e.g. laptop.jsonl")
+    map_parser.add_argument("-e", "--extension", nargs="+", default=[".md"], help="file extension(s) of note files")
+    map_parser.add_argument("-x", "--exclude", action="append", default=[], metavar="PATTERN",
+                            help="ignore files and directories matching the pattern, in addition to those in "
+                                 f"{katalorg.IgnorePatterns.FILENAME}")
+    map_parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes to parse notes in")
+    map_parser.add_argument("--no-cache", action="store_true", default=False,
+                            help="read and parse all notes, without using or updating the index")
+
+    reduce_parser = commands.add_parser(
+        "reduce", help="find the backlinks in all shard files, and write the updates of each shard next to its file")
+    reduce_parser.add_argument("shards", nargs="+", help="shard files, in the order to list backlinks in")
+    reduce_parser.add_argument("-o", "--overwrite", action="store_true",
+                               help="update all backlinks sections, even if the same")
+
+    apply_parser = commands.add_parser("apply", help="update the backlinks sections of a shard")
+    apply_parser.add_argument("path", help="root directory of the shard")
+    apply_parser.add_argument("updates", help="updates file written by reduce, or the shard file")
+    apply_parser.add_argument("-o", "--overwrite", action="store_true",
+                              help="overwrite existing backlinks, even if the same")
+    apply_parser.add_argument("-n", "--dry-run", action="store_true", default=False,
+                              help="report how many notes would be updated, without writing any files")
+    apply_parser.add_argument("--write-jobs", type=int, default=1, help="number of threads to write notes in")
+    apply_parser.add_argument("--fsync", action="store_true", default=False, help="flush written notes to disk")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import katalorg
+
+    main(parse_args())
@@ -1,11 +1,28 @@
+import concurrent.futures
+import contextlib
+import datetime
+import importlib
+import io
+import json
 import sys
 import os.path
+import shutil
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import threading
 import unittest
 
 
 BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 
 
+def read_file(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
 class TestStringMethods(unittest.TestCase):
 
     def test_get_links(self):
@@ -44,6 +61,924 @@ class TestStringMethods(unittest.TestCase):
         for i in range(len(expected_backlinks)):
             self.assertEqual(expected_backlinks[i], links[i])
 
+    def test_scan(self):
+        parser = katalorg.NoteMarkdownParser()
+        for name in ["BackLinks.md", "Links.md"]:
+            note_contents = katalorg.NoteFile(os.path.join(BASE_DIRECTORY, "testdata", name)).read()
+            content = parser.remove_backlinks(note_contents)
+
+            scan = parser.scan(note_contents)
+            self.assertEqual(len(content), scan.backlinks_start)
+            self.assertEqual(parser.get_note_title(content), scan.title)
+            self.assertEqual(parser.get_note_id(content), scan.id)
+            self.assertEqual(parser.get_note_links(content), scan.links)
+            self.assertEqual(parser.get_backlinks(note_contents), scan.backlinks)
+
+        scan = parser.scan("# Title\r\n20201012145848\r\n---\r\n\r\n**BACKLINKS**\r\n* [[Link]]\r\n")
+        self.assertEqual("Title\r", scan.title)
+        self.assertEqual("20201012145848", scan.id)
+        self.assertEqual(23, scan.backlinks_start)
+        self.assertEqual(["[[Link]]\r"], scan.backlinks)
+
+    def test_scan_bytes(self):
+        parser = katalorg.NoteMarkdownParser()
+        texts = [katalorg.NoteFile(os.path.join(BASE_DIRECTORY, "testdata", name)).read()
+                 for name in ["BackLinks.md", "Links.md"]]
+        texts.append("# Café\n\n[[20201012145848]] ٢0201012145848\n\n---\n**LİNKS TO THIS NOTE**\n- [[Link]] Åsa")
+        for text in texts:
+            expected = parser.scan(text)
+            scan = parser.scan_bytes(text.encode("utf-8"))
+            self.assertEqual((expected.title, expected.id, expected.links, expected.backlinks_start,
+                              expected.backlinks),
+                             (scan.title, scan.id, scan.links, scan.backlinks_start, scan.backlinks))
+
+        # Carriage returns are newlines when reading text
+        self.assertIsNone(parser.scan_bytes(b"# Title\r\n"))
+
+    def test_rewrite_ids(self):
+        rewriter = katalorg.IdRewriter({
+            "20200101120000": "20210101120000",
+            "20210101120000": "20200101120000",
+            "Old Note": "20220101000000",
+        })
+        (text, counts) = rewriter.rewrite(
+            "20200101120000\n\n[[20210101120000]] x20200101120000 [[Old Note]] Old Note [[Old Notes]]")
+        self.assertEqual(
+            "20210101120000\n\n[[20200101120000]] x20200101120000 [[20220101000000]] Old Note [[Old Notes]]", text)
+        self.assertEqual({"20200101120000": 1, "20210101120000": 1, "Old Note": 1}, counts)
+
+        self.assertEqual("(?:a(?:b(?:c)?|d)|e\\.)", katalorg.RegEx.any_of(["ab", "abc", "ad", "e."]))
+
+        # Only links, not IDs on their own
+        rewriter = katalorg.IdRewriter({"20200101120000": "20210101120000"}, links_only=True)
+        (text, counts) = rewriter.rewrite("20200101120000\n\n[[20200101120000]]")
+        self.assertEqual("20200101120000\n\n[[20210101120000]]", text)
+
+    def test_generate_ids(self):
+        taken = {f"2021010112{minute:02}{second:02}" for minute in range(60) for second in range(0, 60, 2)}
+        taken.add("Not an ID")
+        ids = katalorg.generate_ids("2021010112", 100, taken)
+        self.assertEqual(100, len(set(ids)))
+        for id in ids:
+            self.assertNotIn(id, taken)
+            self.assertEqual(id, datetime.datetime.strptime(id, "%Y%m%d%H%M%S").strftime("%Y%m%d%H%M%S"))
+
+        # Date prefixes of 8, 10 and 12 digits leave a day, an hour and a minute of times
+        for (date, span) in [("20210101", 24 * 60 * 60), ("2021010112", 60 * 60), ("202101011230", 60)]:
+            (id,) = katalorg.generate_ids(date, 1, set())
+            self.assertEqual(14, len(id))
+            self.assertTrue(id.startswith(date))
+            self.assertEqual(span, len(katalorg.generate_ids(date, span, set())))
+            with self.assertRaises(ValueError):
+                katalorg.generate_ids(date, span + 1, set())
+
+        # The last free time of a minute, then none
+        taken = {f"202101011230{second:02}" for second in range(59)}
+        self.assertEqual(["20210101123059"], katalorg.generate_ids("202101011230", 1, taken))
+        with self.assertRaises(ValueError):
+            katalorg.generate_ids("202101011230", 2, taken)
+        with self.assertRaises(ValueError):
+            katalorg.generate_ids("202101011", 1, set())
+
+        self.assertEqual(0, katalorg.time_to_offset("000000"))
+        self.assertEqual(12 * 3600 + 34 * 60 + 56, katalorg.time_to_offset("123456"))
+        self.assertEqual(34 * 60 + 56, katalorg.time_to_offset("3456"))
+        self.assertEqual(59, katalorg.time_to_offset("59"))
+        for time in ["60", "6000", "240000", "12345x"]:
+            self.assertIsNone(katalorg.time_to_offset(time))
+        for (digits, span) in [(2, 60), (4, 60 * 60), (6, 24 * 60 * 60)]:
+            for offset in [0, 1, 59, span - 1]:
+                self.assertEqual(offset, katalorg.time_to_offset(katalorg.offset_to_time(offset, digits)))
+        self.assertEqual("123456", katalorg.offset_to_time(12 * 3600 + 34 * 60 + 56, 6))
+
+    def test_suggest_links(self):
+        index = katalorg.TrigramIndex()
+        index.add("Zettelkasten Method", "1")
+        index.add("Zettelkasten", "2")
+        index.add("Something Else", "3")
+        self.assertEqual([("1", 1.0)], index.search("zettelkasten method", limit=1))
+        found = index.search("Zettelkasten Metod")
+        self.assertEqual(["1", "2"], [uri for (uri, score) in found])
+        self.assertAlmostEqual(katalorg.TrigramIndex.similarity("Zettelkasten Metod", "Zettelkasten Method"),
+                               found[0][1])
+        self.assertEqual([], index.search("Unrelated"))
+
+        typos = katalorg.find_typos("123", "0123456789")
+        self.assertIn("124", typos)
+        self.assertIn("132", typos)
+        self.assertIn("1234", typos)
+        self.assertIn("12", typos)
+        self.assertNotIn("123", typos)
+
+        self.assertEqual({"a": "1"}, katalorg.choose_fixes({
+            "a": [("1", 0.95), ("2", 0.5)],
+            "b": [("1", 0.95), ("2", 0.95)],
+            "c": [("3", 0.5)],
+            "d": [],
+        }, 0.9))
+
+    def test_pathological_notes(self):
+        """The scanner gives the same result as the separate regexes on notes that are hard to parse,
+        and any parsing of them finishes. See benchmarks/pathological.py for how the time scales."""
+
+        parser = katalorg.NoteMarkdownParser()
+        signature_parser = katalorg.NoteMarkdownParser(signatures=True)
+        rewriter = katalorg.IdRewriter({"20200101120000": "20210101120000", "Old Note": "20220101000000"})
+        functions = [
+            parser.scan,
+            lambda text: parser.scan_bytes(text.encode("utf-8")),
+            signature_parser.scan,
+            parser.get_note_links,
+            parser.remove_backlinks,
+            rewriter.rewrite,
+        ]
+
+        directory = os.path.join(BASE_DIRECTORY, "testdata", "pathological")
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), "r", encoding="utf-8", newline="") as file:
+                text = file.read()
+
+            scan = parser.scan(text)
+            content = parser.remove_backlinks(text)
+            self.assertEqual((parser.get_note_title(content), parser.get_note_id(content),
+                              parser.get_note_links(content), parser.get_backlinks(text)),
+                             (scan.title, scan.id, scan.links, scan.backlinks), name)
+            bytes_scan = parser.scan_bytes(text.encode("utf-8"))
+            if bytes_scan:
+                self.assertEqual((scan.title, scan.id, scan.links, scan.backlinks_start, scan.backlinks),
+                                 (bytes_scan.title, bytes_scan.id, bytes_scan.links, bytes_scan.backlinks_start,
+                                  bytes_scan.backlinks), name)
+
+            long_text = text * -(-80000 // len(text))
+            for function in functions:
+                function(long_text)
+
+
+class TestImportFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in ["BackLinks.md", "Links.md"]:
+            shutil.copy(os.path.join(BASE_DIRECTORY, "testdata", name), self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def import_notes(self, index, jobs=1):
+        collection = katalorg.NoteCollection()
+        collection.import_files(self.directory, ".md", katalorg.NoteFactory(), index, jobs)
+        return collection
+
+    def test_unchanged_notes_are_cached(self):
+        index = katalorg.NoteIndex.open_for(self.directory)
+        parsed = self.import_notes(index)
+        index.save(parsed.notes.values())
+        index.close()
+
+        index = katalorg.NoteIndex.open_for(self.directory)
+        cached = self.import_notes(index)
+        for uri, note in parsed.notes.items():
+            self.assertEqual(note.get_record(), index.lookup(note.get_path()))
+            self.assertEqual(note.get_record(), cached.notes[uri].get_record())
+
+        path = os.path.join(self.directory, "Links.md")
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("\n[[New Link]]\n")
+        self.assertIsNone(index.lookup(path))
+        # Removed since it was found
+        os.remove(os.path.join(self.directory, "BackLinks.md"))
+        self.assertIsNone(index.lookup(os.path.join(self.directory, "BackLinks.md")))
+        index.close()
+
+        index = katalorg.NoteIndex.open_for(self.directory, rebuild=True)
+        self.assertIsNone(index.lookup(os.path.join(self.directory, "BackLinks.md")))
+        index.close()
+
+    def test_parallel_import(self):
+        serial = self.import_notes(None)
+        parallel = self.import_notes(None, jobs=2)
+        self.assertEqual(serial.notes.keys(), parallel.notes.keys())
+        for uri, note in serial.notes.items():
+            self.assertEqual(note.get_record(), parallel.notes[uri].get_record())
+
+        # Same URI as BackLinks.md
+        os.mkdir(os.path.join(self.directory, "sub"))
+        shutil.copy(os.path.join(self.directory, "BackLinks.md"), os.path.join(self.directory, "sub"))
+        with self.assertRaises(IndexError):
+            self.import_notes(None, jobs=2)
+
+    def test_streaming_import(self):
+        for i in range(20):
+            shutil.copy(os.path.join(self.directory, "BackLinks.md"), os.path.join(self.directory, f"Note {i}.md"))
+        serial = self.import_notes(None)
+
+        index = katalorg.NoteIndex.open_for(self.directory)
+        index.save(list(serial.notes.values())[:10])
+        for jobs in [1, 2]:
+            progress = []
+            collection = katalorg.NoteCollection()
+            collection.import_files(self.directory, ".md", katalorg.NoteFactory(), index, jobs, read_jobs=4,
+                                    progress=lambda count, path: progress.append(count))
+            self.assertEqual(list(range(1, 23)), progress)
+            self.assertEqual(serial.notes.keys(), collection.notes.keys())
+            for uri, note in serial.notes.items():
+                self.assertEqual(note.get_record(), collection.notes[uri].get_record())
+        index.close()
+
+        cancel = threading.Event()
+        collection = katalorg.NoteCollection()
+        with self.assertRaises(concurrent.futures.CancelledError):
+            collection.import_files(self.directory, ".md", katalorg.NoteFactory(), read_jobs=4, cancel=cancel,
+                                    progress=lambda count, path: count == 5 and cancel.set())
+        self.assertEqual(5, len(collection.notes))
+
+    def test_find_note_files(self):
+        for directory in [".git", "node_modules", "Attachments", "Notes"]:
+            os.mkdir(os.path.join(self.directory, directory))
+            shutil.copy(os.path.join(self.directory, "Links.md"), os.path.join(self.directory, directory))
+        shutil.copy(os.path.join(self.directory, "Links.md"), os.path.join(self.directory, "Notes", "Links.txt"))
+        with open(os.path.join(self.directory, katalorg.IgnorePatterns.FILENAME), "w") as file:
+            file.write("# Comment\nAttachments/\nNotes/Links.md\n")
+
+        def find(**kwargs):
+            return sorted(os.path.relpath(p, self.directory) for p in katalorg.find_note_files(self.directory, **kwargs))
+
+        self.assertEqual(["BackLinks.md", "Links.md", os.path.join("Notes", "Links.txt")],
+                         find(extension=[".md", ".txt"]))
+        ignore = katalorg.IgnorePatterns.for_directory(self.directory, ["Back*"])
+        self.assertEqual(["Links.md"], find(extension=".md", ignore=ignore))
+
+        # Links to files are followed, links to directories only when asked to
+        os.symlink(os.path.join(self.directory, "Notes", "Links.txt"), os.path.join(self.directory, "Linked.md"))
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        shutil.copy(os.path.join(self.directory, "Links.md"), os.path.join(outside, "Links.txt"))
+        os.symlink(outside, os.path.join(self.directory, "Linked"))
+        self.assertEqual(["BackLinks.md", "Linked.md", "Links.md"], find(extension=".md"))
+        self.assertIn(os.path.join("Linked", "Links.txt"), find(extension=".txt", follow_symlinks=True))
+        self.assertNotIn(os.path.join("Linked", "Links.txt"), find(extension=".txt"))
+
+    def test_find_note_ids(self):
+        with open(os.path.join(self.directory, "20200101120000 Note.md"), "w", encoding="utf-8") as file:
+            file.write("# Note\n20210101120000\n\n[[20220101120000]]\n")
+
+        expected = {"20200101120000", "20210101120000"}
+        self.assertEqual(expected, katalorg.find_note_ids(self.directory, ".md"))
+
+        index = katalorg.NoteIndex.open_for(self.directory)
+        index.save(self.import_notes(None).notes.values())
+        # URIs of notes without ID are in the index, which doesn't matter when checking for collisions
+        self.assertEqual(expected | {"BackLinks", "Links"}, katalorg.find_note_ids(self.directory, ".md", index=index))
+        index.close()
+
+        # Read only, an index of another version is not used, and left as it is
+        index = katalorg.NoteIndex.open_existing(self.directory)
+        self.assertEqual(3, index.get_note_count())
+        index.close()
+        path = os.path.join(self.directory, katalorg.NoteIndex.DEFAULT_FILENAME)
+        with contextlib.closing(sqlite3.connect(path)) as connection, connection:
+            connection.execute("UPDATE meta SET value = 'old' WHERE key = 'version'")
+        index = katalorg.NoteIndex.open_existing(self.directory)
+        self.assertEqual(0, index.get_note_count())
+        self.assertEqual([], list(index.records()))
+        index.mark_changed([os.path.join(self.directory, "Links.md")])
+        self.assertEqual(expected, katalorg.find_note_ids(self.directory, ".md", index=index))
+        index.close()
+        script = os.path.join(os.path.dirname(BASE_DIRECTORY), "src", "generate-id.py")
+        subprocess.run([sys.executable, script, self.directory, "-d", "20200101"], check=True, stdout=subprocess.DEVNULL)
+        with contextlib.closing(sqlite3.connect(path)) as connection:
+            self.assertEqual(("old",), connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone())
+            self.assertEqual((3,), connection.execute("SELECT COUNT(*) FROM notes").fetchone())
+        self.assertIsNone(katalorg.NoteIndex.open_existing(os.path.join(self.directory, "Missing")))
+
+    def test_mmap_parse(self):
+        for path in katalorg.find_note_files(self.directory, ".md"):
+            self.assertEqual(katalorg.NoteFactory().parse(path), katalorg.NoteFactory(mmap_size=0).parse(path))
+
+    def test_compact_notes(self):
+        collection = katalorg.NoteCollection()
+        collection.import_files(self.directory, ".md", katalorg.NoteFactory(compact=True))
+        collection.find_backlinks()
+        collection.get_more_note_data()
+
+        # The orphan's old backlinks are removed, which requires reading the content again
+        self.assertEqual(1, collection.update_backlinks_sections())
+        content = katalorg.NoteFile(os.path.join(self.directory, "BackLinks.md")).read()
+        self.assertEqual("# Backlinks test case\n\nSome note text\n", content)
+
+    def test_note_writer(self):
+        watcher = katalorg.NoteWatcher(self.directory, ".md", use_inotify=False)
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+        collection.get_more_note_data()
+
+        writer = katalorg.NoteWriter(jobs=2, fsync=True)
+        self.assertEqual(1, collection.update_backlinks_sections(writer=writer))
+        self.assertEqual(1, writer.files_written)
+        self.assertEqual(len("# Backlinks test case\n\nSome note text\n"), writer.bytes_written)
+        self.assertEqual([os.path.join(self.directory, "BackLinks.md")], writer.written_paths)
+        # The written files are not changes to watch for
+        watcher.refresh(writer.written_paths)
+        self.assertEqual((set(), set()), watcher.poll(0))
+        watcher.close()
+
+        # Overwriting rewrites the sections, but the files already have that content
+        self.assertEqual(2, collection.update_backlinks_sections(overwrite=True, writer=writer))
+        writer.close()
+        self.assertEqual(1, writer.files_written)
+        self.assertEqual([], [name for name in os.listdir(self.directory) if name.endswith(".tmp")])
+
+    def test_write_symlinked_note(self):
+        target_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target_directory)
+        target = os.path.join(target_directory, "Target.md")
+        with open(target, "w", encoding="utf-8") as file:
+            file.write("# Target\n")
+        link = os.path.join(self.directory, "Link.md")
+        os.symlink(target, link)
+
+        self.assertGreater(katalorg.NoteFile(link).write("# Target\n\nNew text\n"), 0)
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual("# Target\n\nNew text\n", read_file(target))
+        self.assertEqual([], [name for name in os.listdir(target_directory) if name.endswith(".tmp")])
+
+    def test_splice_writes(self):
+        def write_backlinks(journal, compact):
+            collection = katalorg.NoteCollection()
+            collection.import_files(self.directory, ".md", katalorg.NoteFactory(compact=compact))
+            collection.find_backlinks()
+            collection.get_more_note_data()
+            writer = katalorg.NoteWriter(journal=journal)
+            collection.update_backlinks_sections(overwrite=True, writer=writer)
+            writer.close()
+            return {name: read_file(os.path.join(self.directory, name)) for name in ["BackLinks.md", "Links.md"]}
+
+        expected = write_backlinks(None, False)
+        path = os.path.join(self.directory, "BackLinks.md")
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("\n\n---\n**Links to this note**\n- [[Stale]]\n\n")
+
+        journal = katalorg.SpliceJournal.open_for(self.directory)
+        self.assertEqual(expected, write_backlinks(journal, True))
+        self.assertEqual(expected, write_backlinks(journal, False))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, katalorg.SpliceJournal.FILENAME)))
+
+        # Interrupted halfway through replacing the section
+        content = expected["BackLinks.md"].encode("utf-8")
+        offset = len(content) - 1
+        old = b"\n\n---\n**Links to this note**\n- [[Stale]]\n"
+        new = b"\n\n---\n**Links to this note**\n- [[New Link]]\n"
+        journal.begin(path, offset, old, new)
+        journal.close()
+        with open(path, "wb") as file:
+            file.write(content[:offset] + new[:40] + old[40:])
+        recovering = katalorg.SpliceJournal(os.path.join(self.directory, katalorg.SpliceJournal.FILENAME))
+        self.assertEqual([os.path.abspath(path)], recovering.recover())
+        self.assertEqual(content[:offset] + new, read_file(path).encode("utf-8"))
+
+    def test_collection_stats(self):
+        stats = katalorg.CollectionStats(slowest_count=1)
+        collection = katalorg.NoteCollection(stats)
+        collection.import_files(self.directory, ".md", katalorg.NoteFactory())
+        collection.find_backlinks()
+        collection.get_more_note_data()
+        collection.update_backlinks_sections(writer=katalorg.NoteWriter(dry_run=True))
+
+        self.assertEqual({"find_note_files", "import_files", "find_backlinks", "get_more_note_data",
+                          "update_backlinks_sections"}, set(stats.phases))
+        self.assertEqual(2, stats.counters["notes_parsed"])
+        self.assertEqual(7, stats.counters["links_found"])
+        self.assertEqual(1, stats.counters["notes_updated"])
+        self.assertEqual(0, stats.counters["files_written"])
+        self.assertEqual(1, len(stats.get_slowest_notes()))
+
+    def test_link_graph(self):
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+
+        expected = {}
+        for note in collection.notes.values():
+            for link in note.get_outgoing_links():
+                expected.setdefault(link, []).append(note)
+        self.assertEqual(expected, dict(collection.backlinks))
+
+        graph = collection.graph
+        self.assertEqual(2, graph.get_note_count())
+        self.assertEqual(7, graph.get_link_count())
+        broken = [uri for uri in expected if uri not in collection.notes]
+        self.assertEqual(2 + len(broken), graph.get_node_count())
+        self.assertEqual(len(expected), graph.get_target_count())
+        for uri in broken:
+            index = graph.get_index(uri)
+            self.assertIsNone(graph.get_note(index))
+            self.assertEqual(0, graph.out_degree(index))
+        self.assertEqual(sorted(broken), sorted(set(graph.find_broken_links())))
+
+    def test_graph_analytics(self):
+        for (name, links) in [("A", "B"), ("B", "C"), ("C", "A"), ("D", "A C"), ("E", "F"), ("F", "E Missing")]:
+            with open(os.path.join(self.directory, name + ".md"), "w", encoding="utf-8") as file:
+                file.write(f"# Note {name}\n" + " ".join(f"[[{link}]]" for link in links.split()) + "\n")
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+        graph = collection.graph
+
+        analytics = katalorg.GraphAnalytics(graph, use_numpy=False)
+        self.assertEqual(7, analytics.get_link_count())
+        components = [{graph.get_uri(i) for i in component} for component in analytics.find_components()]
+        self.assertEqual([{"A", "B", "C", "D"}, {"E", "F"}], components[:2])
+        self.assertEqual(4, len(components))
+
+        ranks = analytics.pagerank()
+        self.assertAlmostEqual(1.0, sum(ranks))
+        self.assertEqual(["A", "C"], [graph.get_uri(i) for (i, _) in katalorg.top_scores(ranks, 2)])
+        # E and F only link to each other
+        self.assertAlmostEqual(ranks[graph.get_index("E")], ranks[graph.get_index("F")])
+        (hubs, authorities) = analytics.hits()
+        self.assertEqual("D", graph.get_uri(katalorg.top_scores(hubs, 1)[0][0]))
+        self.assertEqual("A", graph.get_uri(katalorg.top_scores(authorities, 1)[0][0]))
+        self.assertEqual(0.0, authorities[graph.get_index("D")])
+
+        fast = katalorg.GraphAnalytics(graph)
+        if fast.uses_numpy():
+            self.assertEqual(analytics.find_components(), fast.find_components())
+            for (expected, actual) in [(ranks, fast.pagerank()), (hubs, fast.hits()[0])]:
+                for (x, y) in zip(expected, actual):
+                    self.assertAlmostEqual(x, y)
+
+        empty = katalorg.NoteCollection()
+        empty.notes = {}
+        empty.find_backlinks()
+        self.assertEqual(([], [], ([], [])), (katalorg.GraphAnalytics(empty.graph).find_components(),
+                                               katalorg.GraphAnalytics(empty.graph).pagerank(),
+                                               katalorg.GraphAnalytics(empty.graph).hits()))
+
+    def test_related_notes(self):
+        words = [f"word{i}" for i in range(200)]
+        texts = {
+            "A": " ".join(words),
+            # Almost the same as A
+            "B": " ".join(words[:190] + ["other"] * 10),
+            # The same as A, but linked from it
+            "C": " ".join(words),
+            "D": " ".join(reversed(words)),
+        }
+        for (name, text) in texts.items():
+            with open(os.path.join(self.directory, name + ".md"), "w", encoding="utf-8") as file:
+                file.write(f"# Note {name}\n{text}\n" + ("[[C]]\n" if name == "A" else ""))
+
+        index = katalorg.NoteIndex.open_for(self.directory, signatures=True)
+        collection = katalorg.NoteCollection()
+        collection.import_files(self.directory, ".md", katalorg.NoteFactory(katalorg.NoteMarkdownParser(
+            signatures=True)), index)
+        index.save(collection.notes.values())
+        related = [tuple(sorted((a.get_uri(), b.get_uri()))) for (a, b, _) in katalorg.find_related_notes(collection)]
+        self.assertEqual([("A", "B"), ("B", "C")], related)
+
+        signature = collection.notes["A"].get_signature()
+        self.assertEqual(katalorg.SIGNATURE_SIZE * 4, len(signature))
+        self.assertEqual(signature, katalorg.minhash(read_file(os.path.join(self.directory, "A.md")).lower().encode()))
+        self.assertGreater(katalorg.estimate_similarity(signature, katalorg.minhash(texts["C"].encode())), 0.9)
+        self.assertLess(katalorg.estimate_similarity(signature, collection.notes["D"].get_signature()), 0.2)
+        self.assertEqual(b"", katalorg.minhash(b"two words"))
+        # Short texts have empty bins, which are filled from the others
+        self.assertEqual(katalorg.minhash(b"one two three four"), katalorg.minhash(b"one two three four"))
+        self.assertEqual(katalorg.SIGNATURE_SIZE * 4, len(katalorg.minhash(b"one two three four")))
+        index.close()
+
+        # Notes indexed without signatures are parsed again
+        index = katalorg.NoteIndex.open_for(self.directory)
+        path = os.path.join(self.directory, "A.md")
+        self.assertEqual(signature, index.lookup(path).signature)
+        index.save([katalorg.NoteFactory()(path) if note.get_path() == path else note
+                    for note in collection.notes.values()])
+        index.close()
+        index = katalorg.NoteIndex.open_for(self.directory, signatures=True)
+        self.assertIsNone(index.lookup(path))
+        self.assertIsNotNone(index.lookup(os.path.join(self.directory, "B.md")))
+        index.close()
+
+    def test_export_graph(self):
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+        graph = collection.graph
+
+        for format in katalorg.EXPORT_FORMATS:
+            output = io.StringIO()
+            self.assertEqual((9, 7), katalorg.export_graph(graph, output, format))
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(9, sum(1 for line in lines if line["type"] == "node"))
+        self.assertIn({"type": "edge", "source": "Links", "target": "Filename Link"}, lines)
+
+        nodes = katalorg.find_neighbourhood(graph, "Filename Link", hops=1)
+        self.assertEqual({graph.get_index("Filename Link"), graph.get_index("Links")}, nodes)
+        self.assertEqual((2, 1), katalorg.export_graph(graph, io.StringIO(), "dot", nodes))
+        # All links from Links.md, but not the unlinked BackLinks.md
+        self.assertEqual(8, len(katalorg.find_neighbourhood(graph, "Filename Link", hops=2)))
+        self.assertEqual(9, len(katalorg.find_directory_nodes(graph, self.directory)))
+        self.assertEqual(set(), katalorg.find_directory_nodes(graph, os.path.join(self.directory, "sub")))
+        self.assertEqual("graphml", katalorg.export_format_for("notes.GraphML"))
+
+        # An exporter must write both nodes and edges
+        class NodeExporter(katalorg.GraphExporter):
+            def node(self, index, uri, title, path):
+                pass
+
+        with self.assertRaises(TypeError):
+            NodeExporter(io.StringIO())
+
+    def test_suggest_broken_links(self):
+        for (name, text) in [("Zettelkasten Method.md", "# Zettelkasten Method\n"),
+                             ("Idea.md", "# Idea\n20200101120000\n[[Zettelkasten Metod]] [[20200101120001]]\n")]:
+            with open(os.path.join(self.directory, name), "w", encoding="utf-8") as file:
+                file.write(text)
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+        collection.get_more_note_data()
+
+        suggestions = katalorg.suggest_links(collection)
+        self.assertEqual("Zettelkasten Method", suggestions["Zettelkasten Metod"][0][0])
+        self.assertEqual(["20200101120000"], [uri for (uri, score) in suggestions["20200101120001"]])
+        self.assertEqual([], suggestions["Filename Link"])
+
+    def test_update_files(self):
+        def write(name, text):
+            with open(os.path.join(self.directory, name), "w", encoding="utf-8") as file:
+                file.write(text)
+            return os.path.join(self.directory, name)
+
+        target = write("Target.md", "# Target\n20200101120000\n")
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+
+        source = write("Source.md", "# Source\n[[20200101120000]]\n")
+        updated = collection.update_files([source], [], katalorg.NoteFactory())
+        self.assertEqual([target], [note.get_path() for note in updated])
+        parser = katalorg.NoteMarkdownParser()
+        self.assertEqual(["[[Source]]"], parser.get_backlinks(katalorg.NoteFile(target).read()))
+
+        # Unchanged links, nothing to update
+        write("Source.md", "# Source\nStill linking to [[20200101120000]]\n")
+        self.assertEqual([], collection.update_files([source], [], katalorg.NoteFactory()))
+
+        os.remove(source)
+        updated = collection.update_files([], [source], katalorg.NoteFactory())
+        self.assertEqual([target], [note.get_path() for note in updated])
+        self.assertEqual([], parser.get_backlinks(katalorg.NoteFile(target).read()))
+        self.assertNotIn("Source", collection.notes)
+        self.assertNotIn("20200101120000", collection.backlinks)
+
+        # The same sections as in a full run, which then has nothing left to update
+        collection.get_more_note_data()
+        collection.update_backlinks_sections()
+        untitled = write("Untitled.md", "# Untitled\n")
+        linker = write("Linker.md", "# Linker\n[[Untitled]]\n")
+        collection.update_files([untitled, linker], [], katalorg.NoteFactory())
+        self.assertEqual(["[[Linker]]"], parser.get_backlinks(read_file(untitled)))
+        os.remove(linker)
+        collection.update_files([], [linker], katalorg.NoteFactory())
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+        collection.get_more_note_data()
+        self.assertEqual(0, collection.update_backlinks_sections())
+
+    def test_watch_polling(self):
+        watcher = katalorg.NoteWatcher(self.directory, ".md", interval=0.01, use_inotify=False)
+        self.assertFalse(watcher.uses_inotify())
+        self.check_watcher(watcher)
+
+    def test_watch_inotify(self):
+        watcher = katalorg.NoteWatcher(self.directory, ".md")
+        if not watcher.uses_inotify():
+            watcher.close()
+            self.skipTest("inotify is not available")
+        self.check_watcher(watcher)
+
+    def test_watch_inotify_overflow(self):
+        try:
+            with open("/proc/sys/fs/inotify/max_queued_events") as file:
+                max_events = int(file.read())
+        except OSError:
+            self.skipTest("inotify is not available")
+        watcher = katalorg.NoteWatcher(self.directory, ".md")
+        try:
+            if not watcher.uses_inotify():
+                self.skipTest("inotify is not available")
+            # Each new note gives two events, so some of them are lost, but all notes are found
+            paths = {os.path.join(self.directory, f"{i}.md") for i in range(max_events // 2 + 100)}
+            for path in paths:
+                with open(path, "w") as file:
+                    file.write("# Note\n")
+            self.assertEqual((paths, set()), watcher.poll(5))
+        finally:
+            watcher.close()
+
+    def check_watcher(self, watcher):
+        def path(*names):
+            return os.path.join(self.directory, *names)
+
+        def write(name, text):
+            with open(path(name), "w", encoding="utf-8") as file:
+                file.write(text)
+
+        try:
+            self.assertEqual((set(), set()), watcher.poll(0.05))
+
+            write("New.md", "# New\n")
+            write("Other.txt", "Not a note\n")
+            self.assertEqual(({path("New.md")}, set()), watcher.poll(5))
+            write("New.md", "# New\n[[Links]]\n")
+            self.assertEqual(({path("New.md")}, set()), watcher.poll(5))
+            os.rename(path("New.md"), path("Renamed.md"))
+            self.assertEqual(({path("Renamed.md")}, {path("New.md")}), watcher.poll(5))
+            os.remove(path("Renamed.md"))
+            self.assertEqual((set(), {path("Renamed.md")}), watcher.poll(5))
+
+            # Notes in new and renamed subdirectories
+            os.makedirs(path("sub", "deeper"))
+            write(os.path.join("sub", "deeper", "Deep.md"), "# Deep\n")
+            self.assertEqual(({path("sub", "deeper", "Deep.md")}, set()), watcher.poll(5))
+            os.rename(path("sub"), path("moved"))
+            self.assertEqual(({path("moved", "deeper", "Deep.md")}, {path("sub", "deeper", "Deep.md")}),
+                             watcher.poll(5))
+            write(os.path.join("moved", "deeper", "Deep.md"), "# Deeper\n")
+            self.assertEqual(({path("moved", "deeper", "Deep.md")}, set()), watcher.poll(5))
+            shutil.rmtree(path("moved"))
+            self.assertEqual((set(), {path("moved", "deeper", "Deep.md")}), watcher.poll(5))
+
+            # Files written by ourselves are not reported
+            write("Links.md", "# Links\n")
+            watcher.refresh([path("Links.md")])
+            self.assertEqual((set(), set()), watcher.poll(0.2))
+        finally:
+            watcher.close()
+
+    def test_changed_notes(self):
+        index = katalorg.NoteIndex.open_for(self.directory)
+        collection = self.import_notes(index)
+        collection.find_backlinks()
+        collection.get_more_note_data()
+        collection.update_backlinks_sections()
+        index.save(collection.notes.values())
+
+        source = os.path.join(self.directory, "Source.md")
+        with open(source, "w", encoding="utf-8") as file:
+            file.write("# Source\n[[Links]]\n")
+
+        # The other notes are not read
+        collection = katalorg.NoteCollection()
+        collection.import_index(index, katalorg.NoteFactory())
+        index.mark_changed([source])
+        affected = collection.reload([source], katalorg.NoteFactory())
+        self.assertEqual({"Source", "Links"}, affected)
+        collection.find_backlinks()
+        self.assertEqual(1, collection.update_backlinks_sections(uris=affected))
+        parser = katalorg.NoteMarkdownParser()
+        self.assertEqual(["[[Source]]"], parser.get_backlinks(read_file(os.path.join(self.directory, "Links.md"))))
+        index.save(collection.notes.values())
+
+        os.remove(source)
+        collection = katalorg.NoteCollection()
+        collection.import_index(index, katalorg.NoteFactory())
+        affected = collection.reload([source], katalorg.NoteFactory())
+        self.assertNotIn("Source", collection.notes)
+        collection.find_backlinks()
+        collection.update_backlinks_sections(uris=affected)
+        self.assertEqual([], parser.get_backlinks(read_file(os.path.join(self.directory, "Links.md"))))
+        index.close()
+
+        ignore = katalorg.IgnorePatterns(["drafts/", "*.tmp.md"])
+        self.assertTrue(ignore.ignores_file("drafts/sub/Note.md"))
+        self.assertTrue(ignore.ignores_file("sub/Note.tmp.md"))
+        self.assertFalse(ignore.ignores_file("sub/Note.md"))
+
+    def test_changed_notes_order(self):
+        script = os.path.join(os.path.dirname(BASE_DIRECTORY), "src", "backlinkz.py")
+        os.mkdir(os.path.join(self.directory, "sub"))
+
+        def write(name, text):
+            with open(os.path.join(self.directory, name), "a", encoding="utf-8") as file:
+                file.write(text)
+            return os.path.join(self.directory, name)
+
+        def run(*args):
+            subprocess.run([sys.executable, script, self.directory, *args], check=True, stdout=subprocess.DEVNULL)
+
+        def read_notes():
+            return {name: read_file(os.path.join(self.directory, name))
+                    for name in katalorg.find_note_files(self.directory, ".md")}
+
+        write("Target.md", "# Target\n")
+        for name in ["A.md", "B.md", os.path.join("sub", "C.md"), "D.md"]:
+            write(name, f"# {os.path.basename(name)[:-3]}\n[[Target]]\n")
+        run()
+
+        # Changed notes are saved last in the index, and new notes come after the others
+        run("--changed", write("A.md", "More text\n"))
+        run("--changed", write("B.md", "More text\n"), write(os.path.join("sub", "0.md"), "# New\n[[Target]]\n"))
+        targeted = read_notes()
+
+        # The same files as after a full run, which has nothing left to write
+        run("--no-cache")
+        self.assertEqual(targeted, read_notes())
+        parser = katalorg.NoteMarkdownParser()
+        self.assertEqual(["[[A]]", "[[B]]", "[[D]]", "[[0]] New", "[[C]]"],
+                         parser.get_backlinks(read_file(os.path.join(self.directory, "Target.md"))))
+
+    def test_sharded_backlinks(self):
+        shards = [os.path.join(self.directory, name) for name in ["a", "b"]]
+        for shard in shards:
+            os.mkdir(shard)
+        for name in ["BackLinks.md", "Links.md"]:
+            shutil.move(os.path.join(self.directory, name), shards[0])
+        for (name, text) in [("Source.md", "# Source\n[[Links]]\n"), ("BackLinks.md", "# Duplicate\n")]:
+            with open(os.path.join(shards[1], name), "w", encoding="utf-8") as file:
+                file.write(text)
+
+        # Map each shard in a process of its own
+        script = os.path.join(os.path.dirname(BASE_DIRECTORY), "src", "shard-backlinks.py")
+        processes = [subprocess.Popen([sys.executable, script, "map", "--no-cache", shard, shard + ".jsonl"],
+                                      stdout=subprocess.DEVNULL) for shard in shards]
+        self.assertEqual([0, 0], [process.wait() for process in processes])
+
+        reduction = katalorg.ShardReduction([shard + ".jsonl" for shard in shards])
+        self.assertEqual(4, reduction.note_count)
+        self.assertEqual(["BackLinks"], list(reduction.duplicates))
+        self.assertEqual(["Links.md"], [path for (path, links) in reduction.updates[shards[0] + ".jsonl"]])
+        self.assertEqual([], reduction.updates[shards[1] + ".jsonl"])
+        reduction.write_updates()
+
+        updated = katalorg.apply_shard_updates(katalorg.get_updates_path(shards[0] + ".jsonl"), shards[0],
+                                               katalorg.NoteFactory())
+        self.assertEqual(1, updated)
+        parser = katalorg.NoteMarkdownParser()
+        self.assertEqual(["[[Source]]"], parser.get_backlinks(read_file(os.path.join(shards[0], "Links.md"))))
+
+        with self.assertRaises(katalorg.ShardError):
+            katalorg.ShardReduction([katalorg.get_updates_path(shards[0] + ".jsonl")])
+
+    def test_cli(self):
+        cli = importlib.import_module(katalorg.__name__ + ".cli")
+        with open(os.path.join(self.directory, "202003 Idea.md"), "w", encoding="utf-8") as file:
+            file.write("# Idea\n20200101120000\n")
+        with open(os.path.join(self.directory, "Source.md"), "w", encoding="utf-8") as file:
+            file.write("# Source\n[[20200101120000]]\n")
+
+        # A dry run changes nothing, but updates the same backlinks as the actual run, with the new IDs
+        names = sorted(os.listdir(self.directory))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cli.main(["-C", self.directory, "--no-cache", "-n", "rename", "backlinks"])
+        self.assertIn("Would update backlinks in 2 files", output.getvalue())
+        self.assertEqual(names, sorted(os.listdir(self.directory)))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cli.main(["-C", self.directory, "--no-cache", "rename", "backlinks", "report", "--format",
+                      "json"])
+        self.assertIn("Updated backlinks in 2 files", output.getvalue())
+        report = json.loads(output.getvalue()[output.getvalue().index("{"):])
+        self.assertEqual(4, report["notes"])
+
+        # The renamed note has a new ID, which the other notes link to
+        (renamed,) = [name for name in os.listdir(self.directory) if name.endswith(" Idea.md")]
+        new_id = renamed.split()[0]
+        self.assertTrue(new_id.startswith("20200301"))
+        self.assertIn(f"[[{new_id}]]", read_file(os.path.join(self.directory, "Source.md")))
+        parser = katalorg.NoteMarkdownParser()
+        self.assertEqual(["[[Source]]"], parser.get_backlinks(read_file(os.path.join(self.directory, renamed))))
+
+        self.assertEqual(([], [("id", ["-c", "2"]), ("report", [])]), cli.split_commands(["id", "-c", "2", "report"]))
+        # Option values are not commands
+        self.assertEqual((["--extension", "id", "-C", "rename"], [("rename", ["-i", "report"])]),
+                         cli.split_commands(["--extension", "id", "-C", "rename", "rename", "-i", "report"]))
+        self.assertEqual((["-e", ".md", ".txt", "-nC", "id", "--path=report"], [("report", []), ("id", [])]),
+                         cli.split_commands(["-e", ".md", ".txt", "-nC", "id", "--path=report", "report", "id"]))
+
+    def test_dry_run_index(self):
+        cli = importlib.import_module(katalorg.__name__ + ".cli")
+        script = os.path.join(os.path.dirname(BASE_DIRECTORY), "src", "backlinkz.py")
+        path = os.path.join(self.directory, katalorg.NoteIndex.DEFAULT_FILENAME)
+
+        def run(*args):
+            return subprocess.run([sys.executable, script, *args, self.directory], check=True,
+                                  stdout=subprocess.PIPE, encoding="utf-8").stdout
+
+        # No index is created in a dry run
+        self.assertIn("Would update backlinks in 1 files", run("-n"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.main(["-C", self.directory, "-n", "backlinks"])
+        self.assertFalse(os.path.exists(path))
+
+        # An existing index is used, but not changed
+        run()
+        with open(path, "rb") as file:
+            data = file.read()
+        os.remove(os.path.join(self.directory, "Links.md"))
+        run("-n")
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.main(["-C", self.directory, "-n", "backlinks"])
+        with open(path, "rb") as file:
+            self.assertEqual(data, file.read())
+
+    def test_rename_script(self):
+        with open(os.path.join(self.directory, "202003 Idea.md"), "w", encoding="utf-8") as file:
+            file.write("# Idea\n20200101120000\n")
+        with open(os.path.join(self.directory, "Source.md"), "w", encoding="utf-8") as file:
+            file.write("# Source\n[[20200101120000]]\n")
+        script = os.path.join(os.path.dirname(BASE_DIRECTORY), "src", "rename-files.py")
+
+        def run(*args):
+            return subprocess.run([sys.executable, script, *args, self.directory], check=True,
+                                  stdout=subprocess.PIPE, encoding="utf-8").stdout
+
+        # A dry run changes nothing
+        names = sorted(os.listdir(self.directory))
+        output = run("-n")
+        self.assertIn("- Would rename 202003 Idea.md --> 20200301", output)
+        self.assertIn("- Would replace 1 IDs in Source.md", output)
+        self.assertIn("Would replace 2 IDs in 2 files", output)
+        self.assertEqual(names, sorted(os.listdir(self.directory)))
+        self.assertEqual("# Source\n[[20200101120000]]\n", read_file(os.path.join(self.directory, "Source.md")))
+
+        output = run("--apply")
+        self.assertIn("- Renaming 202003 Idea.md --> 20200301", output)
+        self.assertIn("Replaced 2 IDs in 2 files", output)
+        (renamed,) = [name for name in os.listdir(self.directory) if name.endswith(" Idea.md")]
+        new_id = renamed.split()[0]
+        self.assertIn(f"[[{new_id}]]", read_file(os.path.join(self.directory, "Source.md")))
+        self.assertIn(new_id, read_file(os.path.join(self.directory, renamed)))
+
+        # Nothing left to rename or replace
+        output = run("--apply")
+        self.assertNotIn("Renaming", output)
+        self.assertNotIn("Replaced", output)
+
+    def test_query_service(self):
+        collection = self.import_notes(None)
+        collection.find_backlinks()
+        collection.get_more_note_data()
+        service = katalorg.NoteQueryService(collection)
+        server = katalorg.NoteQueryServer(service, "127.0.0.1:0")
+        server.start()
+
+        try:
+            with katalorg.NoteQueryClient(server.get_address()) as client:
+                self.assertEqual("pong", client.request("ping"))
+                self.assertEqual("Backlinks test case", client.note("BackLinks")["title"])
+                self.assertIsNone(client.note("Missing"))
+                self.assertEqual(["BackLinks"], [n["uri"] for n in client.title("BACKLINKS TEST CASE")])
+                self.assertEqual(["BackLinks"], [n["uri"] for n in client.search("back")])
+                self.assertEqual(2, len(client.search("")))
+                self.assertEqual(1, len(client.search("", limit=1)))
+                self.assertEqual(["Links"], [n["uri"] for n in client.backlinks("20210104073402")])
+                self.assertIn({"uri": "Filename Link", "title": None, "path": None}, client.links("Links"))
+                self.assertEqual(7, len(client.broken_links()))
+                self.assertEqual(2, len(client.orphans()))
+                with self.assertRaises(katalorg.QueryError):
+                    client.request("unknown")
+                with self.assertRaises(katalorg.QueryError):
+                    client.links("Missing")
+                # Arguments of the wrong type give errors, and the connection stays open
+                for (query, arguments) in [("search", {"prefix": 1}), ("search", {"prefix": "a", "limit": "2"}),
+                                           ("search", {"prefix": "a", "limit": True}), ("title", {"title": None}),
+                                           ("note", {"uri": ["Links"]}), ("search", {"prefix": "a", "limit": 0}),
+                                           ("note", {"uri": "Links", "other": 1})]:
+                    with self.assertRaises(katalorg.QueryError):
+                        client.request(query, **arguments)
+                self.assertEqual("pong", client.request("ping"))
+
+                path = os.path.join(self.directory, "Source.md")
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write("# Source\n[[Links]]\n")
+                service.update_files([path], [], katalorg.NoteFactory())
+                self.assertEqual(["Source"], [n["uri"] for n in client.backlinks("Links")])
+                self.assertEqual(["Source"], [n["uri"] for n in client.search("sou")])
+                self.assertEqual({"notes": 3, "orphans": 2, "broken_links": 7, "notes_without_id": 0},
+                                 client.stats())
+        finally:
+            server.close()
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets are not supported")
+    def test_query_socket_path(self):
+        service = katalorg.NoteQueryService(katalorg.NoteCollection())
+        path = os.path.join(self.directory, "Links.md")
+        with self.assertRaises(FileExistsError):
+            katalorg.NoteQueryServer(service, path)
+        self.assertTrue(os.path.isfile(path))
+
+        # A socket left from an earlier server is replaced
+        path = os.path.join(self.directory, "query.sock")
+        with socket.socket(socket.AF_UNIX) as stale:
+            stale.bind(path)
+        server = katalorg.NoteQueryServer(service, path)
+        server.start()
+        try:
+            with katalorg.NoteQueryClient(server.get_address()) as client:
+                self.assertEqual("pong", client.request("ping"))
+        finally:
+            server.close()
+        self.assertFalse(os.path.exists(path))
+
 
 if __name__ == '__main__':
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))